@@ -2,151 +2,576 @@
 
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-
-import boto3
+from itertools import chain
 
 from ecr_cleaner import config
-from ecr_cleaner.manager import ECRManager, ECSManager
-from ecr_cleaner.notifier import SlackNotifier
+from ecr_cleaner.helper import get_aws_client, shard_of
+from ecr_cleaner.manager import (
+    ECRManager,
+    ECSManager,
+    IncompleteInventoryError,
+    InventorySnapshot,
+)
+from ecr_cleaner.metrics import RunMetrics
+from ecr_cleaner.store import get_store
+
+from .checkpoint import RunCheckpoint
+from .evaluation import RepositoryEvaluation
+from .incremental import RepositoryStateCache
+from .plan import CleanupPlan
+from .prefilter import RepositoryFilter
+from .retention import RetentionPolicy
+
+INVENTORY_STORE_KEY = "ecs-inventory"
+
+GB = 1024**3
 
 
 class ECRCleaner:
 
-    def __init__(self, aws_region, slack_token):
+    def __init__(
+        self,
+        aws_region,
+        slack_token,
+        scan_workers=None,
+        overlap_discovery=None,
+        metrics=None,
+        session=None,
+        executor=None,
+        store_prefix="",
+        shard_index=None,
+        shard_count=1,
+        async_backend=None,
+    ):
         self.ecr_client = None
         self.ecs_client = None
         self.slack_token = slack_token
         self.aws_region = aws_region
+        self.scan_workers = max(1, scan_workers or config.SCAN_WORKERS)
+        self.overlap_discovery = (
+            config.OVERLAP_DISCOVERY if overlap_discovery is None else overlap_discovery
+        )
+        self.metrics = metrics or RunMetrics()
+        # clients are made from `session` when given, e.g. an assumed role in another account,
+        # and repository work goes to `executor` when it is shared with other cleaners
+        self.session = session
+        self.executor = executor
+        # keeps the state of cleaners sharing STATE_STORE apart, e.g. one per region
+        self.store_prefix = store_prefix
+        # a shard only scans the repositories whose name hashes to it, see sharding.shard_of
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        # ECS inventory computed elsewhere, e.g. once for every shard, discovery is skipped
+        self.in_use_images = None
+        # sink getting every image evaluated and its decision, see report.ReportSink
+        self.report = None
+        # repositories, clusters and delete batches as coroutines instead of worker threads
+        self.async_backend = (
+            config.ASYNC_BACKEND if async_backend is None else async_backend
+        )
 
         try:
             self.aws_client()
         except Exception as e:
             logging.error(f"Error: Failed to Get Credentials")
             raise e
-        self.ecr_manager = ECRManager(self.ecr_client)
-        self.ecs_manager = ECSManager(self.ecs_client)
+        self.metrics.attach(self.ecr_client)
+        self.metrics.attach(self.ecs_client)
+
+        if self.async_backend:
+            # asyncio is only imported by runs with the async backend
+            from ecr_cleaner.manager.aio import (
+                AsyncAPI,
+                AsyncECRManager,
+                AsyncECSManager,
+            )
 
-        self.slack_notifier = SlackNotifier(slack_token=self.slack_token)
+            # both managers share the threads that bound the calls in flight
+            api = AsyncAPI()
+            self.ecr_manager = AsyncECRManager(
+                self.ecr_client, metrics=self.metrics, api=api
+            )
+            self.ecs_manager = AsyncECSManager(
+                self.ecs_client, metrics=self.metrics, api=api
+            )
+        else:
+            self.ecr_manager = ECRManager(self.ecr_client, metrics=self.metrics)
+            self.ecs_manager = ECSManager(
+                self.ecs_client,
+                cluster_workers=config.ECS_CLUSTER_WORKERS,
+                metrics=self.metrics,
+            )
+
+        self._slack_notifier = None
 
-        self.now = datetime.now(timezone.utc)
+        self._start_run()
+
+    def _start_run(self, now=None):
+        self._plan = None
+        self.deadline = None
+        self.checkpoint = None
+        # what build_plan scanned, kept in the checkpoint when this run does not apply it
+        self._scan = None
+        # False when the run stopped before its deadline and left a checkpoint
+        self.plan_complete = True
+        self.completed = True
+        self.resuming_deletion = False
+
+        self.now = now or datetime.now(timezone.utc)
         self.keep_images_newer_than_days = self.now - timedelta(
             days=config.KEEP_IMAGES_NEWER_THAN_DAYS
         )
-
-    def aws_client(self):
-
-        if os.getenv("LAMBDA_TASK_ROOT") or os.getenv("RUN_TEST"):
-            self.ecr_client = boto3.client("ecr", region_name=self.aws_region)
-            self.ecs_client = boto3.client("ecs", region_name=self.aws_region)
-        else:
-            session = boto3.session.Session(
-                profile_name=os.getenv("AWS_PROFILE"), region_name=self.aws_region
+        self.retention_policy = RetentionPolicy(
+            keep_min_count=config.KEEP_MIN_IMAGE_COUNT,
+            keep_images_newer_than=self.keep_images_newer_than_days,
+        )
+        self.repository_filter = RepositoryFilter.from_config()
+
+        # size of every image to delete by digest, filled in as repositories are evaluated
+        self.image_sizes = {}
+
+        self.repository_state = None
+        if config.INCREMENTAL_SCAN:
+            self.repository_state = RepositoryStateCache(
+                store=get_store(config.STATE_STORE),
+                keep_min_count=config.KEEP_MIN_IMAGE_COUNT,
+                keep_images_for=timedelta(days=config.KEEP_IMAGES_NEWER_THAN_DAYS),
+                full_scan_interval=timedelta(hours=config.INCREMENTAL_FULL_SCAN_HOURS),
+                store_key=f"{self.store_prefix}{RepositoryStateCache.STORE_KEY}",
             )
-            self.ecr_client = session.client("ecr", region_name=self.aws_region)
-            self.ecs_client = session.client("ecs", region_name=self.aws_region)
-
-    @property
-    def images_to_delete(self):
 
-        running_task_images = self.ecs_manager.get_running_task_images()
-
-        ecr_images_to_delete = {}
+    def reset(self, now=None):
+        """
+        Starts a new run with the same clients, managers and task definition cache, e.g. on a
+        warm Lambda invocation. The clock, the plan, the metrics and the repository state are
+        fresh.
+        """
+        self.metrics = RunMetrics()
+        self.metrics.attach(self.ecr_client)
+        self.metrics.attach(self.ecs_client)
+        for component in (self.ecr_manager, self.ecs_manager, self._slack_notifier):
+            if component is not None:
+                component.metrics = self.metrics
+
+        self._start_run(now)
+
+    def set_time_budget(self, seconds):
+        """
+        Stops scanning and deleting `TIME_BUDGET_MARGIN_SECONDS` before `seconds` run out,
+        e.g. the remaining Lambda time, and keeps a checkpoint in STATE_STORE. A run with a
+        time budget resumes the checkpoint an earlier run left.
+        """
+        self.deadline = time.monotonic() + seconds - config.TIME_BUDGET_MARGIN_SECONDS
+        self.checkpoint = RunCheckpoint(
+            store=get_store(config.STATE_STORE),
+            aws_region=self.aws_region,
+            store_key=f"{self.store_prefix}{RunCheckpoint.STORE_KEY}",
+            max_age=timedelta(minutes=config.CHECKPOINT_MAX_AGE_MINUTES),
+            now=self.now,
+        )
 
-        for ec_repo in self.ecr_manager.get_all_repositories():
+    def keep_scan(self):
+        """
+        Keeps the scan of this run in the checkpoint, so the next run resumes it. A finished
+        scan is only kept when it is not applied by this run, e.g. another region of a multi
+        region run ran out of time.
+        """
+        if self.checkpoint is not None and self._scan is not None:
+            created_at, in_use_images, scanned = self._scan
+            self.checkpoint.save_scan(
+                created_at, in_use_images, scanned, self.image_sizes
+            )
 
-            images_to_keep = set()
-            all_images = set()
+    def out_of_time(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
 
-            # get repo URI to be used with comparing image being used by running task
-            repoUri = ec_repo["uri"]
+    @property
+    def slack_notifier(self):
+        # slack_sdk is only imported once a notice is sent
+        if self._slack_notifier is None:
+            from ecr_cleaner.notifier import SlackNotifier
 
-            repository_images = self.ecr_manager.fetch_repository_images(
-                repository_name=ec_repo["name"]
+            self._slack_notifier = SlackNotifier(
+                slack_token=self.slack_token, metrics=self.metrics
             )
+        return self._slack_notifier
 
-            for image in repository_images:
-                image_digest = image["imageDigest"]
-
-                image_tag = None
+    def aws_client(self):
 
-                if "imageTag" in image.keys():
-                    image_tag = image["imageTag"]
+        # the pool has to be big enough for every scan, cluster and delete worker to hold a
+        # connection, clients are shared with every other cleaner of the same region
+        max_pool_connections = max(
+            self.scan_workers,
+            config.ECS_CLUSTER_WORKERS,
+            config.DELETE_WORKERS,
+            config.ASYNC_CONCURRENCY if self.async_backend else 1,
+        )
 
-                image_tags = None
+        self.ecr_client = get_aws_client(
+            "ecr",
+            region_name=self.aws_region,
+            profile_name=os.getenv("AWS_PROFILE"),
+            session=self.session,
+            max_pool_connections=max_pool_connections,
+        )
+        self.ecs_client = get_aws_client(
+            "ecs",
+            region_name=self.aws_region,
+            profile_name=os.getenv("AWS_PROFILE"),
+            session=self.session,
+            max_pool_connections=max_pool_connections,
+        )
 
-                if "imageTags" in image.keys():
-                    image_tags = image["imageTags"]
-                image_pushed_at = image["imagePushedAt"]
+    @property
+    def plan(self):
+        """The cleanup plan for this run, discovery only happens the first time it is read."""
+        if self._plan is None:
+            self._plan = self.build_plan()
+        return self._plan
 
-                all_images.add(image_digest)
+    @property
+    def images_to_delete(self):
+        return self.plan.as_dict()
+
+    def build_plan(self):
+        checkpoint = self.checkpoint
+        created_at = self.now
+
+        if checkpoint is not None and checkpoint.pending is not None:
+            # an earlier run was interrupted while deleting, finish it before scanning again
+            self.resuming_deletion = True
+            return checkpoint.pending
+
+        resumed_scan = {}
+        in_use_images = self.in_use_images
+        if checkpoint is not None and checkpoint.in_use_images is not None:
+            resumed_scan = checkpoint.scanned
+            self.image_sizes.update(checkpoint.image_sizes)
+            in_use_images = checkpoint.in_use_images
+            created_at = checkpoint.created_at
+
+        def discover():
+            if in_use_images is not None:
+                return in_use_images
+            with self.metrics.phase("ecs_discovery"):
+                if config.ECS_INVENTORY_TTL_MINUTES:
+                    return self.inventory_snapshot().in_use_images
+                return self.ecs_manager.get_running_task_images()
+
+        with ThreadPoolExecutor(max_workers=1) as discovery:
+            running_task_images = discovery.submit(discover)
+            if not self.overlap_discovery:
+                running_task_images.result()
+
+            def scan(ec_repo):
+                if ec_repo["name"] in resumed_scan:
+                    return ec_repo, resumed_scan[ec_repo["name"]]
+                if self.out_of_time():
+                    return ec_repo, None
+                if self._skip_repository(ec_repo):
+                    return ec_repo, frozenset()
+                with self.metrics.repository(ec_repo["name"]):
+                    return ec_repo, self._repository_images_to_delete(
+                        ec_repo, running_task_images
+                    )
+
+            with self.metrics.phase("ecr_scan"):
+                repositories = self.ecr_manager.get_all_repositories()
+                if self.shard_index is not None:
+                    repositories = (
+                        ec_repo
+                        for ec_repo in repositories
+                        if shard_of(ec_repo["name"], self.shard_count)
+                        == self.shard_index
+                    )
+
+                if self.async_backend:
+                    from . import aio
+
+                    results = aio.scan_repositories(
+                        self, repositories, resumed_scan, running_task_images
+                    )
+                elif self.executor is not None:
+                    results = list(self.executor.map(scan, repositories))
+                elif self.scan_workers > 1:
+                    # executor.map keeps repository order, so the result matches the serial scan
+                    with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+                        results = list(executor.map(scan, repositories))
+                else:
+                    results = list(map(scan, repositories))
+
+        # an incomplete ECS inventory fails the plan, the scan alone can not tell what is in use
+        in_use_index = running_task_images.result()
+
+        scanned = {
+            ec_repo["name"]: images_to_delete
+            for ec_repo, images_to_delete in results
+            if images_to_delete is not None
+        }
+        self.metrics.add("repositories_scanned", len(scanned))
+
+        if self.repository_state is not None:
+            self.repository_state.retain(ec_repo["name"] for ec_repo, _ in results)
+            self.repository_state.save()
+
+        if len(scanned) < len(results):
+            self.plan_complete = self.completed = False
+            self.metrics.add("repositories_pending", len(results) - len(scanned))
+        self._scan = (created_at, in_use_index, scanned)
+        if not self.plan_complete:
+            self.keep_scan()
+
+        return CleanupPlan(
+            repositories=scanned,
+            created_at=created_at,
+            aws_region=self.aws_region,
+            image_sizes=self.image_sizes,
+        )
 
-                """ images to keep by age and count """
-                if (
-                    len(images_to_keep) < config.KEEP_MIN_IMAGE_COUNT
-                    or image_pushed_at >= self.keep_images_newer_than_days
-                ):
-                    images_to_keep.add(image_digest)
+    def inventory_snapshot(self):
+        """
+        The ECS inventory as a snapshot. One taken less than ECS_INVENTORY_TTL_MINUTES ago, by
+        an earlier run or another shard, is reused, otherwise every cluster is walked and the
+        new snapshot is kept for later runs.
+        """
+        ttl = timedelta(minutes=config.ECS_INVENTORY_TTL_MINUTES)
+
+        snapshot = self._load_inventory_snapshot() if ttl else None
+        if snapshot is not None and snapshot.is_fresh(self.now, ttl):
+            self.metrics.add("ecs_inventory_reused")
+            return snapshot
+
+        cluster_images, complete = self.ecs_manager.get_cluster_images()
+        if not complete:
+            raise IncompleteInventoryError("Not every ECS cluster could be read")
+        snapshot = InventorySnapshot(created_at=self.now, clusters=cluster_images)
+        if ttl:
+            self._save_inventory_snapshot(snapshot)
+        return snapshot
+
+    def _load_inventory_snapshot(self):
+        try:
+            if config.ECS_INVENTORY_FILE:
+                return InventorySnapshot.load(config.ECS_INVENTORY_FILE)
+            data = get_store(config.STATE_STORE).load(
+                f"{self.store_prefix}{INVENTORY_STORE_KEY}"
+            )
+            return InventorySnapshot.from_json(data) if data is not None else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Ignoring ECS inventory snapshot: {e}")
+            return None
 
-                # check images by one or more tags
-                if image_tags:
-                    for tag in image_tags:
-                        full_image = f"{repoUri}:{tag}"
-                        if full_image in running_task_images:
-                            images_to_keep.add(image_digest)
+    def _save_inventory_snapshot(self, snapshot):
+        if config.ECS_INVENTORY_FILE:
+            snapshot.save(config.ECS_INVENTORY_FILE)
+        else:
+            get_store(config.STATE_STORE).save(
+                f"{self.store_prefix}{INVENTORY_STORE_KEY}", snapshot.to_json()
+            )
 
-                # check image with single tag
-                if image_tag:
-                    full_image = f"{repoUri}:{image_tag}"
-                    if full_image in running_task_images:
-                        images_to_keep.add(image_digest)
+    def _skip_repository(self, ec_repo):
+        """
+        Whether the repository is left out before its images are described, see
+        `RepositoryFilter`. A repository that cannot be checked is described.
+        """
+        if not self.repository_filter:
+            return False
+        try:
+            reason, api_calls = self.repository_filter.skip_reason(
+                ec_repo["name"], self.ecr_manager
+            )
+        except Exception as e:
+            logging.warning(f"Error pre-filtering {ec_repo['name']}, scanning it: {e}")
+            return False
 
-                # this is for checking images which are added in task with digest instead of tags
-                # it may or may not have tags but, it still can be added with digest and we need to check for else
-                # we may miss an image
-                if True:
-                    full_image = f"{repoUri}@{image_digest}"
-                    if full_image in running_task_images:
-                        images_to_keep.add(image_digest)
+        if api_calls:
+            self.metrics.add("prefilter_api_calls", api_calls)
+        if reason is None:
+            return False
 
-            images_to_delete = all_images - images_to_keep
+        logging.debug(f"Skipping repository {ec_repo['name']}: {reason}")
+        self.metrics.add("repositories_skipped")
+        self.metrics.add(f"repositories_skipped_{reason.replace('-', '_')}")
+        # at least one describe_images call per repository
+        self.metrics.add("describe_images_calls_saved")
+        return True
 
-            if images_to_delete:
-                ecr_images_to_delete[ec_repo["name"]] = dict(
-                    totalDelete=len(images_to_delete), delete=images_to_delete
+    @property
+    def revalidates(self):
+        """
+        Whether unchanged repositories are revalidated instead of scanned. Their images are not
+        evaluated, so a run with a report or a catalogue scans every repository.
+        """
+        return self.repository_state is not None and self.report is None
+
+    def _repository_images_to_delete(self, ec_repo, running_task_images):
+        try:
+            if self.revalidates:
+                images_to_delete = self.repository_state.revalidate(
+                    ec_repo,
+                    self.ecr_manager,
+                    running_task_images.result(),
+                    self.now,
+                    image_sizes=self.image_sizes,
                 )
+                if images_to_delete is not None:
+                    return images_to_delete
 
-        return ecr_images_to_delete
-
-    def send_slack_notice(self, images_to_delete):
+            pages = self.ecr_manager.iter_repository_image_pages(
+                repository_name=ec_repo["name"]
+            )
+            # the first page is fetched while ECS discovery may still be running,
+            # the rest are streamed through the retention policy one page at a time
+            first_page = next(pages, [])
+            repository_images = chain.from_iterable(chain([first_page], pages))
 
-        message = ""
-        totalDeleteImagesInAccount = 0
+            return self._evaluate_images(
+                ec_repo, repository_images, running_task_images.result()
+            )
+        except Exception as e:
+            # nothing is deleted from a repository that could not be fully scanned
+            logging.error(f"Error fetching ECR images for {ec_repo['name']}: {e}")
+            return frozenset()
+
+    def _evaluate_images(self, ec_repo, repository_images, in_use_images):
+        evaluation = RepositoryEvaluation(self, ec_repo, in_use_images)
+        evaluation.add(repository_images)
+        return evaluation.finish()
+
+    @staticmethod
+    def slack_message(plan):
+
+        # one line per repository, joined once, thousands of repositories are common
+        lines = [f"*Total*: {plan.total_delete} images, {plan.total_bytes / GB:.2f} GB"]
+        lines.extend(
+            f" - {ec_repo}: {len(image_digests)} "
+            f"({plan.repository_bytes(ec_repo) / GB:.2f} GB)"
+            for ec_repo, image_digests in plan.items()
+        )
+        lines.append("")
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def prioritised(plan):
+        """
+        The plan with the largest repositories first and within the deletion budget, when
+        DELETE_LARGEST_FIRST, DELETE_MAX_GB or DELETE_MAX_API_CALLS is set.
+        """
+        if not (
+            config.DELETE_LARGEST_FIRST
+            or config.DELETE_MAX_GB
+            or config.DELETE_MAX_API_CALLS
+        ):
+            return plan
+        return plan.prioritised(
+            max_bytes=int(config.DELETE_MAX_GB * GB),
+            max_api_calls=config.DELETE_MAX_API_CALLS,
+        )
 
-        for ec_repo, delete_data in images_to_delete.items():
+    def send_slack_notice(self, plan):
 
-            ec_repo_total_delete = delete_data["totalDelete"]
+        with self.metrics.phase("slack"):
+            self.slack_notifier.send_message(message=self.slack_message(plan))
 
-            totalDeleteImagesInAccount += ec_repo_total_delete
+    def delete_old_images(self, plan):
+        """
+        Deletes the plan, repositories are processed in parallel when DELETE_WORKERS > 1. With
+        a time budget, the images left when it runs out are kept in the checkpoint.
+        """
+        # mocked managers in tests and older callers do not take out_of_time
+        options = {"out_of_time": self.out_of_time} if self.deadline is not None else {}
 
-            message += f" - {ec_repo}: {ec_repo_total_delete}\n"
+        def delete(repository):
+            ec_repo, image_digests = repository
+            return ec_repo, self.ecr_manager.delete_images(
+                repository_name=ec_repo, images_to_delete=image_digests, **options
+            )
 
-        message = f"*Total*: {totalDeleteImagesInAccount}\n" + message
+        with self.metrics.phase("deletion"):
+            if self.async_backend:
+                from . import aio
+
+                results = aio.delete_plan(self, plan, options)
+            elif self.executor is not None:
+                results = dict(self.executor.map(delete, plan.items()))
+            elif config.DELETE_WORKERS > 1:
+                with ThreadPoolExecutor(max_workers=config.DELETE_WORKERS) as executor:
+                    results = dict(executor.map(delete, plan.items()))
+            else:
+                results = dict(map(delete, plan.items()))
+
+        if self.checkpoint is not None:
+            pending = CleanupPlan(
+                repositories={
+                    ec_repo: result.get("pending", ())
+                    for ec_repo, result in results.items()
+                },
+                created_at=plan.created_at,
+                aws_region=self.aws_region,
+                image_sizes=plan.image_sizes,
+            )
+            if pending:
+                self.completed = False
+                self.checkpoint.save_deletion(pending)
+            else:
+                self.checkpoint.clear()
 
-        self.slack_notifier.send_message(message=message)
+        return results
 
-    def delete_old_images(self, images_to_delete):
+    def run(self, plan=None):
+        """Applies the given plan, or the plan computed for this run when none is given."""
+        if plan is None:
+            plan = self.plan
+        plan = self.prioritised(plan)
 
-        for ec_repo, ec_repo_data in images_to_delete.items():
-            self.ecr_manager.delete_images(
-                repository_name=ec_repo, images_to_delete=ec_repo_data["delete"]
-            )
+        self.metrics.add("images_to_delete", plan.total_delete)
+        self.metrics.add("bytes_to_delete", plan.total_bytes)
 
-    def run(self):
-        images_to_delete = self.images_to_delete
+        if not self.plan_complete:
+            logging.info("Out of time while scanning, the next run resumes the scan")
+        else:
+            if plan and config.SLACK_ENABLED and not self.resuming_deletion:
+                self.send_slack_notice(plan=plan)
+            self.apply(plan)
+
+        return self.emit_summary()
+
+    def apply(self, plan):
+        """
+        Deletes the plan when DELETE_ENABLED, and takes what was deleted out of the
+        repository state. Multi region, organisation and sharded runs apply every part of
+        their plan with it. The checkpoint is done with once the plan is applied.
+        """
+        if not (config.DELETE_ENABLED and plan):
+            if self.checkpoint is not None:
+                self.checkpoint.clear()
+            return {}
+
+        results = self.delete_old_images(plan=plan)
+        if self.repository_state is not None:
+            self._update_repository_state(plan, results)
+        return results
+
+    def emit_summary(self, summary=None):
+        """Logs the run summary, and writes it to METRICS_SUMMARY_FILE and as EMF."""
+        return self.metrics.emit(
+            emf=config.METRICS_EMF,
+            summary_file=config.METRICS_SUMMARY_FILE,
+            dimensions={"Region": self.aws_region} if self.aws_region else None,
+            summary=summary,
+        )
 
-        if images_to_delete:
-            if config.SLACK_ENABLED:
-                self.send_slack_notice(images_to_delete=images_to_delete)
-            if config.DELETE_ENABLED:
-                self.delete_old_images(images_to_delete=images_to_delete)
+    def _update_repository_state(self, plan, results):
+        for ec_repo, result in results.items():
+            if result["failed"] == 0 and result["deleted"] == len(plan[ec_repo]):
+                self.repository_state.forget_deleted(ec_repo, plan[ec_repo])
+            else:
+                # we do not know which images are left, scan the repository in full next run
+                self.repository_state.invalidate(ec_repo)
+        self.repository_state.save()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+
+from .evaluation import RepositoryEvaluation
+
+
+def scan_repositories(cleaner, repositories, resumed_scan, running_task_images):
+    """
+    The scan of `ECRCleaner.build_plan` with the async backend, one coroutine per repository.
+    Returns `(ec_repo, images_to_delete)` for every repository, None when it was not scanned.
+    """
+    return asyncio.run(
+        _scan_repositories(cleaner, repositories, resumed_scan, running_task_images)
+    )
+
+
+def delete_plan(cleaner, plan, options):
+    """The deletion of `ECRCleaner.delete_old_images` with the async backend, by repository."""
+    return asyncio.run(_delete_plan(cleaner, plan, options))
+
+
+async def _scan_repositories(cleaner, repositories, resumed_scan, running_task_images):
+    api = cleaner.ecr_manager.api
+    in_use_images = asyncio.wrap_future(running_task_images)
+    # no more repositories are scanned at once than there are threads for their calls, so
+    # the pages in memory are bounded and a repository only starts before the deadline
+    in_flight = asyncio.Semaphore(api.concurrency)
+
+    async def scan(ec_repo):
+        if ec_repo["name"] in resumed_scan:
+            return ec_repo, resumed_scan[ec_repo["name"]]
+        async with in_flight:
+            if cleaner.out_of_time():
+                return ec_repo, None
+            if await api.run(cleaner._skip_repository, ec_repo):
+                return ec_repo, frozenset()
+            with cleaner.metrics.repository(ec_repo["name"]):
+                return ec_repo, await _repository_images_to_delete(
+                    cleaner, ec_repo, in_use_images
+                )
+
+    return await asyncio.gather(*(scan(ec_repo) for ec_repo in repositories))
+
+
+async def _repository_images_to_delete(cleaner, ec_repo, in_use_images):
+    """`ECRCleaner._repository_images_to_delete`, describe_images pages are awaited."""
+    api = cleaner.ecr_manager.api
+    try:
+        if cleaner.revalidates:
+            images_to_delete = await api.run(
+                cleaner.repository_state.revalidate,
+                ec_repo,
+                cleaner.ecr_manager,
+                await in_use_images,
+                cleaner.now,
+                image_sizes=cleaner.image_sizes,
+            )
+            if images_to_delete is not None:
+                return images_to_delete
+
+        pages = cleaner.ecr_manager.iter_repository_image_pages_async(ec_repo["name"])
+        # the first page is fetched while ECS discovery may still be running,
+        # the rest are evaluated one page at a time as they come in
+        first_page = await anext(pages, [])
+        evaluation = RepositoryEvaluation(cleaner, ec_repo, await in_use_images)
+        evaluation.add(first_page)
+        async for page in pages:
+            evaluation.add(page)
+        return evaluation.finish()
+    except Exception as e:
+        # nothing is deleted from a repository that could not be fully scanned
+        logging.error(f"Error fetching ECR images for {ec_repo['name']}: {e}")
+        return frozenset()
+
+
+async def _delete_plan(cleaner, plan, options):
+    results = await asyncio.gather(
+        *(
+            cleaner.ecr_manager.delete_images_async(
+                repository_name=ec_repo, images_to_delete=image_digests, **options
+            )
+            for ec_repo, image_digests in plan.items()
+        )
+    )
+    return dict(zip(plan, results))
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+import ast
+import sys
+import threading
+import zipfile
+from array import array
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECONDS_PER_DAY = 86_400_000_000
+
+NPY_MAGIC = b"\x93NUMPY"
+
+
+def _to_microseconds(image_pushed_at):
+    if image_pushed_at.tzinfo is None:
+        image_pushed_at = image_pushed_at.replace(tzinfo=timezone.utc)
+    # integer arithmetic, a float timestamp would round some images across the cutoff
+    return (image_pushed_at - EPOCH) // timedelta(microseconds=1)
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_npy(values):
+    """
+    An `.npy` document for an `array` of int32 / int64 / bool or for bytes, numpy loads it as
+    is and no numpy is needed to write it.
+    """
+    if isinstance(values, array):
+        descr = {"i": "<i4", "q": "<i8", "B": "|b1"}[values.typecode]
+        data = _little_endian(values)
+    else:
+        descr = "|u1"
+        data = bytes(values)
+
+    header = repr({"descr": descr, "fortran_order": False, "shape": (len(values),)})
+    # the data starts on a 64 byte boundary, the header ends with a newline
+    header += " " * (-(len(NPY_MAGIC) + 4 + len(header) + 1) % 64) + "\n"
+    return (
+        NPY_MAGIC
+        + b"\x01\x00"
+        + len(header).to_bytes(2, "little")
+        + header.encode("latin1")
+        + data
+    )
+
+
+def _decode_npy(document):
+    if not document.startswith(NPY_MAGIC):
+        raise ValueError("Not an .npy document")
+    header_length = int.from_bytes(document[8:10], "little")
+    header = ast.literal_eval(document[10 : 10 + header_length].decode("latin1"))
+    data = document[10 + header_length :]
+
+    descr = header["descr"]
+    if descr == "|u1":
+        return bytearray(data)
+
+    values = array({"<i4": "i", "<i8": "q", "|b1": "B"}[descr])
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class StringColumn:
+    """
+    Strings kept as one UTF-8 byte string and the offset where every string ends, instead of
+    a Python object or a fixed width numpy string per value. `values[offsets[i]:offsets[i + 1]]`
+    is string `i`.
+    """
+
+    def __init__(self, data=None, offsets=None):
+        self.data = bytearray() if data is None else data
+        self.offsets = array("q", [0]) if offsets is None else offsets
+
+    def append(self, value):
+        self.data += value.encode("utf-8")
+        self.offsets.append(len(self.data))
+
+    def encoded(self, index):
+        return bytes(self.data[self.offsets[index] : self.offsets[index + 1]])
+
+    def __getitem__(self, index):
+        return self.encoded(index).decode("utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class ImageCatalogue:
+    """
+    Every image seen by a scan, one column per attribute, so retention rules can be tried
+    again offline. Saved as an `.npz` file, a zip of one `.npy` array per column:
+
+    - `repositories`: repository URIs, `repository` indexes them for every image
+    - `digest`, `tags` (space separated), `in_use` (referenced by ECS)
+    - `pushed_at` in microseconds since the epoch, `size` in bytes
+    - `created_at`: when the scan started, the age cutoffs are relative to it
+
+    String columns are a `StringColumn`, saved as the uint8 array of their UTF-8 bytes and an
+    int64 `<column>_offsets` array.
+    """
+
+    COLUMNS = ("repository", "digest", "pushed_at", "size", "tags", "in_use")
+    STRING_COLUMNS = ("repositories", "digest", "tags")
+
+    def __init__(self, created_at, repositories, columns):
+        self.created_at = created_at
+        self.repositories = repositories
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["digest"])
+
+    def save(self, file_name):
+        with zipfile.ZipFile(
+            file_name, mode="w", compression=zipfile.ZIP_DEFLATED
+        ) as file:
+            file.writestr(
+                "created_at.npy",
+                _encode_npy(array("q", [_to_microseconds(self.created_at)])),
+            )
+            columns = {"repositories": self.repositories, **self.columns}
+            for column, values in columns.items():
+                if column in self.STRING_COLUMNS:
+                    file.writestr(f"{column}.npy", _encode_npy(values.data))
+                    file.writestr(f"{column}_offsets.npy", _encode_npy(values.offsets))
+                else:
+                    file.writestr(f"{column}.npy", _encode_npy(values))
+
+    @classmethod
+    def load(cls, file_name):
+        with zipfile.ZipFile(file_name) as file:
+            arrays = {
+                name[: -len(".npy")]: _decode_npy(file.read(name))
+                for name in file.namelist()
+            }
+        for column in cls.STRING_COLUMNS:
+            arrays[column] = StringColumn(
+                arrays[column], arrays.pop(f"{column}_offsets")
+            )
+        return cls(
+            created_at=EPOCH + timedelta(microseconds=arrays["created_at"][0]),
+            repositories=arrays["repositories"],
+            columns={column: arrays[column] for column in cls.COLUMNS},
+        )
+
+    def what_if(self, keep_min_counts, keep_images_newer_than_days):
+        """
+        Images `RetentionPolicy` would delete, and their bytes, for every combination of
+        minimum count and age. Vectorised with numpy when it is installed.
+        """
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        evaluate = self._what_if_numpy if numpy is not None else self._what_if_python
+        created_at = _to_microseconds(self.created_at)
+        policies = [
+            (keep_min_count, days)
+            for keep_min_count in keep_min_counts
+            for days in keep_images_newer_than_days
+        ]
+        results = evaluate(
+            [
+                (keep_min_count, created_at - days * MICROSECONDS_PER_DAY)
+                for keep_min_count, days in policies
+            ]
+        )
+        return [
+            {
+                "keep_min_count": keep_min_count,
+                "keep_images_newer_than_days": days,
+                **result,
+            }
+            for (keep_min_count, days), result in zip(policies, results)
+        ]
+
+    def _what_if_numpy(self, policies):
+        import numpy as np
+
+        repository = np.frombuffer(self.columns["repository"], dtype=np.int32)
+        pushed_at = np.frombuffer(self.columns["pushed_at"], dtype=np.int64)
+        size = np.frombuffer(self.columns["size"], dtype=np.int64)
+        in_use = np.frombuffer(self.columns["in_use"], dtype=np.bool_)
+
+        # position of every image among the newest of its repository, (pushed_at, digest)
+        # ordered like RetentionPolicy
+        digest = self.columns["digest"]
+        # bytes sort like the strings, UTF-8 keeps the order of code points
+        digest = np.array([digest.encoded(index) for index in range(len(digest))])
+        order = np.lexsort((digest, pushed_at, repository))
+        sorted_repository = repository[order]
+        ends = np.cumsum(np.bincount(sorted_repository))
+        newest_rank = np.empty(len(order), dtype=np.int64)
+        newest_rank[order] = ends[sorted_repository] - 1 - np.arange(len(order))
+
+        unused = ~in_use
+        results = []
+        for keep_min_count, cutoff in policies:
+            delete = (newest_rank >= keep_min_count) & (pushed_at < cutoff) & unused
+            results.append(
+                {
+                    "images_to_delete": int(delete.sum()),
+                    "bytes_to_delete": int(size[delete].sum()),
+                }
+            )
+        return results
+
+    def _what_if_python(self, policies):
+        repository = self.columns["repository"]
+        pushed_at = self.columns["pushed_at"]
+        digest = self.columns["digest"]
+
+        newest_rank = [0] * len(self)
+        order = sorted(
+            range(len(self)),
+            key=lambda index: (repository[index], pushed_at[index], digest[index]),
+            reverse=True,
+        )
+        previous, rank = None, 0
+        for index in order:
+            rank = rank + 1 if repository[index] == previous else 0
+            previous = repository[index]
+            newest_rank[index] = rank
+
+        candidates = [
+            (newest_rank[index], pushed_at[index], self.columns["size"][index])
+            for index in range(len(self))
+            if not self.columns["in_use"][index]
+        ]
+        results = []
+        for keep_min_count, cutoff in policies:
+            delete = [
+                size
+                for rank, image_pushed_at, size in candidates
+                if rank >= keep_min_count and image_pushed_at < cutoff
+            ]
+            results.append(
+                {"images_to_delete": len(delete), "bytes_to_delete": sum(delete)}
+            )
+        return results
+
+
+class CatalogueSink:
+    """
+    Collects an `ImageCatalogue` from the decisions of a scan, like a `report.ReportSink`,
+    and saves it when closed. Only the columns are held in memory, strings as UTF-8 bytes.
+    """
+
+    def __init__(self, file_name, created_at=None):
+        self.file_name = file_name
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.repositories = {}
+        self.columns = {
+            "repository": array("i"),
+            "digest": StringColumn(),
+            "pushed_at": array("q"),
+            "size": array("q"),
+            "tags": StringColumn(),
+            "in_use": array("B"),
+        }
+        self._lock = threading.Lock()
+
+    def add(self, repository_uri, image, decision, in_use_index):
+        image_tags = image.get("imageTags") or (
+            [image["imageTag"]] if image.get("imageTag") else []
+        )
+        # whatever the decision, e.g. an image kept for its age may be in use as well
+        in_use = in_use_index.is_in_use(
+            repository_uri,
+            image["imageDigest"],
+            image_tags=image_tags,
+            image_tag=image.get("imageTag"),
+        )
+
+        with self._lock:
+            repository = self.repositories.setdefault(
+                repository_uri, len(self.repositories)
+            )
+            self.columns["repository"].append(repository)
+            self.columns["digest"].append(image["imageDigest"])
+            self.columns["pushed_at"].append(_to_microseconds(image["imagePushedAt"]))
+            self.columns["size"].append(image.get("imageSizeInBytes") or 0)
+            self.columns["tags"].append(" ".join(image_tags))
+            self.columns["in_use"].append(in_use)
+
+    def close(self):
+        with self._lock:
+            repositories = StringColumn()
+            for repository_uri in self.repositories:
+                repositories.append(repository_uri)
+            ImageCatalogue(
+                created_at=self.created_at,
+                repositories=repositories,
+                columns=self.columns,
+            ).save(self.file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
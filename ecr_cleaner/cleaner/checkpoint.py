@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime
+
+from ecr_cleaner.manager import InUseImageIndex
+
+from .plan import CleanupPlan
+
+
+class RunCheckpoint:
+    """
+    Progress of a run that ran out of time, kept in a `Store` so the next run resumes it.
+
+    While scanning, the checkpoint holds the ECS inventory and the images to delete of every
+    repository already scanned, the next run only scans the others. Once deletion started
+    it holds the images not deleted yet, the next run deletes them without scanning again.
+
+    A checkpoint older than `max_age` is ignored: the in-use images it holds may have changed
+    since, e.g. after a rollback, and its images are no longer safe to delete.
+
+    A checkpoint that can not be written is logged and the run goes on, the next run then
+    scans again. Nothing is written by a run that neither stops early nor resumes.
+    """
+
+    STORE_KEY = "checkpoint"
+    VERSION = 1
+
+    def __init__(self, store, aws_region, store_key=None, max_age=None, now=None):
+        self.store = store
+        self.aws_region = aws_region
+        self.store_key = store_key or self.STORE_KEY
+
+        data = store.load(self.store_key) or {}
+        if data and data.get("version") != self.VERSION:
+            logging.warning(f"Ignoring checkpoint version {data.get('version')}")
+            data = {}
+        if (
+            data
+            and max_age
+            and now - datetime.fromisoformat(data["created_at"]) > max_age
+        ):
+            logging.warning(
+                f"Ignoring checkpoint from {data['created_at']}, older than {max_age}"
+            )
+            data = {}
+
+        # whether there is a checkpoint in the store to clear
+        self.saved = bool(data)
+        self.created_at = datetime.fromisoformat(data["created_at"]) if data else None
+        self.in_use_images = (
+            InUseImageIndex(data["in_use_images"])
+            if data.get("in_use_images") is not None
+            else None
+        )
+        self.scanned = {
+            repository_name: frozenset(image_digests)
+            for repository_name, image_digests in data.get("scanned", {}).items()
+        }
+        self.image_sizes = data.get("image_sizes", {})
+        self.pending = (
+            CleanupPlan(
+                data["pending"],
+                created_at=self.created_at,
+                aws_region=aws_region,
+                image_sizes=self.image_sizes,
+            )
+            if data.get("pending") is not None
+            else None
+        )
+
+    def save_scan(self, created_at, in_use_images, scanned, image_sizes=None):
+        """Keeps the scan so far, the scan of the repositories not in `scanned` is resumed."""
+        saved = self._save(
+            {
+                "version": self.VERSION,
+                "created_at": created_at.isoformat(),
+                "in_use_images": list(in_use_images),
+                "scanned": {
+                    repository_name: sorted(image_digests)
+                    for repository_name, image_digests in scanned.items()
+                },
+                "image_sizes": dict(image_sizes or {}),
+            }
+        )
+        if saved:
+            logging.info(f"Checkpoint saved after scanning {len(scanned)} repositories")
+
+    def save_deletion(self, pending):
+        saved = self._save(
+            {
+                "version": self.VERSION,
+                "created_at": pending.created_at.isoformat(),
+                "pending": pending.to_json()["repositories"],
+                "image_sizes": dict(pending.image_sizes),
+            }
+        )
+        if saved:
+            logging.info(
+                f"Out of time, checkpoint saved with {pending.total_delete} images to delete"
+            )
+
+    def clear(self):
+        if not self.saved:
+            return
+        try:
+            self.store.delete(self.store_key)
+            self.saved = False
+        except Exception as e:
+            logging.error(f"Error clearing the checkpoint {self.store_key}: {e}")
+
+    def _save(self, data):
+        try:
+            self.store.save(self.store_key, data)
+        except Exception as e:
+            logging.error(
+                f"Error saving the checkpoint {self.store_key}, the next run scans again: {e}"
+            )
+            return False
+        self.saved = True
+        return True
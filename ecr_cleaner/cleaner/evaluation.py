@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import pickle
+import tempfile
+
+from .report import REPORT_IMAGE_FIELDS
+from .retention import DELETE
+
+
+class RepositoryEvaluation:
+    """
+    Evaluates the images of one repository for a cleaner as they are added, a page at a time
+    or all at once. Every decision goes to the report and the repository state, the images
+    to delete are collected with their size. The blocking and the async scans share it.
+    """
+
+    def __init__(self, cleaner, ec_repo, in_use_images):
+        self.cleaner = cleaner
+        self.ec_repo = ec_repo
+        self.in_use_images = in_use_images
+        self.evaluation = cleaner.retention_policy.evaluation(
+            repository_uri=ec_repo["uri"], in_use_index=in_use_images
+        )
+        self.recorder = (
+            cleaner.repository_state.recorder()
+            if cleaner.repository_state is not None
+            else None
+        )
+        self.image_digests = set()
+        # report rows are only written once the repository was fully scanned, a scan failing
+        # part way through deletes nothing and must not report deletions either. Until then
+        # they wait in an unnamed temporary file, whatever the size of the repository.
+        self.report_spool = None
+
+    def add(self, images):
+        self._collect(self.evaluation.decide(images))
+
+    def finish(self):
+        """The images to delete once every image was added, the repository state is recorded."""
+        self._collect(self.evaluation.finish())
+        if self.recorder is not None:
+            self.cleaner.repository_state.record(
+                self.ec_repo, self.recorder, self.cleaner.now
+            )
+        if self.report_spool is not None:
+            self._report_spooled_rows()
+        return frozenset(self.image_digests)
+
+    def _spool_report_row(self, image, decision):
+        if self.report_spool is None:
+            self.report_spool = tempfile.TemporaryFile()
+        image = {field: image[field] for field in REPORT_IMAGE_FIELDS if field in image}
+        pickle.dump((image, decision), self.report_spool, pickle.HIGHEST_PROTOCOL)
+
+    def _report_spooled_rows(self):
+        report = self.cleaner.report
+        with self.report_spool as spool:
+            spool.seek(0)
+            while True:
+                try:
+                    image, decision = pickle.load(spool)
+                except EOFError:
+                    break
+                report.add(self.ec_repo["uri"], image, decision, self.in_use_images)
+        self.report_spool = None
+
+    def _collect(self, decisions):
+        reported = self.cleaner.report is not None
+        image_sizes = self.cleaner.image_sizes
+        if self.recorder is not None:
+            decisions = self.recorder.record(decisions)
+
+        for image, decision in decisions:
+            if reported:
+                self._spool_report_row(image, decision)
+            if decision == DELETE:
+                self.image_digests.add(image["imageDigest"])
+                image_sizes[image["imageDigest"]] = image.get("imageSizeInBytes", 0)
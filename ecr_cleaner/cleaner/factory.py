@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import os
+
+from ecr_cleaner import config
+
+from . import ECRCleaner
+
+
+def create_cleaner():
+    """
+    The cleaner for the configured accounts, regions and shards. Multi region, organisation
+    and sharded cleaners are only imported when they are configured.
+    """
+    if config.ORGANISATION_ACCOUNT_IDS:
+        from .organisation import OrganisationCleaner
+
+        return OrganisationCleaner(
+            account_ids=config.ORGANISATION_ACCOUNT_IDS,
+            role_name=config.ORGANISATION_ROLE_NAME,
+            aws_regions=config.AWS_REGIONS,
+            slack_token=config.SLACK_TOKEN,
+        )
+    if config.SHARD_COUNT > 1:
+        from .sharding import ShardedCleaner
+
+        return ShardedCleaner(
+            aws_region=config.AWS_REGIONS[0],
+            slack_token=config.SLACK_TOKEN,
+            shard_count=config.SHARD_COUNT,
+            # Lambda has no /dev/shm for worker processes, its shards are planned on threads
+            processes=not os.getenv("LAMBDA_TASK_ROOT"),
+        )
+    if len(config.AWS_REGIONS) > 1:
+        from .multi_region import MultiRegionCleaner
+
+        return MultiRegionCleaner(
+            aws_regions=config.AWS_REGIONS, slack_token=config.SLACK_TOKEN
+        )
+    return ECRCleaner(aws_region=config.AWS_REGIONS[0], slack_token=config.SLACK_TOKEN)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from ecr_cleaner import config
+from ecr_cleaner.metrics import RunMetrics
+
+from . import ECRCleaner
+from .plan import CleanupPlan
+
+
+class FanOutCleaner(ABC):
+    """
+    Runs one ECRCleaner per key, e.g. per region or per account and region, in parallel and
+    reports them as one plan: repositories are prefixed with their key, one Slack notice and
+    one run summary are produced.
+
+    Subclasses fill `cleaners`, name the summary phase of every key `<phase>:<key>` with
+    `phase` and add their own figures in `summary`. `coordinator_workers` keys are run at once,
+    every key by default.
+    """
+
+    aws_region = None
+    phase = None
+    thread_name_prefix = ""
+
+    def __init__(self, slack_token, coordinator_workers=None):
+        self.metrics = RunMetrics()
+        self.cleaners = {}
+        self.coordinator_workers = coordinator_workers
+        self.slack_token = slack_token
+        self._slack_notifier = None
+        self._plan = None
+
+    def set_time_budget(self, seconds):
+        """Every cleaner gets the budget and keeps its own checkpoint."""
+        for cleaner in self.cleaners.values():
+            cleaner.set_time_budget(seconds)
+
+    @property
+    def now(self):
+        """When the run of the earliest cleaner started."""
+        return min(cleaner.now for cleaner in self.cleaners.values())
+
+    @property
+    def completed(self):
+        return all(cleaner.completed for cleaner in self.cleaners.values())
+
+    @property
+    def report(self):
+        return next(iter(self.cleaners.values())).report
+
+    @report.setter
+    def report(self, report):
+        """Every cleaner writes its rows to the same sink."""
+        for cleaner in self.cleaners.values():
+            cleaner.report = report
+
+    @property
+    def slack_notifier(self):
+        if self._slack_notifier is None:
+            from ecr_cleaner.notifier import SlackNotifier
+
+            self._slack_notifier = SlackNotifier(
+                slack_token=self.slack_token, metrics=self.metrics
+            )
+        return self._slack_notifier
+
+    def reset(self, now=None):
+        """Starts a new run of every cleaner, see `ECRCleaner.reset`."""
+        self.metrics = RunMetrics()
+        if self._slack_notifier is not None:
+            self._slack_notifier.metrics = self.metrics
+        for cleaner in self.cleaners.values():
+            cleaner.reset(now)
+        self._plan = None
+
+    def _for_each(self, function, keys=None):
+        """Calls `function(key, cleaner)` for every key in parallel, results by key."""
+
+        def run_key(key):
+            with self.metrics.phase(f"{self.phase}:{key}"):
+                return key, function(key, self.cleaners[key])
+
+        keys = list(self.cleaners) if keys is None else keys
+        with ThreadPoolExecutor(
+            max_workers=self.coordinator_workers or len(self.cleaners),
+            thread_name_prefix=self.thread_name_prefix,
+        ) as coordinators:
+            return dict(coordinators.map(run_key, keys))
+
+    @property
+    def plan(self):
+        """One plan for every key, repositories are prefixed with their key."""
+        if self._plan is None:
+            with self.metrics.phase("discovery"):
+                plans = self._for_each(lambda key, cleaner: cleaner.plan)
+            self._plan = CleanupPlan.merge(plans)
+        return self._plan
+
+    def run(self, plan=None):
+        if plan is None:
+            plan = self.plan
+        plan = ECRCleaner.prioritised(plan)
+
+        plans = plan.split()
+
+        cleaners = self.cleaners.values()
+        if not all(cleaner.plan_complete for cleaner in cleaners):
+            # the finished scans wait in their checkpoint for the others
+            for cleaner in cleaners:
+                if cleaner.plan_complete:
+                    cleaner.keep_scan()
+            logging.info("Out of time while scanning, the next run resumes the scan")
+            return self.emit_summary()
+
+        # a notice was sent by the run that started the deletion
+        if (
+            plan
+            and config.SLACK_ENABLED
+            and not all(cleaner.resuming_deletion for cleaner in cleaners)
+        ):
+            with self.metrics.phase("slack"):
+                self.slack_notifier.send_message(message=ECRCleaner.slack_message(plan))
+
+        # every cleaner applies its part, an empty one too so its checkpoint is cleared
+        with self.metrics.phase("deletion") if config.DELETE_ENABLED else nullcontext():
+            self._for_each(
+                lambda key, cleaner: cleaner.apply(
+                    plans.get(key, CleanupPlan({}, created_at=plan.created_at))
+                )
+            )
+
+        return self.emit_summary()
+
+    def emit_summary(self):
+        return self.metrics.emit(
+            emf=config.METRICS_EMF,
+            summary_file=config.METRICS_SUMMARY_FILE,
+            summary=self.summary(),
+        )
+
+    @abstractmethod
+    def summary(self):
+        """The run summary with the figures of every key, emitted and returned by `run`."""
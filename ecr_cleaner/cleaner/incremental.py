@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from .retention import DELETE, KEEP_AGE, KEEP_IN_USE_BY_DIGEST, KEEP_IN_USE_BY_TAG
+
+FINGERPRINT_MODULUS = 2**64
+
+
+def digest_fingerprint(image_digest):
+    return int.from_bytes(hashlib.sha256(image_digest.encode()).digest()[:8], "big")
+
+
+class RepositoryScanRecorder:
+    """
+    Collects the repository state while the retention decisions of a full scan stream past.
+
+    The fingerprint is a sum of per-digest hashes, so it does not depend on page order, needs
+    no list of digests in memory and can have deleted images subtracted from it later.
+    """
+
+    def __init__(self, keep_images_for):
+        self.keep_images_for = keep_images_for
+        self.image_count = 0
+        self.fingerprint = 0
+        self.last_pushed_at = None
+        self.age_expires_at = None
+        # images deleted unless they are in use, the in-use check is repeated on every run,
+        # with their size in bytes for the plan
+        self.candidates = {}
+
+    def record(self, decisions):
+        for image, decision in decisions:
+            image_pushed_at = image["imagePushedAt"]
+
+            self.image_count += 1
+            self.fingerprint = (
+                self.fingerprint + digest_fingerprint(image["imageDigest"])
+            ) % FINGERPRINT_MODULUS
+
+            if self.last_pushed_at is None or image_pushed_at > self.last_pushed_at:
+                self.last_pushed_at = image_pushed_at
+
+            if decision == KEEP_AGE:
+                expires_at = image_pushed_at + self.keep_images_for
+                if self.age_expires_at is None or expires_at < self.age_expires_at:
+                    self.age_expires_at = expires_at
+            elif decision in (DELETE, KEEP_IN_USE_BY_TAG, KEEP_IN_USE_BY_DIGEST):
+                self.candidates[image["imageDigest"]] = image.get("imageSizeInBytes", 0)
+
+            yield image, decision
+
+    def state(self, scanned_at, full_scan_interval):
+        revalidate_after = scanned_at + full_scan_interval
+        if self.age_expires_at is not None:
+            revalidate_after = min(revalidate_after, self.age_expires_at)
+
+        return {
+            "image_count": self.image_count,
+            "fingerprint": self.fingerprint,
+            "last_pushed_at": (
+                self.last_pushed_at.isoformat() if self.last_pushed_at else None
+            ),
+            "scanned_at": scanned_at.isoformat(),
+            "revalidate_after": revalidate_after.isoformat(),
+            "candidates": self.candidates,
+        }
+
+
+class RepositoryStateCache:
+    """
+    Per repository state kept between runs in a `Store`.
+
+    A repository whose images are unchanged since its last full scan is re-validated with
+    list_images (1000 image ids per call, no image details) instead of being described again.
+    Its previous candidates are reused with the in-use check applied again. A full scan happens
+    when the images changed, when a kept image gets older than the age cutoff, once
+    `full_scan_interval` has passed, or when the state was saved with other retention
+    settings, as its candidates would not be the same.
+    """
+
+    STORE_KEY = "repository-state"
+    VERSION = 2
+
+    def __init__(
+        self,
+        store,
+        keep_min_count,
+        keep_images_for,
+        full_scan_interval,
+        store_key=None,
+    ):
+        self.store = store
+        self.store_key = store_key or self.STORE_KEY
+        self.keep_images_for = keep_images_for
+        self.full_scan_interval = full_scan_interval
+        self.policy = {
+            "keep_min_count": keep_min_count,
+            "keep_images_newer_than_days": keep_images_for.days,
+        }
+
+        data = store.load(self.store_key) or {}
+        self._previous = (
+            data.get("repositories", {})
+            if data.get("version") == self.VERSION and data.get("policy") == self.policy
+            else {}
+        )
+        if data.get("repositories") and not self._previous:
+            logging.info(
+                "Ignoring repository state of another version or retention settings"
+            )
+        # repositories not scanned by this run, e.g. a resumed deletion or a saved plan, keep
+        # their state so deletions can still be taken out of it
+        self._current = {
+            repository_name: dict(state)
+            for repository_name, state in self._previous.items()
+        }
+        self._lock = threading.Lock()
+
+        self.revalidated = 0
+        self.rescanned = 0
+
+    def revalidate(self, ec_repo, ecr_manager, in_use_index, now, image_sizes=None):
+        """
+        Returns the images to delete from an unchanged repository, or None when the
+        repository has to be fully scanned again. The size of every image to delete is
+        added to `image_sizes`.
+        """
+        state = self._previous.get(ec_repo["name"])
+        if state is None or now >= datetime.fromisoformat(state["revalidate_after"]):
+            return None
+
+        candidates = state["candidates"]
+        candidate_tags = {}
+        image_digests = set()
+        fingerprint = 0
+
+        for image_id in ecr_manager.iter_repository_image_ids(ec_repo["name"]):
+            image_digest = image_id["imageDigest"]
+
+            if image_digest not in image_digests:
+                image_digests.add(image_digest)
+                fingerprint = (
+                    fingerprint + digest_fingerprint(image_digest)
+                ) % FINGERPRINT_MODULUS
+
+            if image_digest in candidates and "imageTag" in image_id:
+                candidate_tags.setdefault(image_digest, []).append(image_id["imageTag"])
+
+        if (
+            len(image_digests) != state["image_count"]
+            or fingerprint != state["fingerprint"]
+        ):
+            return None
+
+        with self._lock:
+            self._current[ec_repo["name"]] = state
+            self.revalidated += 1
+
+        images_to_delete = frozenset(
+            image_digest
+            for image_digest in candidates
+            if not in_use_index.is_in_use(
+                ec_repo["uri"],
+                image_digest,
+                image_tags=candidate_tags.get(image_digest, ()),
+            )
+        )
+        if image_sizes is not None:
+            image_sizes.update(
+                (image_digest, candidates[image_digest])
+                for image_digest in images_to_delete
+            )
+        return images_to_delete
+
+    def recorder(self):
+        return RepositoryScanRecorder(keep_images_for=self.keep_images_for)
+
+    def record(self, ec_repo, recorder, scanned_at):
+        with self._lock:
+            self._current[ec_repo["name"]] = recorder.state(
+                scanned_at, self.full_scan_interval
+            )
+            self.rescanned += 1
+
+    def forget_deleted(self, repository_name, image_digests):
+        """Takes deleted images out of the state, so the repository still looks unchanged next run."""
+        with self._lock:
+            state = self._current.get(repository_name)
+            if state is None:
+                return
+
+            deleted = set(image_digests)
+            state["candidates"] = {
+                image_digest: size
+                for image_digest, size in state["candidates"].items()
+                if image_digest not in deleted
+            }
+            state["image_count"] -= len(deleted)
+            state["fingerprint"] = (
+                state["fingerprint"]
+                - sum(digest_fingerprint(image_digest) for image_digest in deleted)
+            ) % FINGERPRINT_MODULUS
+
+    def invalidate(self, repository_name):
+        with self._lock:
+            self._current.pop(repository_name, None)
+
+    def retain(self, repository_names):
+        """Drops the state of repositories that are gone, once every repository was listed."""
+        repository_names = set(repository_names)
+        with self._lock:
+            self._current = {
+                repository_name: state
+                for repository_name, state in self._current.items()
+                if repository_name in repository_names
+            }
+
+    def save(self):
+        logging.info(
+            f"Repository state: {self.revalidated} re-validated, {self.rescanned} fully scanned"
+        )
+        with self._lock:
+            self.store.save(
+                self.store_key,
+                {
+                    "version": self.VERSION,
+                    "policy": self.policy,
+                    "repositories": self._current,
+                },
+            )
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from . import ECRCleaner
+from .fan_out import FanOutCleaner
+
+
+class MultiRegionCleaner(FanOutCleaner):
+    """
+    Runs one ECRCleaner per region in parallel, each with its own ECR and ECS clients, and
+    reports them as one account wide plan: a single Slack notice and a single run summary.
+    """
+
+    phase = "region"
+
+    def __init__(self, aws_regions, slack_token, region_workers=None):
+        super().__init__(slack_token, coordinator_workers=region_workers)
+        self.aws_regions = list(aws_regions)
+
+        self.cleaners = {
+            aws_region: ECRCleaner(
+                aws_region=aws_region,
+                slack_token=slack_token,
+                store_prefix=f"{aws_region}-",
+            )
+            for aws_region in self.aws_regions
+        }
+
+    def summary(self):
+        summary = self.metrics.summary()
+        summary["regions"] = {
+            aws_region: cleaner.metrics.summary()
+            for aws_region, cleaner in self.cleaners.items()
+        }
+        return summary
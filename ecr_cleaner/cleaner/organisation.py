@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+
+from ecr_cleaner import config
+from ecr_cleaner.helper import AssumedRoleSessions
+
+from . import ECRCleaner
+from .fan_out import FanOutCleaner
+
+
+class OrganisationCleaner(FanOutCleaner):
+    """
+    Cleans every account and region of an organisation in one run.
+
+    A role is assumed in each account and its STS credentials are cached until they expire.
+    Repository scans and deletions of every account go to one shared, bounded worker pool.
+    Each account and region is coordinated from a small separate pool, so coordinators that
+    wait on their repositories never hold a worker the repositories need. ECS discovery stays
+    off the shared pool for the same reason, scans wait on it: the clusters of each account
+    and region are read by its `ECSManager` on ECS_CLUSTER_WORKERS threads of its own. Plans
+    are merged with `<account>:<region>` keys.
+    """
+
+    phase = "account"
+    thread_name_prefix = "ecr-cleaner-account"
+
+    def __init__(
+        self,
+        account_ids,
+        role_name,
+        aws_regions,
+        slack_token,
+        workers=None,
+        account_workers=None,
+        sessions=None,
+    ):
+        super().__init__(
+            slack_token,
+            coordinator_workers=account_workers or config.ORGANISATION_ACCOUNT_WORKERS,
+        )
+        self.workers = workers or config.ORGANISATION_WORKERS
+        self.sessions = sessions or AssumedRoleSessions()
+        self.executor = self._create_executor()
+
+        for account_id in account_ids:
+            session = self.sessions.session(
+                f"arn:aws:iam::{account_id}:role/{role_name}"
+            )
+            for aws_region in aws_regions:
+                self.cleaners[f"{account_id}:{aws_region}"] = ECRCleaner(
+                    aws_region=aws_region,
+                    slack_token=slack_token,
+                    scan_workers=self.workers,
+                    session=session,
+                    executor=self.executor,
+                    store_prefix=f"{account_id}-{aws_region}-",
+                )
+
+    def _create_executor(self):
+        return ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="ecr-cleaner-worker"
+        )
+
+    def reset(self, now=None):
+        """
+        Starts a new run of every account, see `ECRCleaner.reset`. The assumed role sessions
+        are kept, the worker pool shut down by the previous run is replaced.
+        """
+        self.executor = self._create_executor()
+        for cleaner in self.cleaners.values():
+            cleaner.executor = self.executor
+        super().reset(now)
+
+    def run(self, plan=None):
+        try:
+            return super().run(plan)
+        finally:
+            self.executor.shutdown()
+
+    def summary(self):
+        summary = self.metrics.summary()
+        summary["accounts"] = {}
+
+        for key, cleaner in self.cleaners.items():
+            seconds = summary["phases"].get(f"account:{key}", 0.0)
+            items = cleaner.metrics.summary()["items"]
+            summary["accounts"][key] = {
+                "seconds": seconds,
+                "repositories": items.get("repositories_scanned", 0),
+                "images_described": items.get("images_described", 0),
+                "images_deleted": items.get("images_deleted", 0),
+                "images_per_second": (
+                    round(items.get("images_described", 0) / seconds, 1)
+                    if seconds
+                    else 0.0
+                ),
+            }
+
+        return summary
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime, timezone
+from math import ceil
+from types import MappingProxyType
+
+from ecr_cleaner.manager.ecr_manager import DELETE_BATCH_SIZE
+
+
+class CleanupPlan:
+    """
+    Images to delete per repository, computed once per run and shared by the CSV report,
+    the Slack notice and the deletion step. It can be saved and loaded again so a later
+    run can apply it without rediscovering anything.
+
+    `image_sizes` holds the size in bytes of the images to delete, by digest. Images whose
+    size is not known, e.g. in a plan saved without sizes, count as 0 bytes.
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self, repositories, created_at=None, aws_region=None, image_sizes=None
+    ):
+        self._repositories = MappingProxyType(
+            {
+                repository_name: frozenset(image_digests)
+                for repository_name, image_digests in repositories.items()
+                if image_digests
+            }
+        )
+        self._created_at = created_at or datetime.now(timezone.utc)
+        self._aws_region = aws_region
+        # the same digest in two repositories is the same image, with the same size
+        planned = set().union(*self._repositories.values()) if image_sizes else ()
+        self._image_sizes = MappingProxyType(
+            {
+                image_digest: size
+                for image_digest, size in (image_sizes or {}).items()
+                if image_digest in planned
+            }
+        )
+
+    @property
+    def repositories(self):
+        return self._repositories
+
+    @property
+    def created_at(self):
+        return self._created_at
+
+    @property
+    def aws_region(self):
+        return self._aws_region
+
+    @property
+    def image_sizes(self):
+        return self._image_sizes
+
+    @property
+    def total_delete(self):
+        return sum(len(image_digests) for image_digests in self._repositories.values())
+
+    def repository_bytes(self, repository_name):
+        return sum(
+            self._image_sizes.get(image_digest, 0)
+            for image_digest in self._repositories[repository_name]
+        )
+
+    @property
+    def total_bytes(self):
+        return sum(
+            self.repository_bytes(repository_name)
+            for repository_name in self._repositories
+        )
+
+    def prioritised(self, max_bytes=0, max_api_calls=0):
+        """
+        The plan with the repositories reclaiming the most bytes first, cut to at most
+        `max_bytes` and to `max_api_calls` batch_delete_image calls, 0 is no limit. The largest
+        images of a repository are picked first, one too large for the bytes left is passed
+        over for smaller ones.
+        """
+        repositories = {}
+        total_bytes = api_calls = 0
+
+        for repository_name in sorted(
+            self._repositories,
+            key=lambda name: (-self.repository_bytes(name), name),
+        ):
+            if max_api_calls and api_calls >= max_api_calls:
+                break
+
+            image_digests = sorted(
+                self._repositories[repository_name],
+                key=lambda image_digest: (
+                    -self._image_sizes.get(image_digest, 0),
+                    image_digest,
+                ),
+            )
+            if max_api_calls:
+                image_digests = image_digests[
+                    : (max_api_calls - api_calls) * DELETE_BATCH_SIZE
+                ]
+
+            selected = []
+            for image_digest in image_digests:
+                size = self._image_sizes.get(image_digest, 0)
+                if max_bytes and total_bytes + size > max_bytes:
+                    continue
+                selected.append(image_digest)
+                total_bytes += size
+
+            if selected:
+                repositories[repository_name] = selected
+                api_calls += ceil(len(selected) / DELETE_BATCH_SIZE)
+
+        return CleanupPlan(
+            repositories=repositories,
+            created_at=self._created_at,
+            aws_region=self._aws_region,
+            image_sizes=self._image_sizes,
+        )
+
+    def items(self):
+        return self._repositories.items()
+
+    @classmethod
+    def merge(cls, plans, created_at=None):
+        """
+        One plan out of plans keyed by region (or account), repositories are prefixed with
+        their key, `eu-west-2/my-repo`. `split` turns it back into the per key plans.
+        """
+        return cls(
+            repositories={
+                f"{key}/{repository_name}": image_digests
+                for key, plan in plans.items()
+                for repository_name, image_digests in plan.items()
+            },
+            created_at=created_at,
+            image_sizes={
+                image_digest: size
+                for plan in plans.values()
+                for image_digest, size in plan.image_sizes.items()
+            },
+        )
+
+    def split(self):
+        repositories = {}
+        for name, image_digests in self._repositories.items():
+            key, repository_name = name.split("/", 1)
+            repositories.setdefault(key, {})[repository_name] = image_digests
+
+        return {
+            key: CleanupPlan(
+                repositories=plan_repositories,
+                created_at=self._created_at,
+                image_sizes=self._image_sizes,
+            )
+            for key, plan_repositories in repositories.items()
+        }
+
+    def as_dict(self):
+        """
+        Plan in the `{repo: {"totalDelete", "delete"}}` shape used by earlier releases, with
+        the bytes to reclaim as `totalBytes`.
+        """
+        return {
+            repository_name: dict(
+                totalDelete=len(image_digests),
+                totalBytes=self.repository_bytes(repository_name),
+                delete=image_digests,
+            )
+            for repository_name, image_digests in self._repositories.items()
+        }
+
+    def to_json(self):
+        return {
+            "version": self.VERSION,
+            "created_at": self._created_at.isoformat(),
+            "aws_region": self._aws_region,
+            "repositories": {
+                repository_name: sorted(image_digests)
+                for repository_name, image_digests in self._repositories.items()
+            },
+            "image_sizes": dict(self._image_sizes),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get("version") != cls.VERSION:
+            raise ValueError(f"Unsupported cleanup plan version: {data.get('version')}")
+
+        return cls(
+            repositories=data["repositories"],
+            created_at=datetime.fromisoformat(data["created_at"]),
+            aws_region=data.get("aws_region"),
+            # plans saved before sizes were kept have none
+            image_sizes=data.get("image_sizes"),
+        )
+
+    def save(self, file_name):
+        with open(file_name, mode="w") as file:
+            json.dump(self.to_json(), file, indent=2)
+
+    @classmethod
+    def load(cls, file_name):
+        with open(file_name) as file:
+            return cls.from_json(json.load(file))
+
+    def __getitem__(self, repository_name):
+        return self._repositories[repository_name]
+
+    def __contains__(self, repository_name):
+        return repository_name in self._repositories
+
+    def __iter__(self):
+        return iter(self._repositories)
+
+    def __len__(self):
+        return len(self._repositories)
+
+    def __bool__(self):
+        return bool(self._repositories)
+
+    def __eq__(self, other):
+        if isinstance(other, CleanupPlan):
+            return dict(self._repositories) == dict(other._repositories)
+        return NotImplemented
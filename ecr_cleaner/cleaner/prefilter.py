@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from fnmatch import fnmatchcase
+
+from ecr_cleaner import config
+
+# why a repository is not described
+SKIP_NOT_INCLUDED = "not-included"
+SKIP_EXCLUDED = "excluded"
+SKIP_MIN_COUNT = "min-count"
+SKIP_LIFECYCLE_POLICY = "lifecycle-policy"
+
+
+class RepositoryFilter:
+    """
+    Skips repositories that cannot have anything to delete before they are described.
+
+    Name patterns cost nothing. Counting the images costs one list_images call, which lists
+    up to 1000 image ids, and the lifecycle policy check one get_lifecycle_policy call, so
+    both are only made when enabled.
+    """
+
+    def __init__(
+        self,
+        include=(),
+        exclude=(),
+        keep_min_count=0,
+        skip_small=False,
+        skip_lifecycle_policy=False,
+    ):
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.keep_min_count = keep_min_count
+        self.skip_small = skip_small
+        self.skip_lifecycle_policy = skip_lifecycle_policy
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            include=config.REPOSITORY_INCLUDE,
+            exclude=config.REPOSITORY_EXCLUDE,
+            keep_min_count=config.KEEP_MIN_IMAGE_COUNT,
+            skip_small=config.SKIP_SMALL_REPOSITORIES,
+            skip_lifecycle_policy=config.SKIP_LIFECYCLE_POLICY_REPOSITORIES,
+        )
+
+    def __bool__(self):
+        return bool(
+            self.include
+            or self.exclude
+            or self.skip_small
+            or self.skip_lifecycle_policy
+        )
+
+    def skip_reason(self, repository_name, ecr_manager):
+        """
+        Returns why the repository is skipped, None when it has to be described, with the
+        number of API calls made to decide.
+        """
+        if self.include and not any(
+            fnmatchcase(repository_name, pattern) for pattern in self.include
+        ):
+            return SKIP_NOT_INCLUDED, 0
+        if any(fnmatchcase(repository_name, pattern) for pattern in self.exclude):
+            return SKIP_EXCLUDED, 0
+
+        api_calls = 0
+        if self.skip_lifecycle_policy:
+            api_calls += 1
+            if ecr_manager.has_lifecycle_policy(repository_name):
+                return SKIP_LIFECYCLE_POLICY, api_calls
+        if self.skip_small:
+            api_calls += 1
+            image_count = ecr_manager.count_repository_images(
+                repository_name, up_to=self.keep_min_count
+            )
+            if image_count <= self.keep_min_count:
+                return SKIP_MIN_COUNT, api_calls
+
+        return None, api_calls
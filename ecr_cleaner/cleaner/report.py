@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import csv
+import gzip
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from .retention import DELETE, KEEP_IN_USE_BY_DIGEST, KEEP_IN_USE_BY_TAG
+
+REPORT_FIELDS = [
+    "repository_uri",
+    "image_digest",
+    "image_tags",
+    "image_pushed_at",
+    "image_size_bytes",
+    "decision",
+    "reason",
+    "in_use_refs",
+]
+
+# the image fields report rows and catalogues are made of
+REPORT_IMAGE_FIELDS = (
+    "imageDigest",
+    "imageTags",
+    "imageTag",
+    "imagePushedAt",
+    "imageSizeInBytes",
+)
+
+
+def report_row(repository_uri, image, decision, in_use_index):
+    """One report row for an image and the retention decision made for it."""
+    image_tags = image.get("imageTags") or (
+        [image["imageTag"]] if image.get("imageTag") else []
+    )
+
+    in_use_refs = []
+    if decision == KEEP_IN_USE_BY_DIGEST:
+        in_use_refs = [f"{repository_uri}@{image['imageDigest']}"]
+    elif decision == KEEP_IN_USE_BY_TAG:
+        in_use_tags = in_use_index.get(repository_uri)["tags"]
+        in_use_refs = [
+            f"{repository_uri}:{image_tag}"
+            for image_tag in image_tags
+            if image_tag in in_use_tags
+        ]
+
+    image_pushed_at = image.get("imagePushedAt")
+    return {
+        "repository_uri": repository_uri,
+        "image_digest": image["imageDigest"],
+        "image_tags": image_tags,
+        "image_pushed_at": (
+            image_pushed_at.isoformat()
+            if isinstance(image_pushed_at, datetime)
+            else image_pushed_at
+        ),
+        "image_size_bytes": image.get("imageSizeInBytes"),
+        "decision": "delete" if decision == DELETE else "keep",
+        "reason": "" if decision == DELETE else decision,
+        "in_use_refs": in_use_refs,
+    }
+
+
+class ReportSink(ABC):
+    """
+    Writes report rows to a file as they come, one per evaluated image, so memory does not
+    grow with the report. The cleaner adds the rows of a repository once it was fully
+    scanned. Scan workers share a sink, writes are serialised. Files ending in `.gz` are
+    gzipped.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        opener = gzip.open if file_name.endswith(".gz") else open
+        self.file = opener(file_name, mode="wt", newline="")
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def add(self, repository_uri, image, decision, in_use_index):
+        self.write(report_row(repository_uri, image, decision, in_use_index))
+
+    def write(self, row):
+        with self._lock:
+            self._write(row)
+            self.rows += 1
+
+    @abstractmethod
+    def _write(self, row):
+        """Writes one row to `file`, called with the lock held."""
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvReportSink(ReportSink):
+    """Lists are joined with spaces, tags and image references never contain one."""
+
+    def __init__(self, file_name):
+        super().__init__(file_name)
+        self.writer = csv.DictWriter(self.file, fieldnames=REPORT_FIELDS)
+        self.writer.writeheader()
+
+    def _write(self, row):
+        self.writer.writerow(
+            {
+                field: " ".join(value) if isinstance(value, list) else value
+                for field, value in row.items()
+            }
+        )
+
+
+class JsonLinesReportSink(ReportSink):
+    def _write(self, row):
+        self.file.write(json.dumps(row, separators=(",", ":")))
+        self.file.write("\n")
+
+
+class ReportSinks:
+    """Several sinks fed the same decisions, e.g. a report and a `catalogue.CatalogueSink`."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def add(self, repository_uri, image, decision, in_use_index):
+        for sink in self.sinks:
+            sink.add(repository_uri, image, decision, in_use_index)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def get_report_sink(file_name):
+    """A sink for `report.csv`, `report.jsonl`, or either one gzipped, `report.jsonl.gz`."""
+    name = file_name[: -len(".gz")] if file_name.endswith(".gz") else file_name
+    if name.endswith(".csv"):
+        return CsvReportSink(file_name)
+    if name.endswith((".jsonl", ".ndjson")):
+        return JsonLinesReportSink(file_name)
+    raise ValueError(f"Unsupported report file: {file_name}, use .csv or .jsonl")
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import heapq
+
+# the decision made for every image, the first reason that applies wins
+KEEP_MIN_COUNT = "min-count"
+KEEP_AGE = "age"
+KEEP_IN_USE_BY_TAG = "in-use-by-tag"
+KEEP_IN_USE_BY_DIGEST = "in-use-by-digest"
+DELETE = "delete"
+
+
+class RetentionPolicy:
+    """
+    Decides which images of a repository can be deleted.
+
+    The `keep_min_count` most recently pushed images are always kept, whatever order
+    describe_images returns them in. They are tracked in a min-heap of that size, so a single
+    pass over the images is enough and only the heap is held in memory. An image is yielded
+    as a deletion candidate as soon as it is known not to be one of the newest, not to be
+    newer than the age cutoff and not to be in use.
+    """
+
+    def __init__(self, keep_min_count, keep_images_newer_than):
+        self.keep_min_count = keep_min_count
+        self.keep_images_newer_than = keep_images_newer_than
+
+    def evaluate(self, repository_uri, images, in_use_index):
+        """Yields `(image, decision)` for every image, as soon as the decision is final."""
+        evaluation = self.evaluation(repository_uri, in_use_index)
+        yield from evaluation.decide(images)
+        yield from evaluation.finish()
+
+    def evaluation(self, repository_uri, in_use_index):
+        """A `RetentionEvaluation` of one repository, its images can be fed in batches."""
+        return RetentionEvaluation(self, repository_uri, in_use_index)
+
+    def images_to_delete(self, repository_uri, images, in_use_index):
+        for image, decision in self.evaluate(repository_uri, images, in_use_index):
+            if decision == DELETE:
+                yield image["imageDigest"]
+
+
+class RetentionEvaluation:
+    """
+    The decisions of `RetentionPolicy.evaluate` for the images of one repository fed in any
+    number of batches, e.g. one describe_images page at a time as it comes in.
+    """
+
+    def __init__(self, policy, repository_uri, in_use_index):
+        self.policy = policy
+        self.repository_uri = repository_uri
+        self.in_use_index = in_use_index
+        # (imagePushedAt, imageDigest, decision, image), the digest breaks ties between images
+        # pushed at the same time so the result does not depend on page order
+        self.newest_images = []
+
+    def decide(self, images):
+        """Yields `(image, decision)` for the images whose decision is final."""
+        newest_images = self.newest_images
+        keep_min_count = self.policy.keep_min_count
+        keep_images_newer_than = self.policy.keep_images_newer_than
+
+        for image in images:
+            image_digest = image["imageDigest"]
+            image_pushed_at = image["imagePushedAt"]
+
+            if image_pushed_at >= keep_images_newer_than:
+                decision = KEEP_AGE
+            else:
+                # images referenced by a running task with one of their tags or with their digest,
+                # an image can be referenced by digest whether or not it has tags
+                decision = {
+                    "tag": KEEP_IN_USE_BY_TAG,
+                    "digest": KEEP_IN_USE_BY_DIGEST,
+                    None: DELETE,
+                }[
+                    self.in_use_index.match(
+                        self.repository_uri,
+                        image_digest,
+                        image_tags=image.get("imageTags") or (),
+                        image_tag=image.get("imageTag"),
+                    )
+                ]
+            entry = (image_pushed_at, image_digest, decision, image)
+
+            if len(newest_images) < keep_min_count:
+                heapq.heappush(newest_images, entry)
+                continue
+
+            if newest_images and entry[:2] > newest_images[0][:2]:
+                # this image is one of the newest so far, the oldest of them drops out
+                entry = heapq.heapreplace(newest_images, entry)
+
+            yield entry[3], entry[2]
+
+    def finish(self):
+        """Yields the newest images once every image was fed, they are kept whatever applies."""
+        for entry in self.newest_images:
+            yield entry[3], KEEP_MIN_COUNT
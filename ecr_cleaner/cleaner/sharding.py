@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import repeat
+
+from ecr_cleaner import config
+from ecr_cleaner.helper import shard_of
+from ecr_cleaner.manager import InventorySnapshot
+from ecr_cleaner.store import get_store
+
+from . import ECRCleaner
+from .plan import CleanupPlan
+
+
+class ShardReports:
+    """
+    What the shards of a run share through a `Store`: the run's clock and ECS inventory, set
+    once by the coordinator, and the plan of every shard. Shard plans carry the run's
+    timestamp, so a plan left by an earlier run is never merged into the current one.
+    """
+
+    RUN_KEY = "shard-run"
+
+    def __init__(self, store, aws_region, shard_count):
+        self.store = store
+        self.aws_region = aws_region
+        self.shard_count = shard_count
+
+    def _run_key(self):
+        return f"{self.aws_region}-{self.RUN_KEY}"
+
+    def _shard_key(self, shard_index):
+        return f"{self.aws_region}-shard-{shard_index}-of-{self.shard_count}"
+
+    def save_inventory(self, created_at, snapshot):
+        self.store.save(
+            self._run_key(),
+            {"created_at": created_at.isoformat(), "inventory": snapshot.to_json()},
+        )
+
+    def start_run(self, created_at):
+        """Starts a run that applies a saved plan, it has no inventory to plan shards with."""
+        self.store.save(
+            self._run_key(), {"created_at": created_at.isoformat(), "inventory": None}
+        )
+
+    def load_inventory(self):
+        """Returns when the run started and the in-use images."""
+        data = self.store.load(self._run_key())
+        if data is None or data["inventory"] is None:
+            raise ValueError(
+                f"No ECS inventory for {self.aws_region}, run the prepare step first"
+            )
+        snapshot = InventorySnapshot.from_json(data["inventory"])
+        return datetime.fromisoformat(data["created_at"]), snapshot.in_use_images
+
+    def run_created_at(self):
+        data = self.store.load(self._run_key())
+        if data is None:
+            raise ValueError(
+                f"No run for {self.aws_region}, run the prepare step first"
+            )
+        return datetime.fromisoformat(data["created_at"])
+
+    def save_plan(self, shard_index, plan):
+        self.store.save(self._shard_key(shard_index), plan.to_json())
+
+    def load_plan(self, shard_index):
+        data = self.store.load(self._shard_key(shard_index))
+        return CleanupPlan.from_json(data) if data is not None else None
+
+    def save_plans(self, plan):
+        """Splits a plan of the whole region, e.g. a saved plan, into the shard plans."""
+        repositories = [{} for _ in range(self.shard_count)]
+        for repository_name, image_digests in plan.items():
+            repositories[shard_of(repository_name, self.shard_count)][
+                repository_name
+            ] = image_digests
+
+        for shard_index, shard_repositories in enumerate(repositories):
+            self.save_plan(
+                shard_index,
+                CleanupPlan(
+                    repositories=shard_repositories,
+                    created_at=plan.created_at,
+                    aws_region=self.aws_region,
+                    image_sizes=plan.image_sizes,
+                ),
+            )
+
+    def merged_plan(self):
+        """One plan out of the shard plans, shards own disjoint sets of repositories."""
+        created_at, _ = self.load_inventory()
+
+        repositories = {}
+        image_sizes = {}
+        missing = []
+        for shard_index in range(self.shard_count):
+            plan = self.load_plan(shard_index)
+            if plan is None or plan.created_at != created_at:
+                missing.append(shard_index)
+                continue
+            repositories.update(plan.repositories)
+            image_sizes.update(plan.image_sizes)
+
+        if missing:
+            raise ValueError(f"No plan from shards {missing} of {self.aws_region}")
+
+        return CleanupPlan(
+            repositories=repositories,
+            created_at=created_at,
+            aws_region=self.aws_region,
+            image_sizes=image_sizes,
+        )
+
+
+def shard_cleaner(aws_region, shard_index, shard_count):
+    return ECRCleaner(
+        aws_region=aws_region,
+        slack_token=config.SLACK_TOKEN,
+        store_prefix=f"{aws_region}-shard-{shard_index}-of-{shard_count}-",
+        shard_index=shard_index,
+        shard_count=shard_count,
+    )
+
+
+def plan_shard(aws_region, shard_index, shard_count):
+    """Plans one shard with the shared ECS inventory, in a worker process or a Lambda."""
+    reports = ShardReports(get_store(config.STATE_STORE), aws_region, shard_count)
+    created_at, in_use_images = reports.load_inventory()
+
+    cleaner = shard_cleaner(aws_region, shard_index, shard_count)
+    # every shard judges image ages against the same clock
+    cleaner.reset(now=created_at)
+    cleaner.in_use_images = in_use_images
+
+    reports.save_plan(shard_index, cleaner.plan)
+    return cleaner.metrics.summary()
+
+
+def delete_shard(aws_region, shard_index, shard_count):
+    """
+    Deletes the plan of one shard, in a worker process or a Lambda. A plan left by an earlier
+    run, e.g. when the plan step of this one failed, is refused.
+    """
+    reports = ShardReports(get_store(config.STATE_STORE), aws_region, shard_count)
+    created_at = reports.run_created_at()
+    plan = reports.load_plan(shard_index)
+    if plan is not None and plan.created_at != created_at:
+        raise ValueError(
+            f"The plan of shard {shard_index} of {aws_region} is from an earlier run, "
+            f"run the plan step first"
+        )
+
+    cleaner = shard_cleaner(aws_region, shard_index, shard_count)
+    if plan:
+        results = cleaner.delete_old_images(plan=plan)
+        if cleaner.repository_state is not None:
+            cleaner._update_repository_state(plan, results)
+    return cleaner.metrics.summary()
+
+
+class ShardedCleaner:
+    """
+    Splits the repositories of a region into `shard_count` shards by a hash of their name.
+
+    The ECS inventory is computed once and kept in STATE_STORE. Every shard is then planned,
+    and later deleted, by its own worker process using that inventory. The shard plans are
+    merged into one plan, one Slack notice and one run summary. The same steps can be spread
+    over Lambda invocations with `run_step`.
+    """
+
+    def __init__(
+        self, aws_region, slack_token, shard_count, workers=None, processes=True
+    ):
+        self.aws_region = aws_region
+        self.shard_count = shard_count
+        self.workers = workers or config.SHARD_WORKERS
+        self.executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+
+        self.coordinator = ECRCleaner(aws_region=aws_region, slack_token=slack_token)
+        self.reports = ShardReports(
+            get_store(config.STATE_STORE), aws_region, shard_count
+        )
+        self.shards = {}
+        self._plan = None
+
+    @property
+    def metrics(self):
+        return self.coordinator.metrics
+
+    @property
+    def now(self):
+        return self.coordinator.now
+
+    @property
+    def completed(self):
+        return True
+
+    def reset(self, now=None):
+        self.coordinator.reset(now)
+        self.shards = {}
+        self._plan = None
+
+    def set_time_budget(self, seconds):
+        logging.warning("Sharded runs have no time budget, run the shards as steps")
+
+    @property
+    def report(self):
+        return None
+
+    @report.setter
+    def report(self, report):
+        if report is not None:
+            logging.warning(
+                "Shards are planned in other processes, no report is written"
+            )
+
+    def prepare(self):
+        with self.metrics.phase("ecs_discovery"):
+            snapshot = self.coordinator.inventory_snapshot()
+        self.reports.save_inventory(self.coordinator.now, snapshot)
+
+    def _for_each_shard(self, step):
+        with self.executor_class(max_workers=self.workers) as executor:
+            summaries = executor.map(
+                step,
+                repeat(self.aws_region),
+                range(self.shard_count),
+                repeat(self.shard_count),
+            )
+            return dict(enumerate(summaries))
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            self.prepare()
+            with self.metrics.phase("shard_plans"):
+                self.shards["plan"] = self._for_each_shard(plan_shard)
+            self._plan = self.reports.merged_plan()
+        return self._plan
+
+    def run(self, plan=None):
+        if plan is None:
+            plan = self.plan
+        else:
+            # the shard plans of a saved plan carry its timestamp
+            self.reports.start_run(plan.created_at)
+        prioritised = ECRCleaner.prioritised(plan)
+        if prioritised is not self._plan:
+            self.reports.save_plans(prioritised)
+        plan = prioritised
+
+        self.metrics.add("images_to_delete", plan.total_delete)
+        self.metrics.add("bytes_to_delete", plan.total_bytes)
+
+        if plan:
+            if config.SLACK_ENABLED:
+                self.coordinator.send_slack_notice(plan=plan)
+            if config.DELETE_ENABLED:
+                with self.metrics.phase("shard_deletion"):
+                    self.shards["delete"] = self._for_each_shard(delete_shard)
+
+        return self.coordinator.emit_summary(self.summary())
+
+    def summary(self):
+        summary = self.metrics.summary()
+
+        items = Counter(summary["items"])
+        for step_summaries in self.shards.values():
+            for shard_summary in step_summaries.values():
+                items.update(shard_summary["items"])
+        summary["items"] = dict(items)
+        summary["shards"] = self.shards
+        return summary
+
+
+def run_step(step, aws_region, shard_count, shard_index=None):
+    """
+    One step of a sharded run, for runs spread over Lambda invocations: `prepare` once, `plan`
+    for every shard, `notify` once with the merged plan, then `delete` for every shard. The
+    `notify` step cuts the shard plans to the deletion budget, as `ShardedCleaner.run` does.
+    """
+    if step == "plan":
+        return plan_shard(aws_region, shard_index, shard_count)
+    if step == "delete":
+        return delete_shard(aws_region, shard_index, shard_count)
+
+    cleaner = ShardedCleaner(
+        aws_region=aws_region, slack_token=config.SLACK_TOKEN, shard_count=shard_count
+    )
+    if step == "prepare":
+        cleaner.prepare()
+    elif step == "notify":
+        plan = cleaner.reports.merged_plan()
+        prioritised = ECRCleaner.prioritised(plan)
+        if prioritised is not plan:
+            # the delete steps apply the shard plans cut to the deletion budget
+            cleaner.reports.save_plans(prioritised)
+        plan = prioritised
+        if plan and config.SLACK_ENABLED:
+            cleaner.coordinator.send_slack_notice(plan=plan)
+        cleaner.metrics.add("images_to_delete", plan.total_delete)
+        cleaner.metrics.add("bytes_to_delete", plan.total_bytes)
+    else:
+        raise ValueError(f"Unknown shard step: {step}")
+    return cleaner.metrics.summary()
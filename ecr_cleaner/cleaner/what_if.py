@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Tries retention settings against an image catalogue saved with CATALOGUE_FILE, offline, and
+reports the images and bytes every combination of minimum count and age would delete.
+
+    python -m ecr_cleaner.cleaner.what_if catalogue.npz --keep-min 1,3,5,10 --days 7,14,30,90
+"""
+import argparse
+import json
+
+from ecr_cleaner import config
+
+from .catalogue import ImageCatalogue
+
+
+def integers(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("catalogue")
+    parser.add_argument(
+        "--keep-min",
+        type=integers,
+        default=[config.KEEP_MIN_IMAGE_COUNT],
+        help="comma separated KEEP_MIN_IMAGE_COUNT values",
+    )
+    parser.add_argument(
+        "--days",
+        type=integers,
+        default=[config.KEEP_IMAGES_NEWER_THAN_DAYS],
+        help="comma separated KEEP_IMAGES_NEWER_THAN_DAYS values",
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    catalogue = ImageCatalogue.load(args.catalogue)
+    results = catalogue.what_if(args.keep_min, args.days)
+
+    print(
+        f"{len(catalogue)} images in {len(catalogue.repositories)} repositories, "
+        f"scanned at {catalogue.created_at.isoformat()}"
+    )
+    print(f"{'keep min':>8} {'days':>6} {'images':>10} {'GB':>10}")
+    for result in results:
+        print(
+            f"{result['keep_min_count']:>8} {result['keep_images_newer_than_days']:>6} "
+            f"{result['images_to_delete']:>10} "
+            f"{result['bytes_to_delete'] / 1024**3:>10.2f}"
+        )
+
+    if args.output:
+        with open(args.output, mode="w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,120 @@ def str_to_bool(value):
 
 
 AWS_REGION = os.getenv("AWS_REGION", "eu-west-2")
+# comma separated, more than one region runs every region in parallel and reports them together
+AWS_REGIONS = [
+    region.strip()
+    for region in os.getenv("AWS_REGIONS", AWS_REGION).split(",")
+    if region.strip()
+]
 SLACK_TOKEN = os.getenv("SLACK_TOKEN", "MY_TOKEN")
 SLACK_CHANNEL = os.getenv("SLACK_CHANNEL", "MY_CHANNEL")
 KEEP_MIN_IMAGE_COUNT = int(os.getenv("KEEP_MIN_IMAGE_COUNT", 3))
 KEEP_IMAGES_NEWER_THAN_DAYS = int(os.getenv("KEEP_IMAGES_NEWER_THAN_DAYS", 7))
 SLACK_MAX_MESSAGE_LENGTH = int(os.getenv("SLACK_MAX_MESSAGE_LENGTH", 4000))
+# reports longer than this many characters are uploaded as one file instead of a thread (0 never uploads)
+SLACK_UPLOAD_THRESHOLD = int(os.getenv("SLACK_UPLOAD_THRESHOLD", 40000))
+# seconds between the messages of a thread, and retries of a rate limited call after its Retry-After
+SLACK_POST_INTERVAL_SECONDS = float(os.getenv("SLACK_POST_INTERVAL_SECONDS", 1))
+SLACK_MAX_RETRIES = int(os.getenv("SLACK_MAX_RETRIES", 3))
+# comma separated fnmatch patterns of repository names, only included and not excluded ones are scanned
+REPOSITORY_INCLUDE = [
+    pattern.strip()
+    for pattern in os.getenv("REPOSITORY_INCLUDE", "").split(",")
+    if pattern.strip()
+]
+REPOSITORY_EXCLUDE = [
+    pattern.strip()
+    for pattern in os.getenv("REPOSITORY_EXCLUDE", "").split(",")
+    if pattern.strip()
+]
+# one list_images / get_lifecycle_policy call per repository to skip describing repositories that
+# have no more than KEEP_MIN_IMAGE_COUNT images / are cleaned by an ECR lifecycle policy
+SKIP_SMALL_REPOSITORIES = str_to_bool(os.getenv("SKIP_SMALL_REPOSITORIES", "false"))
+SKIP_LIFECYCLE_POLICY_REPOSITORIES = str_to_bool(
+    os.getenv("SKIP_LIFECYCLE_POLICY_REPOSITORIES", "false")
+)
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", 1))
+ECS_CLUSTER_WORKERS = int(os.getenv("ECS_CLUSTER_WORKERS", 1))
+DELETE_WORKERS = int(os.getenv("DELETE_WORKERS", 1))
+DELETE_RATE_LIMIT = float(os.getenv("DELETE_RATE_LIMIT", 0))
+DELETE_MAX_RETRIES = int(os.getenv("DELETE_MAX_RETRIES", 3))
+DELETE_RETRY_BACKOFF_SECONDS = float(os.getenv("DELETE_RETRY_BACKOFF_SECONDS", 1))
+# delete the repositories reclaiming the most bytes first, and at most DELETE_MAX_GB or
+# DELETE_MAX_API_CALLS batch_delete_image calls per run (0 is no limit, either limit implies largest first)
+DELETE_LARGEST_FIRST = str_to_bool(os.getenv("DELETE_LARGEST_FIRST", "false"))
+DELETE_MAX_GB = float(os.getenv("DELETE_MAX_GB", 0))
+DELETE_MAX_API_CALLS = int(os.getenv("DELETE_MAX_API_CALLS", 0))
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", 10))
+# every boto3 client gets at least this many pooled connections, more when more workers use it
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", 10))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", 5))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", 60))
+
+# the async backend runs every page fetch, task definition lookup and delete batch as a coroutine,
+# with at most ASYNC_CONCURRENCY calls in flight and per API limits, "describe_images=20,batch_delete_image=5"
+ASYNC_BACKEND = str_to_bool(os.getenv("ASYNC_BACKEND", "false"))
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", 32))
+ASYNC_RATE_LIMITS = {
+    operation.strip(): float(calls_per_second)
+    for operation, _, calls_per_second in (
+        limit.partition("=")
+        for limit in os.getenv("ASYNC_RATE_LIMITS", "").split(",")
+        if limit.strip()
+    )
+}
 
 DELETE_ENABLED = str_to_bool(os.getenv("DELETE_ENABLED", "false"))
 SLACK_ENABLED = str_to_bool(os.getenv("SLACK_ENABLED", "false"))
+OVERLAP_DISCOVERY = str_to_bool(os.getenv("OVERLAP_DISCOVERY", "false"))
+
+# when set, run_cleaner applies a saved plan instead of running discovery / saves the plan it computed
+CLEANUP_PLAN_INPUT = os.getenv("CLEANUP_PLAN_INPUT")
+CLEANUP_PLAN_OUTPUT = os.getenv("CLEANUP_PLAN_OUTPUT")
+# report with a row for every evaluated image, its decision and reason: .csv or .jsonl, .gz to compress
+REPORT_FILE = os.getenv("REPORT_FILE")
+# .npz columnar catalogue of every evaluated image, for offline what-if analysis of retention settings
+CATALOGUE_FILE = os.getenv("CATALOGUE_FILE")
+
+# incremental mode keeps per repository state between runs and skips describing unchanged repositories
+INCREMENTAL_SCAN = str_to_bool(os.getenv("INCREMENTAL_SCAN", "false"))
+INCREMENTAL_FULL_SCAN_HOURS = int(os.getenv("INCREMENTAL_FULL_SCAN_HOURS", 168))
+# local directory or s3://bucket/prefix
+STATE_STORE = os.getenv("STATE_STORE", ".ecr_cleaner_state")
+
+# with a time budget (the remaining Lambda time) a run stops this long before the deadline and
+# keeps a checkpoint in STATE_STORE that the next run resumes from
+TIME_BUDGET_MARGIN_SECONDS = int(os.getenv("TIME_BUDGET_MARGIN_SECONDS", 60))
+# a checkpoint older than this is ignored, its ECS inventory and images to delete may be out of date
+CHECKPOINT_MAX_AGE_MINUTES = int(os.getenv("CHECKPOINT_MAX_AGE_MINUTES", 60))
+
+# images of ECS services (scaled to zero, deployments in flight) are kept as well as those of running
+# tasks unless ECS_PROTECT_SERVICES is false, and the ECS_ACTIVE_REVISIONS most recent ACTIVE revisions of every task definition family (0 disables)
+ECS_PROTECT_SERVICES = str_to_bool(os.getenv("ECS_PROTECT_SERVICES", "true"))
+ECS_ACTIVE_REVISIONS = int(os.getenv("ECS_ACTIVE_REVISIONS", 0))
+
+# an ECS inventory snapshot younger than this many minutes is reused instead of walking every
+# cluster again (0 disables snapshots), it is kept in STATE_STORE or in ECS_INVENTORY_FILE (.gz to compress)
+ECS_INVENTORY_TTL_MINUTES = int(os.getenv("ECS_INVENTORY_TTL_MINUTES", 0))
+ECS_INVENTORY_FILE = os.getenv("ECS_INVENTORY_FILE")
+
+# sharded runs split the repositories into SHARD_COUNT shards by a hash of their name, every shard
+# is planned and deleted by its own process (or Lambda) sharing one ECS inventory in STATE_STORE
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", SHARD_COUNT))
+
+# a JSON run summary is always logged, it can also be written to a file and emitted as CloudWatch EMF
+METRICS_SUMMARY_FILE = os.getenv("METRICS_SUMMARY_FILE")
+METRICS_EMF = str_to_bool(os.getenv("METRICS_EMF", "false"))
+
+# organisation mode assumes ORGANISATION_ROLE_NAME in every account and shares one worker pool between them
+ORGANISATION_ACCOUNT_IDS = [
+    account_id.strip()
+    for account_id in os.getenv("ORGANISATION_ACCOUNT_IDS", "").split(",")
+    if account_id.strip()
+]
+ORGANISATION_ROLE_NAME = os.getenv("ORGANISATION_ROLE_NAME", "ecr-cleaner")
+# repository scans and deletions of every account share ORGANISATION_WORKERS threads, each account
+# and region reads its ECS clusters on ECS_CLUSTER_WORKERS threads of its own
+ORGANISATION_WORKERS = int(os.getenv("ORGANISATION_WORKERS", 32))
+ORGANISATION_ACCOUNT_WORKERS = int(os.getenv("ORGANISATION_ACCOUNT_WORKERS", 8))
@@ -1,18 +1,198 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import os
+import threading
+import time
+from itertools import islice
 
 import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import (
+    AssumeRoleCredentialFetcher,
+    CredentialProvider,
+    CredentialResolver,
+    DeferredRefreshableCredentials,
+)
+from botocore.exceptions import ClientError
 
+from ecr_cleaner import config
 
-def get_aws_client(service_name, region_name=None, profile_name=None):
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+}
+
+
+_clients = {}
+_sessions = {}
+_clients_lock = threading.Lock()
+
+
+def get_aws_client(
+    service_name,
+    region_name=None,
+    profile_name=None,
+    session=None,
+    max_pool_connections=None,
+):
+    """
+    A boto3 client tuned for concurrent use: adaptive retries, connect and read timeouts and a
+    connection pool big enough for `max_pool_connections` threads. Clients are thread safe
+    and cached per service, region, session and pool size for the life of the process, so
+    warm Lambda invocations reuse them instead of resolving credentials and endpoints again.
+
+    Clients are made from `session` when given, e.g. an assumed role in another account,
+    otherwise from the default credentials in Lambda or from `profile_name` locally.
+    """
+    if session is None and (os.getenv("LAMBDA_TASK_ROOT") or os.getenv("RUN_TEST")):
+        # Running in AWS Lambda: credentials are managed by Lambda
+        profile_name = None
+    max_pool_connections = max(
+        max_pool_connections or 0, config.AWS_MAX_POOL_CONNECTIONS
+    )
+    key = (service_name, region_name, session or profile_name, max_pool_connections)
+
+    with _clients_lock:
+        if key not in _clients:
+            if session is None:
+                # sessions are not thread safe, one is made per profile and only used here
+                if profile_name not in _sessions:
+                    _sessions[profile_name] = boto3.session.Session(
+                        profile_name=profile_name
+                    )
+                client_session = _sessions[profile_name]
+            else:
+                client_session = session
+
+            _clients[key] = client_session.client(
+                service_name,
+                region_name=region_name,
+                config=Config(
+                    retries={
+                        "mode": "adaptive",
+                        "max_attempts": config.AWS_MAX_ATTEMPTS,
+                    },
+                    max_pool_connections=max_pool_connections,
+                    connect_timeout=config.AWS_CONNECT_TIMEOUT,
+                    read_timeout=config.AWS_READ_TIMEOUT,
+                ),
+            )
+        return _clients[key]
+
+
+def clear_aws_clients():
+    with _clients_lock:
+        _clients.clear()
+        _sessions.clear()
+
+
+def chunked_iterable(iterable, size):
+    """Yield successive n-sized chunks from the iterable."""
+    iterator = iter(iterable)
+    for first in iterator:
+        yield [first] + list(islice(iterator, size - 1))
+
+
+def shard_of(name, shard_count):
+    """The shard a name belongs to, stable across processes and runs unlike hash()."""
+    digest = hashlib.sha256(name.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def is_throttling_error(error):
+    return (
+        isinstance(error, ClientError)
+        and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    )
+
+
+class RateLimiter:
+    """
+    Spaces calls out so no more than `calls_per_second` are made, shared by every thread
+    using the same limiter. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, calls_per_second):
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0.0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def reserve(self):
+        """Takes the next call slot and returns how many seconds to wait for it."""
+        if not self.interval:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        return delay
+
+
+class AssumedRoleProvider(CredentialProvider):
+    """The only credential provider of an `AssumedRoleSessions` session."""
+
+    METHOD = "sts-assume-role"
+    CANONICAL_NAME = "ecr-cleaner-assume-role"
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def load(self):
+        return self.credentials
+
+
+class AssumedRoleSessions:
     """
-    Dynamically chooses between boto3.client() for Lambda and boto3.session.Session() for local execution.
-    If running locally, allows specifying an AWS profile.
+    boto3 sessions for roles in other accounts, one per role ARN. The STS credentials are
+    cached by the session and only requested again when they are about to expire, so
+    clients made from a session keep working through long runs.
     """
-    if os.getenv("LAMBDA_TASK_ROOT"):
-        # Running in AWS Lambda: use the default boto3.client() (credentials are managed by Lambda)
-        return boto3.client(service_name, region_name=region_name)
-    else:
-        # Running locally: create a session with an optional profile
-        session = boto3.session.Session(profile_name=profile_name)
-        return session.client(service_name, region_name=region_name)
+
+    def __init__(
+        self, base_session=None, session_name="ecr-cleaner", duration_seconds=3600
+    ):
+        self.base_session = base_session or boto3.session.Session()
+        self.session_name = session_name
+        self.duration_seconds = duration_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, role_arn):
+        with self._lock:
+            if role_arn not in self._sessions:
+                self._sessions[role_arn] = self._create_session(role_arn)
+            return self._sessions[role_arn]
+
+    def _create_session(self, role_arn):
+        # botocore's own assume role fetcher, the same one used for role profiles: it
+        # requests the credentials on first use and again before they expire
+        fetcher = AssumeRoleCredentialFetcher(
+            client_creator=self.base_session.client,
+            source_credentials=self.base_session.get_credentials(),
+            role_arn=role_arn,
+            extra_args={
+                "RoleSessionName": self.session_name,
+                "DurationSeconds": self.duration_seconds,
+            },
+        )
+        credentials = DeferredRefreshableCredentials(
+            refresh_using=fetcher.fetch_credentials,
+            method=AssumedRoleProvider.METHOD,
+        )
+
+        botocore_session = botocore.session.get_session()
+        botocore_session.register_component(
+            "credential_provider",
+            CredentialResolver(providers=[AssumedRoleProvider(credentials)]),
+        )
+        return boto3.session.Session(botocore_session=botocore_session)
@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
 from .ecr_manager import ECRManager
-from .ecs_manager import ECSManager
+from .ecs_manager import ECSManager, IncompleteInventoryError
+from .image_index import InUseImageIndex
+from .inventory import InventorySnapshot
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+from ecr_cleaner import config
+from ecr_cleaner.helper import RateLimiter, chunked_iterable
+
+from .ecr_manager import DELETE_BATCH_SIZE, ECRManager
+from .ecs_manager import (
+    ACTIVE_REVISIONS_SECTION,
+    DESCRIBE_SERVICES_BATCH_SIZE,
+    DESCRIBE_TASKS_BATCH_SIZE,
+    ECSManager,
+)
+
+
+class AsyncRateLimiter(RateLimiter):
+    """
+    `RateLimiter` for coroutines, it waits without blocking the event loop. It can be shared
+    by several event loops and threads.
+    """
+
+    async def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncAPI:
+    """
+    Runs boto3 calls as coroutines. boto3 clients block, so every call runs on one of
+    `concurrency` threads shared by every event loop using this object, which bounds the calls
+    in flight for the whole run. Calls to an operation in `rate_limits` are spaced out to that
+    many calls per second.
+    """
+
+    def __init__(self, concurrency=None, rate_limits=None):
+        self.concurrency = max(1, concurrency or config.ASYNC_CONCURRENCY)
+        rate_limits = config.ASYNC_RATE_LIMITS if rate_limits is None else rate_limits
+        self.rate_limiters = {
+            operation: AsyncRateLimiter(calls_per_second)
+            for operation, calls_per_second in rate_limits.items()
+        }
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="ecr-cleaner-async"
+        )
+
+    async def run(self, function, *args, **kwargs):
+        """Runs a blocking function on the shared threads."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(function, *args, **kwargs)
+        )
+
+    async def call(self, client, operation, **kwargs):
+        rate_limiter = self.rate_limiters.get(operation)
+        if rate_limiter is not None:
+            await rate_limiter.wait()
+        return await self.run(getattr(client, operation), **kwargs)
+
+    async def pages(self, client, operation, key, **kwargs):
+        """
+        Yields the `key` items of every page of an operation paginated with `nextToken`, a
+        page is only requested once the previous one is in.
+        """
+        while True:
+            page = await self.call(client, operation, **kwargs)
+            yield page[key]
+            if not page.get("nextToken"):
+                return
+            kwargs["nextToken"] = page["nextToken"]
+
+
+class AsyncECRManager(ECRManager):
+    """
+    `ECRManager` with coroutines to describe and delete the images of many repositories
+    concurrently through an `AsyncAPI`. The blocking methods are kept, results are the same.
+    """
+
+    def __init__(self, ecr_client, rate_limiter=None, metrics=None, api=None):
+        super().__init__(ecr_client, rate_limiter=rate_limiter, metrics=metrics)
+        self.api = api or AsyncAPI()
+
+    async def iter_repository_image_pages_async(self, repository_name):
+        """`iter_repository_image_pages` as an async generator, errors are left to the caller."""
+        async for image_details in self.api.pages(
+            self.ecr_client,
+            "describe_images",
+            "imageDetails",
+            repositoryName=repository_name,
+        ):
+            self._count_described(image_details)
+            yield image_details
+
+    async def delete_images_async(
+        self, repository_name, images_to_delete, out_of_time=None
+    ):
+        """`delete_images` with every batch of an attempt deleted concurrently."""
+        result = {"deleted": 0, "failed": 0, "retried": 0}
+        pending = list(images_to_delete)
+        stopped_at = None
+
+        for attempt in range(self.max_retries + 1):
+            retry, not_tried = await self._delete_attempt_async(
+                repository_name, pending, result, out_of_time
+            )
+            pending, stopped_at = self._next_attempt(
+                repository_name, attempt, result, retry, not_tried
+            )
+            if pending is None:
+                break
+            await asyncio.sleep(self.retry_backoff_seconds * 2**attempt)
+
+        return self._deletion_result(repository_name, result, stopped_at)
+
+    async def _delete_attempt_async(
+        self, repository_name, pending, result, out_of_time
+    ):
+        """`_delete_attempt` with every batch deleted concurrently."""
+        batch_results = await asyncio.gather(
+            *(
+                self._delete_batch_async(repository_name, image_batch, out_of_time)
+                for image_batch in chunked_iterable(pending, DELETE_BATCH_SIZE)
+            )
+        )
+
+        retry, not_tried = [], None
+        for batch_result, batch_retry, batch_not_tried in batch_results:
+            for key, count in batch_result.items():
+                result[key] += count
+            retry.extend(batch_retry)
+            if batch_not_tried:
+                not_tried = (not_tried or []) + batch_not_tried
+        return retry, not_tried
+
+    async def _delete_batch_async(self, repository_name, image_batch, out_of_time):
+        """Returns the counts of one batch, the digests worth retrying and those not tried."""
+        result = {"deleted": 0, "failed": 0}
+        if out_of_time is not None and out_of_time():
+            return result, [], image_batch
+
+        def delete_batch():
+            # every batch of an attempt is started at once, most of them wait for a thread
+            if out_of_time is not None and out_of_time():
+                return None
+            return self._delete_batch(repository_name, image_batch, result)
+
+        rate_limiter = self.api.rate_limiters.get("batch_delete_image")
+        if rate_limiter is not None:
+            await rate_limiter.wait()
+        retry = await self.api.run(delete_batch)
+        if retry is None:
+            return result, [], image_batch
+        return result, retry, []
+
+
+class AsyncECSManager(ECSManager):
+    """
+    `ECSManager` reading every cluster, task and service batch and task definition
+    concurrently through an `AsyncAPI`, in an event loop of its own. Task definitions are
+    still described once, the cache is shared with the blocking methods.
+    """
+
+    def __init__(
+        self,
+        ecs_client,
+        cluster_workers=None,
+        metrics=None,
+        include_services=None,
+        active_revisions=None,
+        api=None,
+    ):
+        super().__init__(
+            ecs_client,
+            cluster_workers=cluster_workers,
+            metrics=metrics,
+            include_services=include_services,
+            active_revisions=active_revisions,
+        )
+        self.api = api or AsyncAPI()
+
+    def iter_cluster_images(self):
+        """
+        Same sections as `ECSManager.iter_cluster_images`. Every section is read at once,
+        those before the first failing one are yielded before its error is raised.
+        """
+        for section, images in asyncio.run(self._cluster_images()):
+            if isinstance(images, Exception):
+                raise images
+            yield section, images
+
+    async def _cluster_images(self):
+        # lookups of this event loop, a task definition used by many clusters is described once
+        lookups = {}
+        sections = {}
+        async for cluster_arns in self.api.pages(
+            self.ecs_client, "list_clusters", "clusterArns"
+        ):
+            for cluster in cluster_arns:
+                sections[cluster] = self._cluster_task_images(cluster, lookups)
+        if self.active_revisions:
+            sections[ACTIVE_REVISIONS_SECTION] = self._active_revisions_images(lookups)
+
+        results = await asyncio.gather(*sections.values(), return_exceptions=True)
+        return list(zip(sections, results))
+
+    async def _cluster_task_images(self, cluster, lookups):
+        self.metrics.add("ecs_clusters")
+
+        describe_calls = []
+        async for task_arns in self.api.pages(
+            self.ecs_client,
+            "list_tasks",
+            "taskArns",
+            cluster=cluster,
+            desiredStatus="RUNNING",
+        ):
+            describe_calls.extend(
+                self.api.call(
+                    self.ecs_client, "describe_tasks", cluster=cluster, tasks=task_batch
+                )
+                for task_batch in chunked_iterable(task_arns, DESCRIBE_TASKS_BATCH_SIZE)
+            )
+        if self.include_services:
+            async for service_arns in self.api.pages(
+                self.ecs_client, "list_services", "serviceArns", cluster=cluster
+            ):
+                describe_calls.extend(
+                    self.api.call(
+                        self.ecs_client,
+                        "describe_services",
+                        cluster=cluster,
+                        services=service_batch,
+                    )
+                    for service_batch in chunked_iterable(
+                        service_arns, DESCRIBE_SERVICES_BATCH_SIZE
+                    )
+                )
+
+        task_definition_arns = set()
+        for response in await asyncio.gather(*describe_calls):
+            for task in response.get("tasks", []):
+                self.metrics.add("ecs_tasks")
+                task_definition_arns.add(task["taskDefinitionArn"])
+            for service in response.get("services", []):
+                self.metrics.add("ecs_services")
+                task_definition_arns.update(self.service_task_definitions(service))
+
+        return await self._task_definitions_images_async(task_definition_arns, lookups)
+
+    async def _active_revisions_images(self, lookups):
+        families = []
+        async for page_families in self.api.pages(
+            self.ecs_client,
+            "list_task_definition_families",
+            "families",
+            status="ACTIVE",
+        ):
+            self.metrics.add("ecs_task_definition_families", len(page_families))
+            families.extend(page_families)
+
+        revisions = await asyncio.gather(
+            *(self._latest_revisions_async(family) for family in families)
+        )
+        return await self._task_definitions_images_async(
+            [arn for family_revisions in revisions for arn in family_revisions],
+            lookups,
+        )
+
+    async def _latest_revisions_async(self, family):
+        revisions = []
+        pages = self.api.pages(
+            self.ecs_client,
+            "list_task_definitions",
+            "taskDefinitionArns",
+            familyPrefix=family,
+            status="ACTIVE",
+            sort="DESC",
+        )
+        async for task_definition_arns in pages:
+            for task_definition_arn in task_definition_arns:
+                # familyPrefix also matches longer family names
+                if task_definition_arn.rsplit("/", 1)[-1].rsplit(":", 1)[0] != family:
+                    continue
+                revisions.append(task_definition_arn)
+                if len(revisions) == self.active_revisions:
+                    await pages.aclose()
+                    return revisions
+        return revisions
+
+    async def _task_definitions_images_async(self, task_definition_arns, lookups):
+        images = await asyncio.gather(
+            *(
+                self._task_definition_images_async(task_definition_arn, lookups)
+                for task_definition_arn in task_definition_arns
+            )
+        )
+        return set().union(*images)
+
+    async def _task_definition_images_async(self, task_definition_arn, lookups):
+        with self._cache_lock:
+            cached = self.task_definition_cache.get(task_definition_arn)
+            lookup = lookups.get(task_definition_arn)
+            if cached is not None or lookup is not None:
+                self.cache_hits += 1
+                self.metrics.add("task_definition_cache_hits")
+            else:
+                self.cache_misses += 1
+                self.metrics.add("task_definition_cache_misses")
+                lookup = lookups[task_definition_arn] = asyncio.ensure_future(
+                    self._describe_task_definition(task_definition_arn, lookups)
+                )
+
+        if cached is not None:
+            return cached.result()
+        return await lookup
+
+    async def _describe_task_definition(self, task_definition_arn, lookups):
+        try:
+            task_def = await self.api.call(
+                self.ecs_client,
+                "describe_task_definition",
+                taskDefinition=task_definition_arn,
+            )
+        except Exception:
+            # do not cache failures, the next caller gets to try again
+            del lookups[task_definition_arn]
+            raise
+
+        images = [
+            container["image"]
+            for container in task_def["taskDefinition"]["containerDefinitions"]
+        ]
+        cached = Future()
+        cached.set_result(images)
+        with self._cache_lock:
+            self.task_definition_cache[task_definition_arn] = cached
+        return images
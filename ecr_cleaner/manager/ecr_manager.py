@@ -1,13 +1,29 @@
 # -*- coding: utf-8 -*-
 import logging
-from itertools import islice
+import time
+from itertools import chain
 
 import boto3
 
+from ecr_cleaner import config
+from ecr_cleaner.helper import RateLimiter, chunked_iterable, is_throttling_error
+from ecr_cleaner.metrics import RunMetrics
+
+# batch_delete_image does not accept more than 100 image ids per call
+DELETE_BATCH_SIZE = 100
+
+# failures worth another attempt later in the run, an image referenced by a manifest list
+# can be deleted once the list itself has been deleted by another batch
+RETRYABLE_FAILURE_CODES = {"ImageReferencedByManifestList", "KmsError"}
+
 
 class ECRManager:
-    def __init__(self, ecr_client):
+    def __init__(self, ecr_client, rate_limiter=None, metrics=None):
         self.ecr_client = ecr_client
+        self.metrics = metrics or RunMetrics()
+        self.rate_limiter = rate_limiter or RateLimiter(config.DELETE_RATE_LIMIT)
+        self.max_retries = config.DELETE_MAX_RETRIES
+        self.retry_backoff_seconds = config.DELETE_RETRY_BACKOFF_SECONDS
 
     def get_all_repositories(self):
         try:
@@ -18,32 +34,162 @@ class ECRManager:
         except Exception as e:
             logging.error(f"Error fetching ECR repositories: {e}")
 
+    def iter_repository_image_pages(self, repository_name):
+        """Yield `imageDetails` one describe_images page at a time, errors are left to the caller."""
+        paginator = self.ecr_client.get_paginator("describe_images")
+        for page in paginator.paginate(repositoryName=repository_name):
+            self._count_described(page["imageDetails"])
+            yield page["imageDetails"]
+
+    def _count_described(self, image_details):
+        self.metrics.add("images_described", len(image_details))
+        self.metrics.add(
+            "image_bytes_described",
+            sum(image.get("imageSizeInBytes", 0) for image in image_details),
+        )
+
+    def iter_repository_images(self, repository_name):
+        for page in self.iter_repository_image_pages(repository_name):
+            yield from page
+
+    def iter_repository_image_ids(self, repository_name):
+        """Yield `imageIds` from list_images, one entry per tag, much cheaper than describe_images."""
+        paginator = self.ecr_client.get_paginator("list_images")
+        for page in paginator.paginate(repositoryName=repository_name):
+            yield from page["imageIds"]
+
+    def count_repository_images(self, repository_name, up_to):
+        """
+        Counts the images of a repository with list_images, stopping once there are more than
+        `up_to`. Errors are left to the caller.
+        """
+        image_digests = set()
+        for image_id in self.iter_repository_image_ids(repository_name):
+            image_digests.add(image_id["imageDigest"])
+            if len(image_digests) > up_to:
+                break
+        return len(image_digests)
+
+    def has_lifecycle_policy(self, repository_name):
+        try:
+            self.ecr_client.get_lifecycle_policy(repositoryName=repository_name)
+        except self.ecr_client.exceptions.LifecyclePolicyNotFoundException:
+            return False
+        return True
+
     def fetch_repository_images(self, repository_name):
         try:
-            images = []
-            paginator = self.ecr_client.get_paginator("describe_images")
-            for page in paginator.paginate(repositoryName=repository_name):
-                images.extend(page["imageDetails"])
-            return images
+            return list(self.iter_repository_images(repository_name))
         except Exception as e:
             logging.error(f"Error fetching ECR images for {repository_name}: {e}")
             return []
 
     def chunked_iterable(self, iterable, size):
         """Yield successive n-sized chunks from the iterable."""
-        iterator = iter(iterable)
-        for first in iterator:
-            yield [first] + list(islice(iterator, size - 1))
+        return chunked_iterable(iterable, size)
+
+    def delete_images(self, repository_name, images_to_delete, out_of_time=None):
+        """
+        Deletes the images in batches, a failing batch does not stop the others. Throttled
+        batches and retryable per-image failures are attempted again up to `max_retries` times.
+        Returns the number of images deleted, failed and retried. When `out_of_time` returns
+        True before a batch, the images not deleted yet are returned as `pending`.
+        """
+        result = {"deleted": 0, "failed": 0, "retried": 0}
+        pending = list(images_to_delete)
+        stopped_at = None
+
+        for attempt in range(self.max_retries + 1):
+            retry, not_tried = self._delete_attempt(
+                repository_name, pending, result, out_of_time
+            )
+            pending, stopped_at = self._next_attempt(
+                repository_name, attempt, result, retry, not_tried
+            )
+            if pending is None:
+                break
+            time.sleep(self.retry_backoff_seconds * 2**attempt)
+
+        return self._deletion_result(repository_name, result, stopped_at)
+
+    def _delete_attempt(self, repository_name, pending, result, out_of_time):
+        """
+        Deletes the pending images one batch at a time. Returns the digests worth retrying and
+        those not tried when `out_of_time`, None when every batch was tried.
+        """
+        retry = []
+        image_batches = self.chunked_iterable(pending, DELETE_BATCH_SIZE)
+        for image_batch in image_batches:
+            if out_of_time is not None and out_of_time():
+                return retry, image_batch + list(chain(*image_batches))
+            retry.extend(self._delete_batch(repository_name, image_batch, result))
+        return retry, None
+
+    def _next_attempt(self, repository_name, attempt, result, retry, not_tried):
+        """
+        The images for the next attempt, None when done, and the images left for the next run
+        when out of time. Images still failing after `max_retries` attempts count as failed.
+        """
+        if not_tried is not None:
+            return None, retry + not_tried
+        if not retry:
+            return None, None
+
+        if attempt == self.max_retries:
+            result["failed"] += len(retry)
+            logging.error(
+                f"Error deleting images from {repository_name}: "
+                f"{len(retry)} images still failing after {self.max_retries} retries"
+            )
+            return None, None
+
+        result["retried"] += len(retry)
+        return retry, None
+
+    def _deletion_result(self, repository_name, result, stopped_at):
+        for key, count in result.items():
+            self.metrics.add(f"images_{key}", count)
+
+        logging.info(f"Deleted images from {repository_name}: {result}")
+
+        if stopped_at is not None:
+            logging.info(
+                f"Out of time, {len(stopped_at)} images left in {repository_name}"
+            )
+            result["pending"] = stopped_at
+            self.metrics.add("images_pending", len(stopped_at))
+
+        return result
+
+    def _delete_batch(self, repository_name, image_batch, result):
+        """Deletes one batch and returns the digests worth retrying."""
+        self.rate_limiter.wait()
 
-    def delete_images(self, repository_name, images_to_delete):
         try:
-            # This is needed because batch delete does not accept more than 100 items per call
-            for image_batch in self.chunked_iterable(images_to_delete, 100):
-                image_ids = [
+            response = self.ecr_client.batch_delete_image(
+                repositoryName=repository_name,
+                imageIds=[
                     {"imageDigest": image_digest} for image_digest in image_batch
-                ]
-                self.ecr_client.batch_delete_image(
-                    repositoryName=repository_name, imageIds=image_ids
-                )
+                ],
+            )
         except Exception as e:
+            if is_throttling_error(e):
+                return image_batch
             logging.error(f"Error deleting images from {repository_name}: {e}")
+            result["failed"] += len(image_batch)
+            return []
+
+        failures = response.get("failures", [])
+        result["deleted"] += len(image_batch) - len(failures)
+
+        retry = []
+        for failure in failures:
+            if failure.get("failureCode") in RETRYABLE_FAILURE_CODES:
+                retry.append(failure["imageId"]["imageDigest"])
+            else:
+                result["failed"] += 1
+                logging.warning(
+                    f"Error deleting {failure['imageId']} from {repository_name}: "
+                    f"{failure.get('failureCode')} {failure.get('failureReason')}"
+                )
+        return retry
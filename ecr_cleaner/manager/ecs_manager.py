@@ -1,40 +1,242 @@
 # -*- coding: utf-8 -*-
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
 
 import boto3
 
+from ecr_cleaner import config
+from ecr_cleaner.helper import chunked_iterable
+from ecr_cleaner.metrics import RunMetrics
+
+from .image_index import InUseImageIndex
+
+# describe_tasks does not accept more than 100 task ARNs per call, describe_services 10 services
+DESCRIBE_TASKS_BATCH_SIZE = 100
+DESCRIBE_SERVICES_BATCH_SIZE = 10
+
+# deployments and task sets whose tasks are running or about to run
+LIVE_DEPLOYMENT_STATUSES = {"PRIMARY", "ACTIVE"}
+
+# inventory section holding the most recent ACTIVE revisions of every task definition family
+ACTIVE_REVISIONS_SECTION = "active-task-definitions"
+
+
+class IncompleteInventoryError(RuntimeError):
+    """Not every cluster could be read, images missing from the inventory may be in use."""
+
 
 class ECSManager:
 
-    def __init__(self, ecs_client):
+    def __init__(
+        self,
+        ecs_client,
+        cluster_workers=None,
+        metrics=None,
+        include_services=None,
+        active_revisions=None,
+    ):
         self.ecs_client = ecs_client
+        self.metrics = metrics or RunMetrics()
+        self.cluster_workers = max(1, cluster_workers or config.ECS_CLUSTER_WORKERS)
+        # services protect the images of scaled to zero services and deployments in flight,
+        # active revisions the images of scheduled tasks and of the next rollback
+        self.include_services = (
+            config.ECS_PROTECT_SERVICES
+            if include_services is None
+            else include_services
+        )
+        self.active_revisions = (
+            config.ECS_ACTIVE_REVISIONS
+            if active_revisions is None
+            else active_revisions
+        )
+        # task definitions are immutable once registered, so an ARN only has to be resolved once,
+        # the cache holds futures so clusters scanned in parallel wait on a single lookup
+        self.task_definition_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache_lock = threading.Lock()
+
+    def get_all_clusters(self):
+        paginator = self.ecs_client.get_paginator("list_clusters")
+        for page in paginator.paginate():
+            yield from page["clusterArns"]
 
     def get_running_task_images(self):
-        images_in_use = set()
+        """
+        Images of the running tasks of every cluster. Raises IncompleteInventoryError when a
+        cluster could not be read, as its images would otherwise be deleted.
+        """
+        cluster_images, complete = self.get_cluster_images()
+        if not complete:
+            raise IncompleteInventoryError("Not every ECS cluster could be read")
+        return InUseImageIndex(chain.from_iterable(cluster_images.values()))
+
+    def get_cluster_images(self):
+        """
+        Images of the running tasks by cluster ARN, and whether every cluster could be read.
+        Clusters read before an error are still returned.
+        """
+        cluster_images = {}
+        complete = True
 
         try:
-            clusters = self.ecs_client.list_clusters()["clusterArns"]
-
-            for cluster in clusters:
-                tasks = self.ecs_client.list_tasks(
-                    cluster=cluster, desiredStatus="RUNNING"
-                )["taskArns"]
-                if tasks:
-                    task_descriptions = self.ecs_client.describe_tasks(
-                        cluster=cluster, tasks=tasks
-                    )
-                    for task in task_descriptions["tasks"]:
-                        task_def_arn = task["taskDefinitionArn"]
-                        task_def = self.ecs_client.describe_task_definition(
-                            taskDefinition=task_def_arn
-                        )
-                        container_defs = task_def["taskDefinition"][
+            for cluster, images in self.iter_cluster_images():
+                cluster_images[cluster] = images
+        except Exception as e:
+            logging.error(f"Error fetching running ECS task images: {e}")
+            complete = False
+
+        logging.info(
+            f"Task definition cache: {self.cache_hits} hits, {self.cache_misses} misses"
+        )
+
+        return cluster_images, complete
+
+    def iter_cluster_images(self):
+        """
+        Yields each cluster ARN with the images of its running tasks and services, then the
+        images of the most recent ACTIVE task definitions. Errors are left to the caller.
+        Clusters are read on a pool of this manager, never on a pool shared with the scans
+        that wait on the inventory.
+        """
+        if self.cluster_workers > 1:
+            clusters = list(self.get_all_clusters())
+            with ThreadPoolExecutor(max_workers=self.cluster_workers) as executor:
+                yield from zip(
+                    clusters, executor.map(self.get_cluster_task_images, clusters)
+                )
+        else:
+            for cluster in self.get_all_clusters():
+                yield cluster, self.get_cluster_task_images(cluster)
+
+        if self.active_revisions:
+            yield ACTIVE_REVISIONS_SECTION, self._task_definitions_images(
+                self.get_active_task_definitions()
+            )
+
+    def get_cluster_task_images(self, cluster):
+        self.metrics.add("ecs_clusters")
+        task_definition_arns = set()
+
+        for task in self.get_running_tasks(cluster):
+            self.metrics.add("ecs_tasks")
+            task_definition_arns.add(task["taskDefinitionArn"])
+
+        if self.include_services:
+            for service in self.get_services(cluster):
+                self.metrics.add("ecs_services")
+                task_definition_arns.update(self.service_task_definitions(service))
+
+        return self._task_definitions_images(task_definition_arns)
+
+    def _task_definitions_images(self, task_definition_arns):
+        images_in_use = set()
+        for task_definition_arn in task_definition_arns:
+            images_in_use.update(self.get_task_definition_images(task_definition_arn))
+        return images_in_use
+
+    def get_running_tasks(self, cluster):
+        paginator = self.ecs_client.get_paginator("list_tasks")
+        task_arns = (
+            task_arn
+            for page in paginator.paginate(cluster=cluster, desiredStatus="RUNNING")
+            for task_arn in page["taskArns"]
+        )
+
+        for task_batch in chunked_iterable(task_arns, DESCRIBE_TASKS_BATCH_SIZE):
+            task_descriptions = self.ecs_client.describe_tasks(
+                cluster=cluster, tasks=task_batch
+            )
+            yield from task_descriptions["tasks"]
+
+    def get_services(self, cluster):
+        paginator = self.ecs_client.get_paginator("list_services")
+        service_arns = (
+            service_arn
+            for page in paginator.paginate(cluster=cluster)
+            for service_arn in page["serviceArns"]
+        )
+
+        for service_batch in chunked_iterable(
+            service_arns, DESCRIBE_SERVICES_BATCH_SIZE
+        ):
+            service_descriptions = self.ecs_client.describe_services(
+                cluster=cluster, services=service_batch
+            )
+            yield from service_descriptions["services"]
+
+    @staticmethod
+    def service_task_definitions(service):
+        """Task definitions a service runs or is rolling out, whatever its desired count."""
+        if service.get("taskDefinition"):
+            yield service["taskDefinition"]
+        for deployment in service.get("deployments", []):
+            if deployment.get("status") in LIVE_DEPLOYMENT_STATUSES:
+                yield deployment["taskDefinition"]
+        for task_set in service.get("taskSets", []):
+            if task_set.get("status") in LIVE_DEPLOYMENT_STATUSES:
+                yield task_set["taskDefinition"]
+
+    def get_active_task_definitions(self):
+        """The `active_revisions` most recent ACTIVE revisions of every task definition family."""
+        paginator = self.ecs_client.get_paginator("list_task_definition_families")
+        for page in paginator.paginate(status="ACTIVE"):
+            for family in page["families"]:
+                self.metrics.add("ecs_task_definition_families")
+                yield from self._latest_revisions(family)
+
+    def _latest_revisions(self, family):
+        # familyPrefix also matches longer family names, results are sorted by family first
+        paginator = self.ecs_client.get_paginator("list_task_definitions")
+        revisions = 0
+        for page in paginator.paginate(
+            familyPrefix=family, status="ACTIVE", sort="DESC"
+        ):
+            for task_definition_arn in page["taskDefinitionArns"]:
+                if task_definition_arn.rsplit("/", 1)[-1].rsplit(":", 1)[0] != family:
+                    continue
+                yield task_definition_arn
+                revisions += 1
+                if revisions == self.active_revisions:
+                    return
+
+    def get_task_definition_images(self, task_definition_arn):
+        with self._cache_lock:
+            cached = self.task_definition_cache.get(task_definition_arn)
+            if cached is not None:
+                self.cache_hits += 1
+                self.metrics.add("task_definition_cache_hits")
+                resolve = False
+            else:
+                self.cache_misses += 1
+                self.metrics.add("task_definition_cache_misses")
+                cached = self.task_definition_cache[task_definition_arn] = Future()
+                resolve = True
+
+        if resolve:
+            try:
+                task_def = self.ecs_client.describe_task_definition(
+                    taskDefinition=task_definition_arn
+                )
+                cached.set_result(
+                    [
+                        container["image"]
+                        for container in task_def["taskDefinition"][
                             "containerDefinitions"
                         ]
-                        for container in container_defs:
-                            images_in_use.add(container["image"])
+                    ]
+                )
+            except Exception as e:
+                # do not cache failures, the next caller gets to try again
+                with self._cache_lock:
+                    del self.task_definition_cache[task_definition_arn]
+                cached.set_exception(e)
 
-        except Exception as e:
-            logging.error(f"Error fetching running ECS task images: {e}")
+        return cached.result()
 
-        return sorted(images_in_use)
+    @property
+    def cache_stats(self):
+        return {"hits": self.cache_hits, "misses": self.cache_misses}
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+
+class InUseImageIndex:
+    """
+    Images referenced by ECS, indexed by repository URI.
+
+    Each URI holds the set of tags and the set of digests it is referenced by, so checking
+    an image is a couple of set lookups instead of scanning every image reference.
+    """
+
+    def __init__(self, image_refs=()):
+        self._index = {}
+        self._image_refs = set()
+        self.update(image_refs)
+
+    def add(self, image_ref):
+        self._image_refs.add(image_ref)
+
+        if "@" in image_ref:
+            repository_uri, image_digest = image_ref.split("@", 1)
+            self._entry(repository_uri)["digests"].add(image_digest)
+            return
+
+        # a ':' after the last '/' separates the tag, anything before it may be a registry port
+        repository_uri, separator, image_tag = image_ref.rpartition(":")
+        if separator and "/" not in image_tag:
+            self._entry(repository_uri)["tags"].add(image_tag)
+
+    def update(self, image_refs):
+        for image_ref in image_refs:
+            self.add(image_ref)
+
+    def get(self, repository_uri):
+        return self._index.get(repository_uri)
+
+    def match(self, repository_uri, image_digest, image_tags=(), image_tag=None):
+        """Returns "digest" or "tag" depending on how the image is referenced, None when it is not."""
+        entry = self._index.get(repository_uri)
+        if entry is None:
+            return None
+
+        if image_digest in entry["digests"]:
+            return "digest"
+
+        if image_tag and image_tag in entry["tags"]:
+            return "tag"
+
+        if not entry["tags"].isdisjoint(image_tags):
+            return "tag"
+
+        return None
+
+    def is_in_use(self, repository_uri, image_digest, image_tags=(), image_tag=None):
+        return (
+            self.match(repository_uri, image_digest, image_tags, image_tag) is not None
+        )
+
+    def _entry(self, repository_uri):
+        entry = self._index.get(repository_uri)
+        if entry is None:
+            entry = self._index[repository_uri] = {"tags": set(), "digests": set()}
+        return entry
+
+    def __contains__(self, image_ref):
+        return image_ref in self._image_refs
+
+    def __iter__(self):
+        return iter(sorted(self._image_refs))
+
+    def __len__(self):
+        return len(self._image_refs)
+
+    def __eq__(self, other):
+        if isinstance(other, InUseImageIndex):
+            return self._image_refs == other._image_refs
+        return NotImplemented
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+from datetime import datetime
+
+from .image_index import InUseImageIndex
+
+
+class InventorySnapshot:
+    """
+    The images of running ECS tasks by cluster, taken at `created_at`.
+
+    Snapshots are kept between runs, in a `Store` or a (gzipped) file, so later runs and
+    shards can reuse a fresh one instead of walking every cluster again. Every image
+    reference is written once and clusters refer to it by position.
+    """
+
+    VERSION = 1
+
+    def __init__(self, created_at, clusters):
+        self.created_at = created_at
+        self.clusters = {
+            cluster: frozenset(images) for cluster, images in clusters.items()
+        }
+
+    @property
+    def in_use_images(self):
+        return InUseImageIndex(
+            image_ref for images in self.clusters.values() for image_ref in images
+        )
+
+    def is_fresh(self, now, ttl):
+        return self.created_at <= now <= self.created_at + ttl
+
+    def to_json(self):
+        image_refs = sorted(set().union(*self.clusters.values()))
+        positions = {
+            image_ref: position for position, image_ref in enumerate(image_refs)
+        }
+
+        return {
+            "version": self.VERSION,
+            "created_at": self.created_at.isoformat(),
+            "images": image_refs,
+            "clusters": {
+                cluster: sorted(positions[image_ref] for image_ref in images)
+                for cluster, images in self.clusters.items()
+            },
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get("version") != cls.VERSION:
+            raise ValueError(
+                f"Unsupported ECS inventory snapshot version: {data.get('version')}"
+            )
+
+        image_refs = data["images"]
+        return cls(
+            created_at=datetime.fromisoformat(data["created_at"]),
+            clusters={
+                cluster: [image_refs[position] for position in positions]
+                for cluster, positions in data["clusters"].items()
+            },
+        )
+
+    def save(self, file_name):
+        opener = gzip.open if file_name.endswith(".gz") else open
+        with opener(file_name, mode="wt") as file:
+            json.dump(self.to_json(), file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, file_name):
+        opener = gzip.open if file_name.endswith(".gz") else open
+        with opener(file_name, mode="rt") as file:
+            return cls.from_json(json.load(file))
+
+    def __eq__(self, other):
+        if isinstance(other, InventorySnapshot):
+            return (
+                self.created_at == other.created_at and self.clusters == other.clusters
+            )
+        return NotImplemented
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class RunMetrics:
+    """
+    Wall time per phase, per repository scan latency, AWS API calls and retries by operation
+    and items processed during one run. Shared by the managers, the notifier and the cleaner,
+    it is safe to update from worker threads.
+    """
+
+    def __init__(self, namespace="ECRCleaner"):
+        self.namespace = namespace
+        self.started_at = time.perf_counter()
+        self.phases = {}
+        self.api_calls = Counter()
+        self.api_retries = Counter()
+        self.items = Counter()
+        self.repository_latency = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - started_at)
+
+    def record_phase(self, name, seconds):
+        """Adds time measured elsewhere, e.g. before the metrics existed, to a phase."""
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def repository(self, repository_name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.repository_latency[repository_name] = (
+                    time.perf_counter() - started_at
+                )
+
+    def add(self, name, count=1):
+        with self._lock:
+            self.items[name] += count
+
+    def attach(self, client):
+        """
+        Counts every API call and retry made by a boto3 client, paginators included. Clients
+        are cached and reused between runs, attaching replaces the metrics of an earlier run.
+        """
+        service = client.meta.service_model.service_name
+        for event, handler in (
+            (f"before-call.{service}", self._before_call),
+            (f"after-call.{service}", self._after_call),
+        ):
+            client.meta.events.unregister(event, unique_id="ecr-cleaner-metrics")
+            client.meta.events.register(event, handler, unique_id="ecr-cleaner-metrics")
+        return client
+
+    def _before_call(self, model, **kwargs):
+        with self._lock:
+            self.api_calls[self._operation(model)] += 1
+
+    def _after_call(self, model, parsed, **kwargs):
+        retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retries:
+            with self._lock:
+                self.api_retries[self._operation(model)] += retries
+
+    def _operation(self, model):
+        return f"{model.service_model.service_name}:{model.name}"
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.repository_latency.values())
+            slowest = sorted(
+                self.repository_latency.items(), key=lambda item: item[1], reverse=True
+            )[:5]
+
+            return {
+                "duration_seconds": round(time.perf_counter() - self.started_at, 3),
+                "phases": {
+                    name: round(seconds, 3) for name, seconds in self.phases.items()
+                },
+                "api_calls": dict(self.api_calls),
+                "api_calls_total": sum(self.api_calls.values()),
+                "api_retries": dict(self.api_retries),
+                "api_retries_total": sum(self.api_retries.values()),
+                "items": dict(self.items),
+                "repository_scan_seconds": {
+                    "count": len(latencies),
+                    "p50": round(self._percentile(latencies, 0.5), 3),
+                    "p95": round(self._percentile(latencies, 0.95), 3),
+                    "max": round(latencies[-1], 3) if latencies else 0.0,
+                    "slowest": {name: round(seconds, 3) for name, seconds in slowest},
+                },
+            }
+
+    def _percentile(self, values, percentile):
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * percentile))]
+
+    def embedded_metric_format(self, summary=None, dimensions=None):
+        """The summary as a CloudWatch Embedded Metric Format document."""
+        summary = summary or self.summary()
+        dimensions = dimensions or {}
+
+        metrics = {"RunDuration": (summary["duration_seconds"], "Seconds")}
+        for name, seconds in summary["phases"].items():
+            metrics[f"{name}Duration"] = (seconds, "Seconds")
+        metrics["ApiCalls"] = (summary["api_calls_total"], "Count")
+        metrics["ApiRetries"] = (summary["api_retries_total"], "Count")
+        metrics["RepositoryScanP95"] = (
+            summary["repository_scan_seconds"]["p95"],
+            "Seconds",
+        )
+        for name, count in summary["items"].items():
+            metrics[name] = (count, "Count")
+
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in metrics.items()
+                        ],
+                    }
+                ],
+            },
+            **dimensions,
+        }
+        document.update({name: value for name, (value, _) in metrics.items()})
+        return document
+
+    def emit(self, emf=False, summary_file=None, dimensions=None, summary=None):
+        """
+        Logs the summary and writes it to `summary_file` and as an EMF document. `summary`
+        replaces the summary of these metrics, e.g. one with the figures of every region.
+        """
+        summary = summary or self.summary()
+        logging.info(f"Run summary: {json.dumps(summary)}")
+
+        if summary_file:
+            with open(summary_file, mode="w") as file:
+                json.dump(summary, file, indent=2)
+
+        if emf:
+            # EMF documents are picked up from stdout by the Lambda runtime
+            print(json.dumps(self.embedded_metric_format(summary, dimensions)))
+
+        return summary
@@ -1,47 +1,132 @@
 # -*- coding: utf-8 -*-
 import logging
+import time
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
 from ecr_cleaner import config
+from ecr_cleaner.metrics import RunMetrics
 
 
 class SlackNotifier:
     MAX_MESSAGE_LENGTH = config.SLACK_MAX_MESSAGE_LENGTH
 
-    def __init__(self, slack_token):
+    def __init__(self, slack_token, metrics=None):
         self.slack_client = WebClient(token=slack_token)
+        self.metrics = metrics or RunMetrics()
+        self.upload_threshold = config.SLACK_UPLOAD_THRESHOLD
+        self.post_interval = config.SLACK_POST_INTERVAL_SECONDS
+        self.max_retries = config.SLACK_MAX_RETRIES
+        self._last_post = None
 
     def send_message(self, message):
+        """
+        Posts the report, split at line boundaries, as a message and a thread of replies. A
+        report longer than SLACK_UPLOAD_THRESHOLD is uploaded as one file instead, and posted
+        as a thread if the upload fails.
+        """
         try:
-            # If the message exceeds the Slack limit, split it into smaller chunks
-            messages = self._split_message(message)
+            if self.upload_threshold and len(message) > self.upload_threshold:
+                try:
+                    self._upload(message)
+                    return
+                except SlackApiError as e:
+                    logging.warning(
+                        f"Error uploading the report to Slack, posting it instead: "
+                        f"{e.response['error']}"
+                    )
 
-            for part in messages:
+            thread_ts = None
+            for part in self._split_message(message):
                 # Send each part using the new Block Kit with Markdown formatting
-                response = self.slack_client.chat_postMessage(
+                options = {"thread_ts": thread_ts} if thread_ts else {}
+                response = self._call(
+                    "chat_postMessage",
                     channel=config.SLACK_CHANNEL,
                     text="Report",
                     blocks=[
                         {"type": "section", "text": {"type": "mrkdwn", "text": part}}
                     ],
+                    **options,
                 )
+                thread_ts = thread_ts or response["ts"]
 
+                self.metrics.add("slack_messages")
                 logging.info(f"Slack message sent: {response['ts']}")
 
         except SlackApiError as e:
             logging.error(f"Error sending message to Slack: {e.response['error']}")
 
+    def _upload(self, message):
+        summary, _, _ = message.partition("\n")
+        self._call(
+            "files_upload_v2",
+            channel=config.SLACK_CHANNEL,
+            content=message,
+            filename="ecr-cleaner-report.txt",
+            title="Report",
+            initial_comment=summary,
+        )
+        self.metrics.add("slack_uploads")
+        logging.info(f"Slack report uploaded, {len(message)} characters")
+
+    def _call(self, method, **kwargs):
+        """
+        Calls the Slack API at most once every SLACK_POST_INTERVAL_SECONDS, a rate limited call
+        is retried after the Retry-After seconds Slack asks for.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self._last_post is not None:
+                time.sleep(
+                    max(0, self._last_post + self.post_interval - time.monotonic())
+                )
+            self._last_post = time.monotonic()
+
+            try:
+                return getattr(self.slack_client, method)(**kwargs)
+            except SlackApiError as e:
+                if e.response["error"] != "ratelimited" or attempt == self.max_retries:
+                    raise
+                headers = getattr(e.response, "headers", None) or {}
+                retry_after = headers.get("Retry-After", headers.get("retry-after"))
+                self.metrics.add("slack_retries")
+                logging.warning(
+                    f"Slack rate limited {method}, retrying in {retry_after}s"
+                )
+                time.sleep(
+                    float(retry_after)
+                    if retry_after is not None
+                    else self.post_interval
+                )
+
     def _split_message(self, message):
         """
-        Splits a message into chunks that respect Slack's 4000 character limit.
+        Splits a message into chunks that respect Slack's 4000 character limit, at line
+        boundaries so no line or markdown is broken. Only a line longer than the limit is cut.
         """
         if len(message) <= self.MAX_MESSAGE_LENGTH:
             return [message]
-        else:
-            # Split the message into chunks of max length
-            return [
-                message[i : i + self.MAX_MESSAGE_LENGTH]
-                for i in range(0, len(message), self.MAX_MESSAGE_LENGTH)
-            ]
+
+        chunks = []
+        chunk = []
+        chunk_length = 0
+        for line in message.splitlines(keepends=True):
+            while len(line) > self.MAX_MESSAGE_LENGTH:
+                line_start, line = (
+                    line[: self.MAX_MESSAGE_LENGTH],
+                    line[self.MAX_MESSAGE_LENGTH :],
+                )
+                if chunk:
+                    chunks.append("".join(chunk))
+                    chunk, chunk_length = [], 0
+                chunks.append(line_start)
+            if chunk_length + len(line) > self.MAX_MESSAGE_LENGTH:
+                chunks.append("".join(chunk))
+                chunk, chunk_length = [], 0
+            chunk.append(line)
+            chunk_length += len(line)
+        if chunk:
+            chunks.append("".join(chunk))
+
+        return [chunk for chunk in chunks if chunk]
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+from ecr_cleaner.helper import get_aws_client
+
+
+class Store(ABC):
+    """
+    Keeps JSON documents between runs, addressed by key. Subclasses decide where they live.
+    """
+
+    @abstractmethod
+    def load(self, key):
+        """The document saved under `key`, or None when there is none."""
+
+    @abstractmethod
+    def save(self, key, data):
+        """Saves `data` under `key`, replacing the document saved before."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Deletes the document saved under `key`, a missing one is not an error."""
+
+
+class LocalFileStore(Store):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        try:
+            with open(self._path(key)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first so an interrupted run never leaves half a document
+        temporary_path = f"{self._path(key)}.tmp"
+        with open(temporary_path, mode="w") as file:
+            json.dump(data, file)
+        os.replace(temporary_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store(Store):
+    def __init__(self, bucket, prefix="", s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.s3_client = s3_client or get_aws_client("s3")
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}.json" if self.prefix else f"{key}.json"
+
+    def load(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read())
+
+    def save(self, key, data):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            Body=json.dumps(data).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def delete(self, key):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+def get_store(location):
+    """
+    Builds a store from a location such as `/tmp/ecr-cleaner`, `file:///tmp/ecr-cleaner`
+    or `s3://bucket/prefix`. Returns None when no location is configured.
+    """
+    if not location:
+        return None
+
+    parsed = urlparse(location)
+
+    if parsed.scheme == "s3":
+        return S3Store(bucket=parsed.netloc, prefix=parsed.path)
+
+    if parsed.scheme in ("", "file"):
+        return LocalFileStore(parsed.path if parsed.scheme else location)
+
+    logging.error(f"Error: unsupported state store {location}")
+    raise ValueError(f"Unsupported state store: {location}")
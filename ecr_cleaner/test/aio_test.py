@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ecr_cleaner.manager import IncompleteInventoryError
+from ecr_cleaner.manager.aio import (
+    AsyncAPI,
+    AsyncECRManager,
+    AsyncECSManager,
+    AsyncRateLimiter,
+)
+
+DIGESTS = [f"sha256:{index:064x}" for index in range(250)]
+
+
+def async_managers(ecr_manager, ecs_manager, api=None):
+    api = api or AsyncAPI(concurrency=8, rate_limits={})
+    return (
+        AsyncECRManager(ecr_manager.ecr_client, api=api),
+        AsyncECSManager(ecs_manager.ecs_client, api=api),
+    )
+
+
+def test_calls_in_flight_are_bounded():
+    api = AsyncAPI(concurrency=3, rate_limits={})
+    in_flight = []
+    lock = threading.Lock()
+
+    def call(index):
+        with lock:
+            in_flight.append(1)
+            peak = len(in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight.pop()
+        return index, peak
+
+    async def main():
+        return await asyncio.gather(*(api.run(call, index) for index in range(12)))
+
+    results = asyncio.run(main())
+
+    assert [index for index, _ in results] == list(range(12))
+    assert max(peak for _, peak in results) <= 3
+
+
+def test_rate_limiter_spaces_calls_out():
+    rate_limiter = AsyncRateLimiter(calls_per_second=50)
+
+    async def main():
+        await asyncio.gather(*(rate_limiter.wait() for _ in range(5)))
+
+    started_at = time.monotonic()
+    asyncio.run(main())
+
+    assert time.monotonic() - started_at >= 4 / 50 * 0.9
+
+
+def test_async_ecs_inventory_matches_sync(ecr_manager, ecs_manager, mocker):
+    _, async_ecs_manager = async_managers(ecr_manager, ecs_manager)
+    describe_task_definition = mocker.spy(
+        ecs_manager.ecs_client, "describe_task_definition"
+    )
+
+    cluster_images, complete = async_ecs_manager.get_cluster_images()
+
+    assert complete
+    assert cluster_images == ecs_manager.get_cluster_images()[0]
+    # the sync manager described them again, it has a cache of its own
+    assert describe_task_definition.call_count == 2 * len(
+        async_ecs_manager.task_definition_cache
+    )
+    assert async_ecs_manager.cache_stats["misses"] == len(
+        async_ecs_manager.task_definition_cache
+    )
+
+
+def test_async_ecs_inventory_keeps_clusters_read_before_an_error(
+    ecr_manager, ecs_manager, mocker
+):
+    _, async_ecs_manager = async_managers(ecr_manager, ecs_manager)
+    clusters = ecs_manager.ecs_client.list_clusters()["clusterArns"]
+    list_tasks = ecs_manager.ecs_client.list_tasks
+
+    def failing_list_tasks(cluster, **kwargs):
+        if cluster == clusters[-1]:
+            raise Exception("AccessDenied")
+        return list_tasks(cluster=cluster, **kwargs)
+
+    mocker.patch.object(
+        ecs_manager.ecs_client, "list_tasks", side_effect=failing_list_tasks
+    )
+
+    cluster_images, complete = async_ecs_manager.get_cluster_images()
+
+    assert not complete
+    assert list(cluster_images) == clusters[:-1]
+
+
+def test_async_plan_fails_on_an_incomplete_inventory(ecr_cleaner, mocker):
+    ecr_cleaner.ecr_manager, ecr_cleaner.ecs_manager = async_managers(
+        ecr_cleaner.ecr_manager, ecr_cleaner.ecs_manager
+    )
+    ecr_cleaner.async_backend = True
+    mocker.patch.object(
+        ecr_cleaner.ecs_manager.ecs_client,
+        "list_tasks",
+        side_effect=Exception("AccessDenied"),
+    )
+    batch_delete_image = mocker.spy(
+        ecr_cleaner.ecr_manager.ecr_client, "batch_delete_image"
+    )
+
+    with pytest.raises(IncompleteInventoryError):
+        ecr_cleaner.run()
+
+    batch_delete_image.assert_not_called()
+
+
+def test_async_plan_matches_sync_plan(ecr_cleaner):
+    sync_plan = ecr_cleaner.build_plan()
+
+    ecr_cleaner.ecr_manager, ecr_cleaner.ecs_manager = async_managers(
+        ecr_cleaner.ecr_manager, ecr_cleaner.ecs_manager
+    )
+    ecr_cleaner.async_backend = True
+    async_plan = ecr_cleaner.build_plan()
+
+    assert async_plan == sync_plan
+    assert list(async_plan) == list(sync_plan)
+
+
+def test_async_delete_retries_images_referenced_by_manifest_lists(ecr_manager, mocker):
+    async_ecr_manager = AsyncECRManager(
+        ecr_manager.ecr_client, api=AsyncAPI(concurrency=4, rate_limits={})
+    )
+    async_ecr_manager.retry_backoff_seconds = 0
+    referenced = {DIGESTS[100]}
+
+    def batch_delete_image(repositoryName, imageIds):
+        failures = [
+            {"imageId": image_id, "failureCode": "ImageReferencedByManifestList"}
+            for image_id in imageIds
+            if image_id["imageDigest"] in referenced
+        ]
+        if failures:
+            referenced.clear()
+        return {"imageIds": [], "failures": failures}
+
+    batch_delete_image = mocker.patch.object(
+        ecr_manager.ecr_client, "batch_delete_image", side_effect=batch_delete_image
+    )
+
+    result = asyncio.run(
+        async_ecr_manager.delete_images_async("mock-ecr-repo-1", DIGESTS)
+    )
+
+    assert result == {"deleted": 250, "failed": 0, "retried": 1}
+    assert batch_delete_image.call_count == 4
+
+
+def test_async_delete_stops_when_out_of_time(ecr_manager, mocker):
+    async_ecr_manager = AsyncECRManager(
+        ecr_manager.ecr_client, api=AsyncAPI(concurrency=1, rate_limits={})
+    )
+    mocker.patch.object(
+        ecr_manager.ecr_client,
+        "batch_delete_image",
+        return_value={"imageIds": [], "failures": []},
+    )
+
+    result = asyncio.run(
+        async_ecr_manager.delete_images_async(
+            "mock-ecr-repo-1", DIGESTS, out_of_time=lambda: True
+        )
+    )
+
+    assert result["deleted"] == 0
+    assert sorted(result["pending"]) == DIGESTS
+
+
+def test_async_delete_stops_at_the_deadline(ecr_manager, mocker):
+    async_ecr_manager = AsyncECRManager(
+        ecr_manager.ecr_client, api=AsyncAPI(concurrency=1, rate_limits={})
+    )
+
+    deleted_batches = []
+
+    def slow_batch_delete_image(**kwargs):
+        time.sleep(0.05)
+        deleted_batches.append(kwargs["imageIds"])
+        return {"imageIds": [], "failures": []}
+
+    batch_delete_image = mocker.patch.object(
+        ecr_manager.ecr_client,
+        "batch_delete_image",
+        side_effect=slow_batch_delete_image,
+    )
+
+    # the deadline passes once the first batch is deleted, the other batches already started
+    result = asyncio.run(
+        async_ecr_manager.delete_images_async(
+            "mock-ecr-repo-1", DIGESTS, out_of_time=lambda: bool(deleted_batches)
+        )
+    )
+
+    assert batch_delete_image.call_count == 1
+    assert result["deleted"] == 100
+    assert sorted(result["pending"]) == DIGESTS[100:]
+
+
+def test_async_scan_stops_at_the_deadline(ecr_cleaner, mocker):
+    ecr_cleaner.ecr_manager, ecr_cleaner.ecs_manager = async_managers(
+        ecr_cleaner.ecr_manager,
+        ecr_cleaner.ecs_manager,
+        api=AsyncAPI(concurrency=1, rate_limits={}),
+    )
+    ecr_cleaner.async_backend = True
+    describe_images = mocker.spy(ecr_cleaner.ecr_manager.ecr_client, "describe_images")
+    # the deadline passes once the first repository is being described
+    mocker.patch.object(
+        ecr_cleaner, "out_of_time", side_effect=lambda: describe_images.call_count > 0
+    )
+
+    plan = ecr_cleaner.build_plan()
+
+    assert {
+        call.kwargs["repositoryName"] for call in describe_images.call_args_list
+    } == {next(ecr_cleaner.ecr_manager.get_all_repositories())["name"]}
+    assert len(plan) <= 1
+    assert not ecr_cleaner.plan_complete
+    assert ecr_cleaner.metrics.items["repositories_pending"] == (
+        len(list(ecr_cleaner.ecr_manager.get_all_repositories())) - 1
+    )
+
+
+def test_async_cleaner_deletes_the_plan(ecr_cleaner, mocker):
+    plan = ecr_cleaner.build_plan()
+
+    ecr_cleaner.ecr_manager, ecr_cleaner.ecs_manager = async_managers(
+        ecr_cleaner.ecr_manager, ecr_cleaner.ecs_manager
+    )
+    ecr_cleaner.async_backend = True
+    results = ecr_cleaner.delete_old_images(plan=plan)
+
+    assert set(results) == set(plan)
+    assert sum(result["deleted"] for result in results.values()) == plan.total_delete
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory ECR and ECS clients for the benchmarks. They answer the calls the managers make,
+paginate like the real APIs, record how many calls were made per operation and can add a
+fixed latency to every call to simulate the network.
+"""
+import threading
+import time
+from collections import Counter
+
+
+class FakePaginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        next_token = None
+        while True:
+            if next_token:
+                kwargs["nextToken"] = next_token
+            page = self.method(**kwargs)
+            yield page
+            next_token = page.get("nextToken")
+            if not next_token:
+                break
+
+
+class FakeClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(getattr(self, operation_name))
+
+    def _call(self, operation_name):
+        with self._lock:
+            self.calls[operation_name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _page(self, items, key, page_size, nextToken=None):
+        start = int(nextToken or 0)
+        page = {key: items[start : start + page_size]}
+        if start + page_size < len(items):
+            page["nextToken"] = str(start + page_size)
+        return page
+
+
+class FakeECRClient(FakeClient):
+    """
+    Repository URIs are the bare repository names, the same form MockDataGenerator uses for
+    ECS container images, so in-use images are matched like they would be in an account.
+    """
+
+    def __init__(self, ecr_data, latency=0.0):
+        super().__init__(latency)
+        self.repositories = {
+            repository_name: [
+                {
+                    "imageDigest": image["imageDigest"],
+                    "imageTags": image["imageTags"],
+                    "imagePushedAt": image["imagePushedAt"],
+                    "imageSizeInBytes": image.get("imageSizeInBytes", 0),
+                }
+                for image in repository["images"]
+            ]
+            for repository_name, repository in ecr_data.items()
+        }
+
+    def describe_repositories(self, nextToken=None):
+        self._call("describe_repositories")
+        repositories = [
+            {"repositoryName": repository_name, "repositoryUri": repository_name}
+            for repository_name in self.repositories
+        ]
+        return self._page(repositories, "repositories", 1000, nextToken)
+
+    def describe_images(self, repositoryName, nextToken=None):
+        self._call("describe_images")
+        return self._page(
+            self.repositories[repositoryName], "imageDetails", 100, nextToken
+        )
+
+    def list_images(self, repositoryName, nextToken=None):
+        self._call("list_images")
+        image_ids = [
+            {"imageDigest": image["imageDigest"], "imageTag": tag}
+            for image in self.repositories[repositoryName]
+            for tag in image["imageTags"]
+        ]
+        return self._page(image_ids, "imageIds", 1000, nextToken)
+
+    def batch_delete_image(self, repositoryName, imageIds):
+        self._call("batch_delete_image")
+        assert len(imageIds) <= 100
+        deleted = {image_id["imageDigest"] for image_id in imageIds}
+        with self._lock:
+            self.repositories[repositoryName] = [
+                image
+                for image in self.repositories[repositoryName]
+                if image["imageDigest"] not in deleted
+            ]
+        return {"imageIds": imageIds, "failures": []}
+
+
+class FakeECSClient(FakeClient):
+    """
+    Every task of MockDataGenerator is registered once and run `task_copies` times by a
+    service of the same name.
+    """
+
+    def __init__(self, ecs_data, latency=0.0, task_copies=1):
+        super().__init__(latency)
+        self.task_definitions = {}
+        self.clusters = {}
+        self.services = {}
+
+        for cluster_name, tasks in ecs_data.items():
+            cluster_arn = f"arn:aws:ecs:eu-west-2:123456789012:cluster/{cluster_name}"
+            self.clusters[cluster_arn] = []
+            self.services[cluster_arn] = []
+
+            for task in tasks:
+                task_definition_arn = (
+                    f"arn:aws:ecs:eu-west-2:123456789012:task-definition/"
+                    f"{cluster_name}-{task['taskId']}:1"
+                )
+                self.task_definitions[task_definition_arn] = task[
+                    "containerDefinitions"
+                ]
+                if not task["isRunning"]:
+                    continue
+                self.services[cluster_arn].append(
+                    {
+                        "serviceArn": f"{cluster_arn}/service/{task['taskId']}",
+                        "taskDefinition": task_definition_arn,
+                        "deployments": [
+                            {"status": "PRIMARY", "taskDefinition": task_definition_arn}
+                        ],
+                    }
+                )
+                for copy in range(task_copies):
+                    self.clusters[cluster_arn].append(
+                        {
+                            "taskArn": f"{cluster_arn}/task/{task['taskId']}-{copy}",
+                            "taskDefinitionArn": task_definition_arn,
+                        }
+                    )
+
+        self.tasks = {
+            task["taskArn"]: task for tasks in self.clusters.values() for task in tasks
+        }
+        self.service_descriptions = {
+            service["serviceArn"]: service
+            for services in self.services.values()
+            for service in services
+        }
+
+    def list_clusters(self, nextToken=None):
+        self._call("list_clusters")
+        return self._page(list(self.clusters), "clusterArns", 100, nextToken)
+
+    def list_tasks(self, cluster, desiredStatus=None, nextToken=None):
+        self._call("list_tasks")
+        task_arns = [task["taskArn"] for task in self.clusters[cluster]]
+        return self._page(task_arns, "taskArns", 100, nextToken)
+
+    def describe_tasks(self, cluster, tasks):
+        self._call("describe_tasks")
+        assert len(tasks) <= 100
+        return {"tasks": [self.tasks[task_arn] for task_arn in tasks]}
+
+    def list_services(self, cluster, nextToken=None):
+        self._call("list_services")
+        service_arns = [service["serviceArn"] for service in self.services[cluster]]
+        return self._page(service_arns, "serviceArns", 10, nextToken)
+
+    def describe_services(self, cluster, services):
+        self._call("describe_services")
+        assert len(services) <= 10
+        return {
+            "services": [
+                self.service_descriptions[service_arn] for service_arn in services
+            ]
+        }
+
+    def list_task_definition_families(self, status=None, nextToken=None):
+        self._call("list_task_definition_families")
+        families = sorted(
+            {
+                task_definition_arn.rsplit("/", 1)[-1].rsplit(":", 1)[0]
+                for task_definition_arn in self.task_definitions
+            }
+        )
+        return self._page(families, "families", 100, nextToken)
+
+    def list_task_definitions(
+        self, familyPrefix, status=None, sort=None, nextToken=None
+    ):
+        self._call("list_task_definitions")
+        task_definition_arns = sorted(
+            (
+                task_definition_arn
+                for task_definition_arn in self.task_definitions
+                if task_definition_arn.rsplit("/", 1)[-1].startswith(familyPrefix)
+            ),
+            reverse=sort == "DESC",
+        )
+        return self._page(task_definition_arns, "taskDefinitionArns", 100, nextToken)
+
+    def describe_task_definition(self, taskDefinition):
+        self._call("describe_task_definition")
+        return {
+            "taskDefinition": {
+                "taskDefinitionArn": taskDefinition,
+                "containerDefinitions": self.task_definitions[taskDefinition],
+            }
+        }
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Times RetentionPolicy.images_to_delete on a single large repository and compares it with
+sorting every image by push date, to show the heap based selection stays linear.
+
+    python -m ecr_cleaner.test.benchmarks.retention_benchmark
+"""
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from ecr_cleaner import config
+from ecr_cleaner.cleaner.retention import RetentionPolicy
+from ecr_cleaner.manager import InUseImageIndex
+
+REPOSITORY_URI = "123456789012.dkr.ecr.eu-west-2.amazonaws.com/benchmark-repo"
+REPOSITORY_SIZES = (25_000, 50_000, 100_000, 200_000)
+
+
+def generate_images(image_count, now):
+    for index in random.sample(range(image_count), image_count):
+        yield {
+            "imageDigest": f"sha256:{index:064x}",
+            "imageTags": [f"v{index}"],
+            "imagePushedAt": now - timedelta(minutes=index),
+        }
+
+
+def sort_baseline(images, policy):
+    """Keep the newest images by sorting the whole repository, the obvious alternative."""
+    images = sorted(images, key=lambda image: image["imagePushedAt"], reverse=True)
+    return [
+        image["imageDigest"]
+        for image in images[policy.keep_min_count :]
+        if image["imagePushedAt"] < policy.keep_images_newer_than
+    ]
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def run():
+    now = datetime.now(timezone.utc)
+    policy = RetentionPolicy(
+        keep_min_count=config.KEEP_MIN_IMAGE_COUNT,
+        keep_images_newer_than=now - timedelta(days=config.KEEP_IMAGES_NEWER_THAN_DAYS),
+    )
+    in_use_index = InUseImageIndex([f"{REPOSITORY_URI}:v10", f"{REPOSITORY_URI}:v500"])
+
+    print(
+        f"{'images':>10} {'heap s':>10} {'us/image':>10} {'sort s':>10} {'us/image':>10}"
+    )
+
+    for image_count in REPOSITORY_SIZES:
+        images = list(generate_images(image_count, now))
+
+        heap_seconds, candidates = timed(
+            lambda: list(
+                policy.images_to_delete(REPOSITORY_URI, iter(images), in_use_index)
+            )
+        )
+        sort_seconds, _ = timed(lambda: sort_baseline(images, policy))
+
+        print(
+            f"{image_count:>10} {heap_seconds:>10.3f} "
+            f"{heap_seconds / image_count * 1e6:>10.2f} "
+            f"{sort_seconds:>10.3f} {sort_seconds / image_count * 1e6:>10.2f}"
+        )
+        assert len(candidates) <= image_count - policy.keep_min_count
+
+
+if __name__ == "__main__":
+    run()
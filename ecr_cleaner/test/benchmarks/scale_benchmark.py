@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the ECS inventory, the deletion plan and the deletion against a synthetic account built
+by MockDataGenerator and served by in-memory clients, and reports wall time, peak memory and
+API calls per phase.
+
+    python -m ecr_cleaner.test.benchmarks.scale_benchmark --repos 2000 --images-per-repo 100
+    python -m ecr_cleaner.test.benchmarks.scale_benchmark --latency 0.02 --scan-workers 16
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from collections import Counter
+
+from ecr_cleaner import config
+from ecr_cleaner.cleaner import ECRCleaner
+from ecr_cleaner.manager import ECRManager, ECSManager
+from ecr_cleaner.test.benchmarks.fake_aws import FakeECRClient, FakeECSClient
+from ecr_cleaner.test.fixtures.test_data import MockDataGenerator
+
+
+def build_cleaner(generator, latency, task_copies, scan_workers, cluster_workers):
+    fake_ecr = FakeECRClient(generator.ecr_data, latency=latency)
+    fake_ecs = FakeECSClient(
+        generator.ecs_data, latency=latency, task_copies=task_copies
+    )
+
+    cleaner = ECRCleaner(
+        aws_region=config.AWS_REGION,
+        slack_token="fake-token",
+        scan_workers=scan_workers,
+    )
+    cleaner.ecr_manager = ECRManager(fake_ecr, metrics=cleaner.metrics)
+    cleaner.ecs_manager = ECSManager(
+        fake_ecs, cluster_workers=cluster_workers, metrics=cleaner.metrics
+    )
+    return cleaner, fake_ecr, fake_ecs
+
+
+def measure(phase, function, clients, trace_memory):
+    calls_before = [Counter(client.calls) for client in clients]
+    if trace_memory:
+        tracemalloc.reset_peak()
+
+    started_at = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - started_at
+
+    api_calls = Counter()
+    for client, before in zip(clients, calls_before):
+        api_calls.update(client.calls - before)
+
+    return result, {
+        "phase": phase,
+        "seconds": round(seconds, 3),
+        "peak_mb": (
+            round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            if trace_memory
+            else None
+        ),
+        "api_calls": dict(api_calls),
+    }
+
+
+def run_benchmark(
+    repos=2000,
+    images_per_repo=100,
+    clusters=20,
+    tasks_per_cluster=100,
+    task_copies=5,
+    latency=0.0,
+    scan_workers=1,
+    cluster_workers=1,
+    trace_memory=True,
+):
+    generator = MockDataGenerator(
+        repo_count=repos,
+        images_per_repo=images_per_repo,
+        cluster_count=clusters,
+        tasks_per_cluster=tasks_per_cluster,
+    )
+    cleaner, fake_ecr, fake_ecs = build_cleaner(
+        generator, latency, task_copies, scan_workers, cluster_workers
+    )
+    clients = [fake_ecr, fake_ecs]
+
+    if trace_memory:
+        tracemalloc.start()
+
+    try:
+        results = []
+
+        # a fresh manager each time, so the task definition cache starts empty
+        inventory_manager = ECSManager(fake_ecs, cluster_workers=cluster_workers)
+        _, result = measure(
+            "ecs_inventory",
+            inventory_manager.get_running_task_images,
+            clients,
+            trace_memory,
+        )
+        results.append(result)
+
+        plan, result = measure(
+            "images_to_delete", cleaner.build_plan, clients, trace_memory
+        )
+        results.append(result)
+
+        deleted, result = measure(
+            "delete_images",
+            lambda: cleaner.delete_old_images(plan=plan),
+            clients,
+            trace_memory,
+        )
+        results.append(result)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    return {
+        "account": {
+            "repositories": len(generator.ecr_data),
+            "images": sum(
+                repository["totalImages"] for repository in generator.ecr_data.values()
+            ),
+            "running_tasks": len(fake_ecs.tasks),
+            "task_definitions": len(fake_ecs.task_definitions),
+            "latency": latency,
+            "scan_workers": scan_workers,
+            "cluster_workers": cluster_workers,
+        },
+        "images_to_delete": plan.total_delete,
+        "images_deleted": sum(result["deleted"] for result in deleted.values()),
+        "phases": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repos", type=int, default=2000)
+    parser.add_argument("--images-per-repo", type=int, default=100)
+    parser.add_argument("--clusters", type=int, default=20)
+    parser.add_argument("--tasks-per-cluster", type=int, default=100)
+    parser.add_argument("--task-copies", type=int, default=5)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every API call"
+    )
+    parser.add_argument("--scan-workers", type=int, default=1)
+    parser.add_argument("--cluster-workers", type=int, default=1)
+    parser.add_argument("--skip-memory", action="store_true")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        repos=args.repos,
+        images_per_repo=args.images_per_repo,
+        clusters=args.clusters,
+        tasks_per_cluster=args.tasks_per_cluster,
+        task_copies=args.task_copies,
+        latency=args.latency,
+        scan_workers=args.scan_workers,
+        cluster_workers=args.cluster_workers,
+        trace_memory=not args.skip_memory,
+    )
+
+    print(json.dumps(report["account"]))
+    print(f"{'phase':<18} {'seconds':>10} {'peak MB':>10} {'API calls':>10}")
+    for result in report["phases"]:
+        print(
+            f"{result['phase']:<18} {result['seconds']:>10.3f} "
+            f"{result['peak_mb'] if result['peak_mb'] is not None else '-':>10} "
+            f"{sum(result['api_calls'].values()):>10}  {result['api_calls']}"
+        )
+
+    if args.output:
+        with open(args.output, mode="w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
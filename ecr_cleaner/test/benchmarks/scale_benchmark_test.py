@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from ecr_cleaner.test.benchmarks.scale_benchmark import run_benchmark
+
+
+def test_scale_benchmark_smoke():
+    """A tiny account, to keep the fake clients in step with the managers."""
+    report = run_benchmark(
+        repos=20,
+        images_per_repo=250,
+        clusters=2,
+        tasks_per_cluster=10,
+        task_copies=3,
+        scan_workers=4,
+        trace_memory=False,
+    )
+    phases = {result["phase"]: result for result in report["phases"]}
+
+    assert report["images_deleted"] == report["images_to_delete"] > 0
+
+    ecs_calls = phases["ecs_inventory"]["api_calls"]
+    assert (
+        ecs_calls["describe_task_definition"] <= report["account"]["task_definitions"]
+    )
+
+    scan_calls = phases["images_to_delete"]["api_calls"]
+    assert scan_calls["describe_images"] >= report["account"]["repositories"]
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ecr_cleaner.cleaner import what_if
+from ecr_cleaner.cleaner.catalogue import (
+    CatalogueSink,
+    ImageCatalogue,
+    StringColumn,
+    _decode_npy,
+    _encode_npy,
+)
+from ecr_cleaner.cleaner.retention import DELETE, RetentionPolicy
+from ecr_cleaner.manager import InUseImageIndex
+
+REGISTRY = "123456789012.dkr.ecr.eu-west-2.amazonaws.com"
+NOW = datetime(2024, 11, 1, 12, tzinfo=timezone.utc)
+POLICIES = [(0, 0), (1, 7), (3, 7), (3, 30), (10, 1)]
+
+
+def generate_images(repository_count=3, image_count=60):
+    images = {}
+    for repository in range(repository_count):
+        repository_uri = f"{REGISTRY}/repo-{repository}"
+        images[repository_uri] = [
+            {
+                "imageDigest": f"sha256:{repository:032x}{index:032x}",
+                "imageTags": [f"v{index}"] if index % 4 else [],
+                # a few images are pushed at the same time, the digest breaks the tie
+                "imagePushedAt": NOW - timedelta(days=random.randint(0, 40) // 2),
+                "imageSizeInBytes": random.randint(1, 10) * 1024**2,
+            }
+            for index in range(image_count)
+        ]
+    return images
+
+
+def expected_deletions(images, in_use_index, keep_min_count, days):
+    policy = RetentionPolicy(
+        keep_min_count=keep_min_count,
+        keep_images_newer_than=NOW - timedelta(days=days),
+    )
+    deleted = [
+        image
+        for repository_uri, repository_images in images.items()
+        for image, decision in policy.evaluate(
+            repository_uri, repository_images, in_use_index
+        )
+        if decision == DELETE
+    ]
+    return {
+        "images_to_delete": len(deleted),
+        "bytes_to_delete": sum(image["imageSizeInBytes"] for image in deleted),
+    }
+
+
+@pytest.fixture
+def catalogue_and_images(tmp_path):
+    random.seed(7)
+    images = generate_images()
+    in_use_index = InUseImageIndex(
+        [
+            f"{REGISTRY}/repo-0:v1",
+            f"{REGISTRY}/repo-1@{images[f'{REGISTRY}/repo-1'][5]['imageDigest']}",
+        ]
+    )
+
+    file_name = str(tmp_path / "catalogue.npz")
+    with CatalogueSink(file_name, created_at=NOW) as sink:
+        for repository_uri, repository_images in images.items():
+            for image in random.sample(repository_images, len(repository_images)):
+                sink.add(repository_uri, image, DELETE, in_use_index)
+
+    return ImageCatalogue.load(file_name), images, in_use_index
+
+
+def test_npy_round_trip():
+    columns = [
+        array("i", [0, 1, 2**31 - 1]),
+        array("q", [-(2**40), 0, 2**62]),
+        array("B", [True, False, True]),
+        bytearray("ünïcode".encode("utf-8")),
+    ]
+
+    for column in columns:
+        assert _decode_npy(_encode_npy(column)) == column
+
+
+def test_string_column():
+    values = ["sha256:abc", "", "ünïcode tag"]
+    column = StringColumn()
+    for value in values:
+        column.append(value)
+
+    assert list(column) == values
+    assert column[2] == "ünïcode tag"
+    assert list(column.offsets) == [0, 10, 10, 23]
+
+
+def test_catalogue_round_trip(catalogue_and_images):
+    catalogue, images, _ = catalogue_and_images
+
+    assert catalogue.created_at == NOW
+    assert len(catalogue) == sum(len(repository) for repository in images.values())
+    assert sorted(catalogue.repositories) == sorted(images)
+    assert sum(catalogue.columns["in_use"]) == 2
+    assert {catalogue.columns["digest"][index] for index in range(len(catalogue))} == {
+        image["imageDigest"] for repository in images.values() for image in repository
+    }
+
+
+def test_what_if_matches_retention_policy(catalogue_and_images, monkeypatch):
+    catalogue, images, in_use_index = catalogue_and_images
+    # the pure Python evaluation, whether or not numpy is installed
+    monkeypatch.setitem(sys.modules, "numpy", None)
+
+    results = catalogue.what_if(
+        [keep_min_count for keep_min_count, _ in POLICIES],
+        [days for _, days in POLICIES],
+    )
+
+    for result in results:
+        assert {
+            "images_to_delete": result["images_to_delete"],
+            "bytes_to_delete": result["bytes_to_delete"],
+        } == expected_deletions(
+            images,
+            in_use_index,
+            result["keep_min_count"],
+            result["keep_images_newer_than_days"],
+        )
+
+
+def test_vectorised_what_if_matches_python(catalogue_and_images, monkeypatch):
+    pytest.importorskip("numpy")
+    catalogue, _, _ = catalogue_and_images
+    keep_min_counts, days = [0, 1, 3, 10], [0, 1, 7, 30]
+
+    vectorised = catalogue.what_if(keep_min_counts, days)
+    monkeypatch.setitem(sys.modules, "numpy", None)
+
+    assert vectorised == catalogue.what_if(keep_min_counts, days)
+
+
+def test_catalogue_of_a_scan(ecr_cleaner, tmp_path):
+    file_name = str(tmp_path / "catalogue.npz")
+
+    with CatalogueSink(file_name, created_at=ecr_cleaner.now) as sink:
+        ecr_cleaner.report = sink
+        plan = ecr_cleaner.build_plan()
+
+    catalogue = ImageCatalogue.load(file_name)
+    [result] = catalogue.what_if(
+        [ecr_cleaner.retention_policy.keep_min_count],
+        [(ecr_cleaner.now - ecr_cleaner.keep_images_newer_than_days).days],
+    )
+
+    assert result["images_to_delete"] == plan.total_delete
+
+
+def test_what_if_command(catalogue_and_images, tmp_path, monkeypatch, capsys):
+    catalogue, _, _ = catalogue_and_images
+    catalogue_file = str(tmp_path / "catalogue.npz")
+    catalogue.save(catalogue_file)
+    output_file = str(tmp_path / "what-if.json")
+
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "what_if",
+            catalogue_file,
+            "--keep-min",
+            "1,3",
+            "--days",
+            "7,30",
+            "--output",
+            output_file,
+        ],
+    )
+    what_if.main()
+
+    with open(output_file) as file:
+        results = json.load(file)
+
+    assert [
+        (result["keep_min_count"], result["keep_images_newer_than_days"])
+        for result in results
+    ] == [(1, 7), (1, 30), (3, 7), (3, 30)]
+    assert "180 images in 3 repositories" in capsys.readouterr().out
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+
+from ecr_cleaner import config
+from ecr_cleaner.cleaner.checkpoint import RunCheckpoint
+from ecr_cleaner.store import LocalFileStore
+
+
+@pytest.fixture(scope="function")
+def state_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "STATE_STORE", str(tmp_path))
+    return tmp_path
+
+
+def test_interrupted_scan_is_resumed(ecr_cleaner, state_store, mocker):
+    full_plan = ecr_cleaner.build_plan()
+
+    ecr_cleaner.reset()
+    ecr_cleaner.set_time_budget(900)
+    with patch.object(
+        ecr_cleaner, "out_of_time", side_effect=[False, False, True, True, True]
+    ):
+        partial_plan = ecr_cleaner.build_plan()
+
+    assert not ecr_cleaner.plan_complete
+    assert not ecr_cleaner.completed
+    assert set(partial_plan) <= set(full_plan)
+    assert (state_store / "checkpoint.json").exists()
+
+    ecr_cleaner.reset()
+    ecr_cleaner.set_time_budget(900)
+    assert len(ecr_cleaner.checkpoint.scanned) == 2
+    get_running_task_images = mocker.spy(
+        ecr_cleaner.ecs_manager, "get_running_task_images"
+    )
+
+    assert ecr_cleaner.plan == full_plan
+    assert ecr_cleaner.plan_complete
+    get_running_task_images.assert_not_called()
+
+    # a finished scan is not saved, the checkpoint is cleared once the plan is applied
+    assert len(RunCheckpoint(LocalFileStore(state_store), "").scanned) == 2
+    ecr_cleaner.run()
+    assert not (state_store / "checkpoint.json").exists()
+
+
+def test_interrupted_deletion_is_resumed(ecr_cleaner, state_store, mocker, monkeypatch):
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    monkeypatch.setattr(config, "SLACK_ENABLED", True)
+    plan = ecr_cleaner.plan
+
+    ecr_cleaner.set_time_budget(900)
+    ecr_cleaner.deadline = time.monotonic() - 1
+    ecr_cleaner.delete_old_images(plan=plan)
+
+    assert not ecr_cleaner.completed
+
+    ecr_cleaner.reset()
+    ecr_cleaner.set_time_budget(900)
+    send_message = mocker.patch.object(ecr_cleaner.slack_notifier, "send_message")
+    delete_images = mocker.patch.object(
+        ecr_cleaner.ecr_manager,
+        "delete_images",
+        side_effect=lambda repository_name, images_to_delete, out_of_time: {
+            "deleted": len(images_to_delete),
+            "failed": 0,
+            "retried": 0,
+        },
+    )
+
+    ecr_cleaner.run()
+
+    assert ecr_cleaner.resuming_deletion
+    assert ecr_cleaner.plan == plan
+    assert ecr_cleaner.completed
+    assert delete_images.call_count == len(plan)
+    send_message.assert_not_called()
+    assert not (state_store / "checkpoint.json").exists()
+
+
+def test_old_checkpoint_is_ignored(ecr_cleaner, state_store, monkeypatch):
+    plan = ecr_cleaner.plan
+    ecr_cleaner.set_time_budget(900)
+    ecr_cleaner.checkpoint.save_deletion(plan)
+
+    ecr_cleaner.reset(
+        now=ecr_cleaner.now
+        + timedelta(minutes=config.CHECKPOINT_MAX_AGE_MINUTES, seconds=1)
+    )
+    ecr_cleaner.set_time_budget(900)
+
+    assert ecr_cleaner.checkpoint.pending is None
+    ecr_cleaner.plan
+    assert not ecr_cleaner.resuming_deletion
+
+    # a recent one is resumed
+    ecr_cleaner.checkpoint.save_deletion(plan)
+    ecr_cleaner.reset(now=plan.created_at + timedelta(minutes=1))
+    ecr_cleaner.set_time_budget(900)
+
+    assert ecr_cleaner.checkpoint.pending == plan
+
+
+def test_finished_run_writes_no_checkpoint(ecr_cleaner, state_store, mocker):
+    # e.g. a read-only STATE_STORE in Lambda
+    save = mocker.patch.object(
+        LocalFileStore, "save", side_effect=OSError(30, "Read-only file system")
+    )
+    delete = mocker.patch.object(LocalFileStore, "delete")
+    ecr_cleaner.set_time_budget(900)
+
+    ecr_cleaner.run()
+
+    assert ecr_cleaner.completed
+    save.assert_not_called()
+    delete.assert_not_called()
+
+
+def test_checkpoint_that_can_not_be_saved_does_not_fail_the_run(
+    ecr_cleaner, state_store, mocker
+):
+    mocker.patch.object(
+        LocalFileStore, "save", side_effect=OSError(30, "Read-only file system")
+    )
+    ecr_cleaner.set_time_budget(900)
+    ecr_cleaner.deadline = time.monotonic() - 1
+
+    ecr_cleaner.run()
+
+    assert not ecr_cleaner.plan_complete
+    assert not (state_store / "checkpoint.json").exists()
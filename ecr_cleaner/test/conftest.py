@@ -74,6 +74,7 @@ def ecr_manager(monkeypatch, ecr_data):
                         "imageDigest": image_data["imageDigest"],
                         "imageTag": image_data["imageTag"],
                         "imageTags": image_data["imageTags"],
+                        "imageSizeInBytes": image_data["imageSizeInBytes"],
                     }
                 )
             return {"imageDetails": image_details}
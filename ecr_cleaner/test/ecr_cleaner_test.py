@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
+import json
+from datetime import timedelta
 from unittest.mock import call
 
 from ecr_cleaner import config
+from ecr_cleaner.cleaner import CleanupPlan
 
 
 def test_property_images_to_delete(ecr_cleaner, ecr_data, mocker):
@@ -26,6 +29,25 @@ def test_property_images_to_delete(ecr_cleaner, ecr_data, mocker):
                 assert image["daysSincePushed"] >= config.KEEP_IMAGES_NEWER_THAN_DAYS
 
 
+def test_concurrent_scan_matches_serial_scan(ecr_cleaner):
+    serial_plan = ecr_cleaner.build_plan()
+
+    ecr_cleaner.scan_workers = 4
+    concurrent_plan = ecr_cleaner.build_plan()
+
+    assert concurrent_plan == serial_plan
+    assert list(concurrent_plan) == list(serial_plan)
+
+
+def test_overlapped_discovery_matches_sequential_discovery(ecr_cleaner):
+    sequential_plan = ecr_cleaner.build_plan()
+
+    ecr_cleaner.overlap_discovery = True
+    ecr_cleaner.scan_workers = 4
+
+    assert ecr_cleaner.build_plan() == sequential_plan
+
+
 def test_send_slack_notifier(ecr_cleaner, mocker):
 
     config.SLACK_ENABLED = True
@@ -90,3 +112,145 @@ def test_delete_old_images_when_delete_is_not_enabled(ecr_cleaner, mocker):
     ecr_cleaner.run()
 
     assert not mock_delete_images.mock_calls
+
+
+def test_plan_is_computed_once(ecr_cleaner, mocker):
+
+    config.DELETE_ENABLED = True
+    mocker.patch.object(ecr_cleaner.ecr_manager, "delete_images")
+    get_running_task_images = mocker.spy(
+        ecr_cleaner.ecs_manager, "get_running_task_images"
+    )
+
+    images_to_delete = ecr_cleaner.images_to_delete
+    ecr_cleaner.run()
+
+    assert ecr_cleaner.images_to_delete == images_to_delete
+    get_running_task_images.assert_called_once()
+
+    config.DELETE_ENABLED = False
+
+
+def test_run_saved_plan(ecr_cleaner, tmp_path, mocker):
+
+    config.DELETE_ENABLED = True
+    plan_file = tmp_path / "plan.json"
+    ecr_cleaner.plan.save(plan_file)
+
+    loaded_plan = CleanupPlan.load(plan_file)
+
+    assert loaded_plan == ecr_cleaner.plan
+    assert loaded_plan.aws_region == config.AWS_REGION
+    assert loaded_plan.created_at == ecr_cleaner.plan.created_at
+
+    mock_delete_images = mocker.patch.object(ecr_cleaner.ecr_manager, "delete_images")
+    build_plan = mocker.spy(ecr_cleaner, "build_plan")
+
+    ecr_cleaner.run(plan=loaded_plan)
+
+    build_plan.assert_not_called()
+    assert mock_delete_images.mock_calls == [
+        call(repository_name=repo, images_to_delete=image_digests)
+        for repo, image_digests in loaded_plan.items()
+    ]
+
+    config.DELETE_ENABLED = False
+
+
+def test_delete_old_images_in_parallel(ecr_cleaner, mocker, monkeypatch):
+
+    monkeypatch.setattr(config, "DELETE_WORKERS", 4)
+    mock_delete_images = mocker.patch.object(
+        ecr_cleaner.ecr_manager,
+        "delete_images",
+        side_effect=lambda repository_name, images_to_delete: {
+            "deleted": len(images_to_delete),
+            "failed": 0,
+            "retried": 0,
+        },
+    )
+
+    results = ecr_cleaner.delete_old_images(plan=ecr_cleaner.plan)
+
+    assert mock_delete_images.call_count == len(ecr_cleaner.plan)
+    assert results == {
+        repo: {"deleted": len(image_digests), "failed": 0, "retried": 0}
+        for repo, image_digests in ecr_cleaner.plan.items()
+    }
+
+
+def test_run_summary(ecr_cleaner, tmp_path, monkeypatch):
+
+    summary_file = tmp_path / "summary.json"
+    monkeypatch.setattr(config, "METRICS_SUMMARY_FILE", str(summary_file))
+
+    ecr_cleaner.run()
+
+    summary = json.loads(summary_file.read_text())
+
+    assert {"ecs_discovery", "ecr_scan"} <= set(summary["phases"])
+    assert summary["items"]["repositories_scanned"] == len(
+        list(ecr_cleaner.ecr_manager.get_all_repositories())
+    )
+    assert summary["items"]["images_to_delete"] == ecr_cleaner.plan.total_delete
+
+
+def test_plan_knows_the_bytes_to_reclaim(ecr_cleaner, ecr_data):
+    plan = ecr_cleaner.plan
+
+    assert plan.total_bytes == sum(
+        image["imageSizeInBytes"]
+        for repository_name, image_digests in plan.items()
+        for image in ecr_data[repository_name]["images"]
+        if image["imageDigest"] in image_digests
+    )
+    assert f"*Total*: {plan.total_delete} images" in ecr_cleaner.slack_message(plan)
+
+
+def test_run_deletes_the_largest_repositories_within_budget(
+    ecr_cleaner, mocker, monkeypatch
+):
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    monkeypatch.setattr(config, "DELETE_MAX_API_CALLS", 1)
+    mock_delete_images = mocker.patch.object(
+        ecr_cleaner.ecr_manager,
+        "delete_images",
+        return_value={"deleted": 0, "failed": 0},
+    )
+
+    plan = ecr_cleaner.plan
+    largest = max(plan, key=plan.repository_bytes)
+    summary = ecr_cleaner.run()
+
+    mock_delete_images.assert_called_once_with(
+        repository_name=largest, images_to_delete=plan[largest]
+    )
+    assert summary["items"]["bytes_to_delete"] == plan.repository_bytes(largest)
+
+
+def test_reset_starts_a_new_run(ecr_cleaner):
+
+    first_plan = ecr_cleaner.plan
+    first_metrics = ecr_cleaner.metrics
+    ecr_client = ecr_cleaner.ecr_client
+    later = ecr_cleaner.now + timedelta(days=1)
+
+    ecr_cleaner.reset(now=later)
+
+    assert ecr_cleaner.now == later
+    assert ecr_cleaner.ecr_client is ecr_client
+    assert ecr_cleaner.metrics is not first_metrics
+    assert ecr_cleaner.ecr_manager.metrics is ecr_cleaner.metrics
+    assert ecr_cleaner.plan is not first_plan
+    assert ecr_cleaner.plan.created_at == later
+
+
+def test_slack_notifier_is_created_when_used(ecr_cleaner, mocker):
+
+    assert ecr_cleaner._slack_notifier is None
+
+    mock_send_message = mocker.patch.object(ecr_cleaner.slack_notifier, "send_message")
+    ecr_cleaner.send_slack_notice(plan=ecr_cleaner.plan)
+
+    mock_send_message.assert_called_once()
+    assert ecr_cleaner.slack_notifier.metrics is ecr_cleaner.metrics
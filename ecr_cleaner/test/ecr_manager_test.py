@@ -2,9 +2,16 @@
 import random
 
 import pytest
+from botocore.exceptions import ClientError
 
 from ecr_cleaner import config
 
+DIGESTS = [f"sha256:{index:064x}" for index in range(250)]
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "BatchDeleteImage")
+
 
 def test_get_all_repositories(ecr_data, ecr_manager):
 
@@ -40,6 +47,17 @@ def test_fetch_repository_images(ecr_data, ecr_manager):
             )
 
 
+def test_iter_repository_images(ecr_data, ecr_manager):
+
+    for ec_repo in ecr_manager.get_all_repositories():
+        image_data = ecr_manager.iter_repository_images(repository_name=ec_repo["name"])
+
+        assert not isinstance(image_data, list)
+        assert list(image_data) == ecr_manager.fetch_repository_images(
+            repository_name=ec_repo["name"]
+        )
+
+
 @pytest.mark.skip("this may be due to moto library but, needs further investigation")
 def test_delete_images(ecr_data, ecr_manager):
     # Get all repositories from the ecr_manager
@@ -62,3 +80,88 @@ def test_delete_images(ecr_data, ecr_manager):
         remaining_images = [image["imageDigest"] for image in response["imageDetails"]]
 
         assert set(images_to_delete).issubset(set(remaining_images)) is False
+
+
+def test_delete_images_retries_throttled_and_failed_batches(ecr_manager, mocker):
+    ecr_manager.retry_backoff_seconds = 0
+    responses = [
+        client_error("ThrottlingException"),
+        {
+            "imageIds": [],
+            "failures": [
+                {
+                    "imageId": {"imageDigest": DIGESTS[100]},
+                    "failureCode": "ImageReferencedByManifestList",
+                },
+                {
+                    "imageId": {"imageDigest": DIGESTS[101]},
+                    "failureCode": "ImageNotFound",
+                },
+            ],
+        },
+        {"imageIds": [], "failures": []},
+        {"imageIds": [], "failures": []},
+    ]
+    batch_delete_image = mocker.patch.object(
+        ecr_manager.ecr_client, "batch_delete_image", side_effect=responses
+    )
+
+    result = ecr_manager.delete_images("mock-ecr-repo-1", DIGESTS[:200])
+
+    assert result == {"deleted": 199, "failed": 1, "retried": 101}
+    assert batch_delete_image.call_count == 4
+    retried_batch = batch_delete_image.mock_calls[-1].kwargs["imageIds"]
+    assert retried_batch == [{"imageDigest": DIGESTS[100]}]
+
+
+def test_delete_images_continues_after_failed_batch(ecr_manager, mocker):
+    ecr_manager.retry_backoff_seconds = 0
+    batch_delete_image = mocker.patch.object(
+        ecr_manager.ecr_client,
+        "batch_delete_image",
+        side_effect=[
+            client_error("AccessDeniedException"),
+            {"imageIds": [], "failures": []},
+            {"imageIds": [], "failures": []},
+        ],
+    )
+
+    result = ecr_manager.delete_images("mock-ecr-repo-1", DIGESTS)
+
+    assert result == {"deleted": 150, "failed": 100, "retried": 0}
+    assert batch_delete_image.call_count == 3
+
+
+def test_delete_images_gives_up_after_max_retries(ecr_manager, mocker):
+    ecr_manager.retry_backoff_seconds = 0
+    ecr_manager.max_retries = 2
+    batch_delete_image = mocker.patch.object(
+        ecr_manager.ecr_client,
+        "batch_delete_image",
+        side_effect=client_error("ThrottlingException"),
+    )
+
+    result = ecr_manager.delete_images("mock-ecr-repo-1", DIGESTS[:10])
+
+    assert result == {"deleted": 0, "failed": 10, "retried": 20}
+    assert batch_delete_image.call_count == 3
+
+
+def test_delete_images_stops_when_out_of_time(ecr_manager, mocker):
+    batch_delete_image = mocker.patch.object(
+        ecr_manager.ecr_client,
+        "batch_delete_image",
+        return_value={"imageIds": [], "failures": []},
+    )
+
+    result = ecr_manager.delete_images(
+        "mock-ecr-repo-1", DIGESTS, out_of_time=iter([False, True]).__next__
+    )
+
+    assert result == {
+        "deleted": 100,
+        "failed": 0,
+        "retried": 0,
+        "pending": DIGESTS[100:],
+    }
+    assert batch_delete_image.call_count == 1
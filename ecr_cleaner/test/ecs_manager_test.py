@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+import pytest
+
+from ecr_cleaner.manager import ECSManager, IncompleteInventoryError
+
+
 def test_get_running_task_images(ecs_data, ecs_manager):
 
     images_in_use = ecs_manager.get_running_task_images()
@@ -13,3 +18,184 @@ def test_get_running_task_images(ecs_data, ecs_manager):
                 We can not test, if image is not in the STOPPED task.
                 Stopped task may still have the same image in container definition as running task
             """
+
+
+def test_task_definition_resolved_once(ecs_manager, mocker):
+    describe_task_definition = mocker.spy(
+        ecs_manager.ecs_client, "describe_task_definition"
+    )
+
+    images_in_use = ecs_manager.get_running_task_images()
+    unique_task_definitions = len(ecs_manager.task_definition_cache)
+
+    assert describe_task_definition.call_count == unique_task_definitions
+    assert ecs_manager.cache_stats["misses"] == unique_task_definitions
+
+    assert ecs_manager.get_running_task_images() == images_in_use
+    assert describe_task_definition.call_count == unique_task_definitions
+    assert ecs_manager.cache_stats["hits"] >= unique_task_definitions
+
+
+def test_get_running_tasks_paginates_and_batches(ecs_manager, mocker):
+    task_arns = [f"arn:aws:ecs:eu-west-2:123456789012:task/{i}" for i in range(250)]
+    pages = [{"taskArns": task_arns[i : i + 90]} for i in range(0, 250, 90)]
+
+    paginator = mocker.MagicMock()
+    paginator.paginate.return_value = pages
+    mocker.patch.object(ecs_manager.ecs_client, "get_paginator", return_value=paginator)
+    describe_tasks = mocker.patch.object(
+        ecs_manager.ecs_client,
+        "describe_tasks",
+        side_effect=lambda cluster, tasks: {
+            "tasks": [{"taskArn": arn, "taskDefinitionArn": "td"} for arn in tasks]
+        },
+    )
+
+    tasks = list(ecs_manager.get_running_tasks("mock-ecs-cluster-1"))
+
+    assert [task["taskArn"] for task in tasks] == task_arns
+    assert [len(call.kwargs["tasks"]) for call in describe_tasks.mock_calls] == [
+        100,
+        100,
+        50,
+    ]
+
+
+def test_parallel_cluster_collection_matches_serial(ecs_manager, mocker):
+    serial_images_in_use = ecs_manager.get_running_task_images()
+
+    list_clusters = mocker.spy(ecs_manager.ecs_client, "list_clusters")
+    ecs_manager.cluster_workers = 4
+
+    assert ecs_manager.get_running_task_images() == serial_images_in_use
+    list_clusters.assert_called()
+
+
+def register_task_definition(ecs_client, family, image):
+    return ecs_client.register_task_definition(
+        family=family,
+        containerDefinitions=[{"name": family, "image": image, "memory": 128}],
+    )["taskDefinition"]["taskDefinitionArn"]
+
+
+def test_scaled_to_zero_service_images_are_in_use(ecs_data, ecs_manager):
+    # services are protected by default
+    assert ecs_manager.include_services
+    cluster_name = next(iter(ecs_data))
+    task_definition_arn = register_task_definition(
+        ecs_manager.ecs_client, "scaled-to-zero", "mock-ecr-repo-1:scaled-to-zero"
+    )
+    ecs_manager.ecs_client.create_service(
+        cluster=cluster_name,
+        serviceName="scaled-to-zero",
+        taskDefinition=task_definition_arn,
+        desiredCount=0,
+    )
+
+    assert "mock-ecr-repo-1:scaled-to-zero" in ecs_manager.get_running_task_images()
+
+    ecs_manager.include_services = False
+    ecs_manager.task_definition_cache.clear()
+
+    assert "mock-ecr-repo-1:scaled-to-zero" not in ecs_manager.get_running_task_images()
+
+
+def test_denied_list_services_fails_the_inventory(ecs_manager, mocker):
+    ecs_manager.include_services = True
+    mocker.patch.object(
+        ecs_manager.ecs_client,
+        "list_services",
+        side_effect=Exception("AccessDeniedException"),
+    )
+
+    _, complete = ecs_manager.get_cluster_images()
+
+    assert not complete
+    with pytest.raises(IncompleteInventoryError):
+        ecs_manager.get_running_task_images()
+
+
+def test_get_services_paginates_and_batches(ecs_manager, mocker):
+    service_arns = [
+        f"arn:aws:ecs:eu-west-2:123456789012:service/{i}" for i in range(25)
+    ]
+
+    paginator = mocker.MagicMock()
+    paginator.paginate.return_value = [
+        {"serviceArns": service_arns[:12]},
+        {"serviceArns": service_arns[12:]},
+    ]
+    mocker.patch.object(ecs_manager.ecs_client, "get_paginator", return_value=paginator)
+    describe_services = mocker.patch.object(
+        ecs_manager.ecs_client,
+        "describe_services",
+        side_effect=lambda cluster, services: {
+            "services": [{"serviceArn": arn} for arn in services]
+        },
+    )
+
+    services = list(ecs_manager.get_services("mock-ecs-cluster-1"))
+
+    assert [service["serviceArn"] for service in services] == service_arns
+    assert [len(call.kwargs["services"]) for call in describe_services.mock_calls] == [
+        10,
+        10,
+        5,
+    ]
+
+
+def test_service_task_definitions_include_live_deployments():
+    service = {
+        "taskDefinition": "td:3",
+        "deployments": [
+            {"status": "PRIMARY", "taskDefinition": "td:3"},
+            {"status": "ACTIVE", "taskDefinition": "td:2"},
+            {"status": "INACTIVE", "taskDefinition": "td:1"},
+        ],
+        "taskSets": [{"status": "ACTIVE", "taskDefinition": "td:4"}],
+    }
+
+    assert set(ECSManager.service_task_definitions(service)) == {
+        "td:2",
+        "td:3",
+        "td:4",
+    }
+
+
+def test_most_recent_active_revisions(ecs_manager, mocker):
+    arn = "arn:aws:ecs:eu-west-2:123456789012:task-definition/{}".format
+    pages = {
+        "list_task_definition_families": {
+            "families": ["scheduled", "scheduled-worker"]
+        },
+        # sorted by family, then newest revision first, like the ECS API
+        ("list_task_definitions", "scheduled"): {
+            "taskDefinitionArns": [
+                arn("scheduled:3"),
+                arn("scheduled:2"),
+                arn("scheduled:1"),
+                arn("scheduled-worker:1"),
+            ]
+        },
+        ("list_task_definitions", "scheduled-worker"): {
+            "taskDefinitionArns": [arn("scheduled-worker:1")]
+        },
+    }
+
+    def get_paginator(operation_name):
+        paginator = mocker.MagicMock()
+        paginator.paginate.side_effect = lambda familyPrefix=None, **kwargs: [
+            pages[(operation_name, familyPrefix) if familyPrefix else operation_name]
+        ]
+        return paginator
+
+    mocker.patch.object(
+        ecs_manager.ecs_client, "get_paginator", side_effect=get_paginator
+    )
+    ecs_manager.active_revisions = 2
+
+    assert list(ecs_manager.get_active_task_definitions()) == [
+        arn("scheduled:3"),
+        arn("scheduled:2"),
+        arn("scheduled-worker:1"),
+    ]
@@ -8,9 +8,25 @@ import pytest
 
 
 class MockDataGenerator:
-    def __init__(self):
-        self._ecr_data = self.generate_ecr_data(repo_count=5)
-        self._ecs_data = self.generate_ecs_data(ecr_repositories=self._ecr_data)
+    def __init__(
+        self,
+        repo_count=5,
+        images_per_repo=15,
+        cluster_count=3,
+        tasks_per_cluster=3,
+    ):
+        """
+        Defaults are sized for the unit tests, the benchmarks generate accounts with thousands
+        of repositories and tasks from the same generator.
+        """
+        self._ecr_data = self.generate_ecr_data(
+            repo_count=repo_count, images_per_repo=images_per_repo
+        )
+        self._ecs_data = self.generate_ecs_data(
+            ecr_repositories=self._ecr_data,
+            cluster_count=cluster_count,
+            tasks_per_cluster=tasks_per_cluster,
+        )
 
     def generate_mock_sha256(self):
         """
@@ -76,6 +92,7 @@ class MockDataGenerator:
                 repositories[repository_name]["images"].append(
                     {
                         "imageDigest": image_digest,
+                        "imageSizeInBytes": random.randint(5, 500) * 1024 * 1024,
                         "imageTag": image_tag,
                         "imageTags": sorted(image_tags),
                         "imagePushedAt": image_pushed_at,
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from ecr_cleaner import config
+from ecr_cleaner.helper import clear_aws_clients, get_aws_client
+
+
+def test_aws_clients_are_cached_and_tuned():
+    clear_aws_clients()
+
+    ecr_client = get_aws_client("ecr", region_name=config.AWS_REGION)
+
+    assert get_aws_client("ecr", region_name=config.AWS_REGION) is ecr_client
+    assert get_aws_client("ecs", region_name=config.AWS_REGION) is not ecr_client
+    assert (
+        get_aws_client("ecr", region_name=config.AWS_REGION, max_pool_connections=50)
+        is not ecr_client
+    )
+
+    client_config = ecr_client.meta.config
+    assert client_config.retries["mode"] == "adaptive"
+    assert client_config.max_pool_connections == config.AWS_MAX_POOL_CONNECTIONS
+    assert client_config.connect_timeout == config.AWS_CONNECT_TIMEOUT
+    assert client_config.read_timeout == config.AWS_READ_TIMEOUT
+
+
+def test_cleaners_of_a_region_share_clients(ecr_cleaner):
+    second_cleaner = type(ecr_cleaner)(
+        aws_region=config.AWS_REGION, slack_token="fake-token"
+    )
+
+    assert second_cleaner.ecr_client is ecr_cleaner.ecr_client
+    assert second_cleaner.ecs_client is ecr_cleaner.ecs_client
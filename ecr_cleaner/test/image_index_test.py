@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from ecr_cleaner.manager import InUseImageIndex
+
+REPOSITORY_URI = "123456789012.dkr.ecr.eu-west-2.amazonaws.com/mock-ecr-repo-1"
+DIGEST = "sha256:" + "a" * 64
+
+
+def test_index_by_tag():
+    index = InUseImageIndex([f"{REPOSITORY_URI}:v1"])
+
+    assert index.get(REPOSITORY_URI) == {"tags": {"v1"}, "digests": set()}
+    assert index.is_in_use(REPOSITORY_URI, DIGEST, image_tag="v1")
+    assert index.is_in_use(REPOSITORY_URI, DIGEST, image_tags=["latest", "v1"])
+    assert not index.is_in_use(REPOSITORY_URI, DIGEST, image_tags=["v2"])
+    assert not index.is_in_use(f"{REPOSITORY_URI}-other", DIGEST, image_tag="v1")
+
+
+def test_index_by_digest():
+    index = InUseImageIndex([f"{REPOSITORY_URI}@{DIGEST}"])
+
+    assert index.get(REPOSITORY_URI) == {"tags": set(), "digests": {DIGEST}}
+    assert index.is_in_use(REPOSITORY_URI, DIGEST)
+    assert index.is_in_use(REPOSITORY_URI, DIGEST, image_tags=["v2"])
+    assert not index.is_in_use(REPOSITORY_URI, "sha256:" + "b" * 64, image_tag="v1")
+
+
+def test_index_ignores_references_without_tag_or_digest():
+    index = InUseImageIndex([REPOSITORY_URI, "localhost:5000/mock-ecr-repo-1"])
+
+    assert index.get(REPOSITORY_URI) is None
+    assert index.get("localhost") is None
+    assert REPOSITORY_URI in index
+    assert len(index) == 2
+
+
+def test_match_reports_how_image_is_referenced():
+    index = InUseImageIndex([f"{REPOSITORY_URI}:v1", f"{REPOSITORY_URI}@{DIGEST}"])
+
+    assert index.match(REPOSITORY_URI, DIGEST, image_tags=["v1"]) == "digest"
+    assert index.match(REPOSITORY_URI, "sha256:" + "b" * 64, image_tag="v1") == "tag"
+    assert index.match(REPOSITORY_URI, "sha256:" + "b" * 64, image_tags=["v2"]) is None
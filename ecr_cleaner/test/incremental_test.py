@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+import pytest
+
+from ecr_cleaner import config
+from ecr_cleaner.cleaner.incremental import RepositoryStateCache
+from ecr_cleaner.store import LocalFileStore
+
+
+def state_cache(tmp_path, full_scan_interval=timedelta(days=7)):
+    return RepositoryStateCache(
+        store=LocalFileStore(tmp_path),
+        keep_min_count=config.KEEP_MIN_IMAGE_COUNT,
+        keep_images_for=timedelta(days=config.KEEP_IMAGES_NEWER_THAN_DAYS),
+        full_scan_interval=full_scan_interval,
+    )
+
+
+@pytest.fixture(scope="function")
+def image_ids(ecr_cleaner, ecr_data, mocker):
+    """list_images answered from the same mock data as describe_images."""
+    repositories = {
+        repository_name: [
+            {"imageDigest": image["imageDigest"], "imageTag": tag}
+            for image in repository["images"]
+            for tag in image["imageTags"]
+        ]
+        for repository_name, repository in ecr_data.items()
+    }
+    mocker.patch.object(
+        ecr_cleaner.ecr_manager,
+        "iter_repository_image_ids",
+        side_effect=lambda repository_name: iter(repositories[repository_name]),
+    )
+    return repositories
+
+
+def test_unchanged_repositories_are_revalidated(
+    ecr_cleaner, image_ids, tmp_path, mocker
+):
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    full_scan_plan = ecr_cleaner.build_plan()
+
+    assert ecr_cleaner.repository_state.rescanned == len(image_ids)
+
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    describe_images = mocker.spy(ecr_cleaner.ecr_manager, "iter_repository_image_pages")
+
+    assert ecr_cleaner.build_plan() == full_scan_plan
+    assert ecr_cleaner.repository_state.revalidated == len(image_ids)
+    describe_images.assert_not_called()
+
+
+def test_revalidated_candidates_keep_their_size(ecr_cleaner, image_ids, tmp_path):
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    full_scan_plan = ecr_cleaner.build_plan()
+
+    ecr_cleaner.reset()
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    plan = ecr_cleaner.build_plan()
+
+    assert ecr_cleaner.repository_state.revalidated == len(image_ids)
+    assert plan.total_bytes == full_scan_plan.total_bytes > 0
+    assert {
+        repository_name: plan.repository_bytes(repository_name)
+        for repository_name in plan
+    } == {
+        repository_name: full_scan_plan.repository_bytes(repository_name)
+        for repository_name in full_scan_plan
+    }
+
+
+def test_runs_with_a_report_scan_every_repository(
+    ecr_cleaner, ecr_data, image_ids, tmp_path, mocker
+):
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    full_scan_plan = ecr_cleaner.build_plan()
+
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    ecr_cleaner.report = report = mocker.Mock()
+
+    assert ecr_cleaner.build_plan() == full_scan_plan
+    assert ecr_cleaner.repository_state.revalidated == 0
+    assert report.add.call_count == sum(
+        repository["totalImages"] for repository in ecr_data.values()
+    )
+
+
+@pytest.mark.parametrize(
+    "setting, value",
+    [("KEEP_MIN_IMAGE_COUNT", 1000), ("KEEP_IMAGES_NEWER_THAN_DAYS", 1000)],
+)
+def test_changed_retention_settings_scan_every_repository(
+    ecr_cleaner, image_ids, tmp_path, mocker, monkeypatch, setting, value
+):
+    monkeypatch.setattr(config, "INCREMENTAL_SCAN", True)
+    monkeypatch.setattr(config, "STATE_STORE", str(tmp_path))
+    ecr_cleaner.reset()
+    assert ecr_cleaner.build_plan()
+
+    monkeypatch.setattr(config, setting, value)
+    ecr_cleaner.reset()
+    describe_images = mocker.spy(ecr_cleaner.ecr_manager, "iter_repository_image_pages")
+
+    assert not ecr_cleaner.build_plan()
+    assert ecr_cleaner.repository_state.revalidated == 0
+    assert describe_images.call_count == len(image_ids)
+
+
+def test_changed_repository_is_scanned_again(ecr_cleaner, image_ids, tmp_path, mocker):
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    full_scan_plan = ecr_cleaner.build_plan()
+
+    image_ids["mock-ecr-repo-1"].append({"imageDigest": "sha256:" + "f" * 64})
+
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    describe_images = mocker.spy(ecr_cleaner.ecr_manager, "iter_repository_image_pages")
+
+    assert ecr_cleaner.build_plan() == full_scan_plan
+    describe_images.assert_called_once_with(repository_name="mock-ecr-repo-1")
+
+
+def test_repositories_are_scanned_again_after_full_scan_interval(
+    ecr_cleaner, image_ids, tmp_path
+):
+    ecr_cleaner.repository_state = state_cache(tmp_path, timedelta(0))
+    ecr_cleaner.build_plan()
+
+    ecr_cleaner.repository_state = state_cache(tmp_path, timedelta(0))
+    ecr_cleaner.build_plan()
+
+    assert ecr_cleaner.repository_state.revalidated == 0
+    assert ecr_cleaner.repository_state.rescanned == len(image_ids)
+
+
+def test_deleted_images_keep_repository_unchanged(ecr_cleaner, image_ids, tmp_path):
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+    plan = ecr_cleaner.build_plan()
+
+    for repository_name, image_digests in plan.items():
+        ecr_cleaner.repository_state.forget_deleted(repository_name, image_digests)
+        image_ids[repository_name] = [
+            image_id
+            for image_id in image_ids[repository_name]
+            if image_id["imageDigest"] not in image_digests
+        ]
+    ecr_cleaner.repository_state.save()
+
+    ecr_cleaner.repository_state = state_cache(tmp_path)
+
+    assert not ecr_cleaner.build_plan()
+    assert ecr_cleaner.repository_state.revalidated == len(image_ids)
+
+
+def test_deleting_a_saved_plan_keeps_repository_state(
+    ecr_cleaner, image_ids, tmp_path, mocker, monkeypatch
+):
+    monkeypatch.setattr(config, "INCREMENTAL_SCAN", True)
+    monkeypatch.setattr(config, "STATE_STORE", str(tmp_path))
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    ecr_cleaner.reset()
+    plan = ecr_cleaner.plan
+
+    # a later run, e.g. with CLEANUP_PLAN_INPUT or resuming a deletion, does not scan
+    ecr_cleaner.reset()
+    mocker.patch.object(
+        ecr_cleaner.ecr_manager,
+        "delete_images",
+        side_effect=lambda repository_name, images_to_delete: {
+            "deleted": len(images_to_delete),
+            "failed": 0,
+            "retried": 0,
+        },
+    )
+    ecr_cleaner.run(plan=plan)
+
+    for repository_name, image_digests in plan.items():
+        image_ids[repository_name] = [
+            image_id
+            for image_id in image_ids[repository_name]
+            if image_id["imageDigest"] not in image_digests
+        ]
+    ecr_cleaner.reset()
+
+    assert not ecr_cleaner.plan
+    assert ecr_cleaner.repository_state.revalidated == len(image_ids)
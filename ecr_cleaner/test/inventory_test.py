@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ecr_cleaner import config
+from ecr_cleaner.manager import (
+    IncompleteInventoryError,
+    InUseImageIndex,
+    InventorySnapshot,
+)
+
+CREATED_AT = datetime(2024, 10, 1, tzinfo=timezone.utc)
+CLUSTERS = {
+    "arn:aws:ecs:eu-west-2:123456789012:cluster/one": [
+        "mock-ecr-repo-1:latest",
+        "mock-ecr-repo-2@sha256:" + "a" * 64,
+    ],
+    "arn:aws:ecs:eu-west-2:123456789012:cluster/two": ["mock-ecr-repo-1:latest"],
+}
+
+
+@pytest.mark.parametrize("file_name", ["inventory.json", "inventory.json.gz"])
+def test_snapshot_round_trip(tmp_path, file_name):
+    snapshot = InventorySnapshot(created_at=CREATED_AT, clusters=CLUSTERS)
+
+    snapshot.save(str(tmp_path / file_name))
+
+    loaded = InventorySnapshot.load(str(tmp_path / file_name))
+    assert loaded == snapshot
+    assert loaded.in_use_images == InUseImageIndex(
+        image_ref for images in CLUSTERS.values() for image_ref in images
+    )
+    # every image reference is written once
+    assert len(snapshot.to_json()["images"]) == 2
+
+
+def test_snapshot_freshness():
+    snapshot = InventorySnapshot(created_at=CREATED_AT, clusters=CLUSTERS)
+    ttl = timedelta(minutes=30)
+
+    assert snapshot.is_fresh(CREATED_AT + timedelta(minutes=10), ttl)
+    assert not snapshot.is_fresh(CREATED_AT + timedelta(minutes=40), ttl)
+    assert not snapshot.is_fresh(CREATED_AT - timedelta(minutes=1), ttl)
+
+
+def test_snapshot_is_reused_within_ttl(ecr_cleaner, tmp_path, mocker, monkeypatch):
+    monkeypatch.setattr(config, "STATE_STORE", str(tmp_path))
+    monkeypatch.setattr(config, "ECS_INVENTORY_TTL_MINUTES", 30)
+    get_cluster_images = mocker.spy(ecr_cleaner.ecs_manager, "get_cluster_images")
+
+    first_plan = ecr_cleaner.build_plan()
+    ecr_cleaner.reset(now=ecr_cleaner.now + timedelta(minutes=10))
+    second_plan = ecr_cleaner.build_plan()
+
+    assert second_plan == first_plan
+    assert get_cluster_images.call_count == 1
+    assert ecr_cleaner.metrics.items["ecs_inventory_reused"] == 1
+
+    ecr_cleaner.reset(now=ecr_cleaner.now + timedelta(hours=1))
+    ecr_cleaner.build_plan()
+
+    assert get_cluster_images.call_count == 2
+
+
+def test_incomplete_inventory_fails_the_plan(
+    ecr_cleaner, tmp_path, mocker, monkeypatch
+):
+    monkeypatch.setattr(config, "ECS_INVENTORY_FILE", str(tmp_path / "inventory.json"))
+    monkeypatch.setattr(config, "ECS_INVENTORY_TTL_MINUTES", 30)
+    mocker.patch.object(
+        ecr_cleaner.ecs_manager,
+        "get_cluster_images",
+        return_value=({}, False),
+    )
+
+    with pytest.raises(IncompleteInventoryError):
+        ecr_cleaner.build_plan()
+
+    assert not (tmp_path / "inventory.json").exists()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+from moto import mock_aws
+
+import lambda_function
+from ecr_cleaner import config
+
+
+@pytest.fixture(scope="function")
+def handler(ecr_manager, ecs_manager, monkeypatch):
+    monkeypatch.setattr(lambda_function, "cleaner", None)
+    with mock_aws():
+        yield lambda_function.run_ecr_cleaner
+
+
+def test_cleaner_is_reused_by_warm_invocations(
+    handler, ecr_manager, ecs_manager, mocker
+):
+    create_cleaner = mocker.spy(lambda_function, "create_cleaner")
+
+    assert handler({}, None)["statusCode"] == 200
+    cleaner = lambda_function.cleaner
+    assert "cold_start_init" in cleaner.metrics.phases
+
+    reset = mocker.spy(cleaner, "reset")
+    assert handler({}, None)["statusCode"] == 200
+
+    create_cleaner.assert_called_once()
+    reset.assert_called_once()
+    assert lambda_function.cleaner is cleaner
+    assert "warm_start_init" in cleaner.metrics.phases
+    assert "cold_start_init" not in cleaner.metrics.phases
+
+
+def test_invocation_without_time_left_is_checkpointed(
+    handler, tmp_path, monkeypatch, mocker
+):
+    monkeypatch.setattr(config, "STATE_STORE", str(tmp_path))
+    context = mocker.Mock(get_remaining_time_in_millis=lambda: 1000)
+
+    response = handler({}, context)
+
+    assert (
+        response["body"] == "ECR cleanup checkpointed, the next invocation resumes it."
+    )
+    assert (tmp_path / "checkpoint.json").exists()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import json
+
+import boto3
+from moto import mock_aws
+
+from ecr_cleaner import config
+from ecr_cleaner.metrics import RunMetrics
+
+
+def test_attach_counts_api_calls():
+    metrics = RunMetrics()
+
+    with mock_aws():
+        ecr_client = metrics.attach(boto3.client("ecr", region_name=config.AWS_REGION))
+        ecr_client.create_repository(repositoryName="mock-ecr-repo-1")
+        paginator = ecr_client.get_paginator("describe_repositories")
+        list(paginator.paginate())
+        ecr_client.describe_repositories()
+
+    assert metrics.api_calls == {
+        "ecr:CreateRepository": 1,
+        "ecr:DescribeRepositories": 2,
+    }
+
+
+def test_summary_and_embedded_metric_format(capsys):
+    metrics = RunMetrics()
+
+    with metrics.phase("ecr_scan"):
+        for repository_name in ("mock-ecr-repo-1", "mock-ecr-repo-2"):
+            with metrics.repository(repository_name):
+                metrics.add("images_described", 100)
+
+    summary = metrics.emit(emf=True, dimensions={"Region": config.AWS_REGION})
+
+    assert set(summary["phases"]) == {"ecr_scan"}
+    assert summary["items"] == {"images_described": 200}
+    assert summary["repository_scan_seconds"]["count"] == 2
+
+    document = json.loads(capsys.readouterr().out)
+    directive = document["_aws"]["CloudWatchMetrics"][0]
+
+    assert directive["Namespace"] == "ECRCleaner"
+    assert directive["Dimensions"] == [["Region"]]
+    assert document["Region"] == config.AWS_REGION
+    assert document["images_described"] == 200
+    assert {"Name": "ecr_scanDuration", "Unit": "Seconds"} in directive["Metrics"]
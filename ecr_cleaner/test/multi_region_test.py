@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from moto import mock_aws
+
+from ecr_cleaner import config
+from ecr_cleaner.cleaner import CleanupPlan
+from ecr_cleaner.cleaner.multi_region import MultiRegionCleaner
+
+REGIONS = ["eu-west-2", "us-east-1"]
+
+
+@pytest.fixture(scope="function")
+def multi_region_cleaner(mocker):
+    with mock_aws():
+        cleaner = MultiRegionCleaner(aws_regions=REGIONS, slack_token="fake-token")
+        for aws_region, region_cleaner in cleaner.cleaners.items():
+            mocker.patch.object(
+                region_cleaner,
+                "build_plan",
+                return_value=CleanupPlan(
+                    {"mock-ecr-repo-1": [f"sha256:{aws_region}"]},
+                    aws_region=aws_region,
+                ),
+            )
+        yield cleaner
+
+
+def test_regions_have_their_own_clients(multi_region_cleaner):
+    for aws_region, cleaner in multi_region_cleaner.cleaners.items():
+        assert cleaner.ecr_client.meta.region_name == aws_region
+        assert cleaner.ecs_client.meta.region_name == aws_region
+
+
+def test_plan_is_merged_across_regions(multi_region_cleaner):
+    assert multi_region_cleaner.plan.repositories == {
+        f"{aws_region}/mock-ecr-repo-1": frozenset([f"sha256:{aws_region}"])
+        for aws_region in REGIONS
+    }
+
+
+def test_run_sends_one_notice_and_deletes_per_region(
+    multi_region_cleaner, mocker, monkeypatch
+):
+    monkeypatch.setattr(config, "SLACK_ENABLED", True)
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+
+    send_message = mocker.patch.object(
+        multi_region_cleaner.slack_notifier, "send_message"
+    )
+    delete_images = {
+        aws_region: mocker.patch.object(cleaner.ecr_manager, "delete_images")
+        for aws_region, cleaner in multi_region_cleaner.cleaners.items()
+    }
+
+    summary = multi_region_cleaner.run()
+
+    send_message.assert_called_once()
+    assert "*Total*: 2" in send_message.call_args.kwargs["message"]
+    for aws_region in REGIONS:
+        delete_images[aws_region].assert_called_once_with(
+            repository_name="mock-ecr-repo-1",
+            images_to_delete=frozenset([f"sha256:{aws_region}"]),
+        )
+        assert f"region:{aws_region}" in summary["phases"]
+    assert set(summary["regions"]) == set(REGIONS)
+
+
+def test_run_applies_and_emits_like_a_single_region(
+    multi_region_cleaner, mocker, monkeypatch, tmp_path
+):
+    summary_file = tmp_path / "summary.json"
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    monkeypatch.setattr(config, "METRICS_SUMMARY_FILE", str(summary_file))
+    update_repository_state = {}
+    for aws_region, cleaner in multi_region_cleaner.cleaners.items():
+        cleaner.repository_state = mocker.Mock()
+        mocker.patch.object(
+            cleaner.ecr_manager,
+            "delete_images",
+            return_value={"deleted": 1, "failed": 0, "retried": 0},
+        )
+        update_repository_state[aws_region] = mocker.spy(
+            cleaner, "_update_repository_state"
+        )
+
+    summary = multi_region_cleaner.run()
+
+    assert json.loads(summary_file.read_text()) == summary
+    for aws_region, cleaner in multi_region_cleaner.cleaners.items():
+        update_repository_state[aws_region].assert_called_once()
+        cleaner.repository_state.forget_deleted.assert_called_once_with(
+            "mock-ecr-repo-1", frozenset([f"sha256:{aws_region}"])
+        )
+
+
+def test_finished_regions_wait_for_the_others(multi_region_cleaner, mocker):
+    eu_west_2, us_east_1 = multi_region_cleaner.cleaners.values()
+    multi_region_cleaner.plan
+    us_east_1.plan_complete = False
+    apply = {
+        cleaner.aws_region: mocker.spy(cleaner, "apply")
+        for cleaner in (eu_west_2, us_east_1)
+    }
+
+    multi_region_cleaner.run()
+
+    # the finished region keeps its scan in its checkpoint for the next run
+    apply["eu-west-2"].assert_not_called()
+    apply["us-east-1"].assert_not_called()
+
+    us_east_1.plan_complete = True
+    multi_region_cleaner.run()
+
+    for aws_region in REGIONS:
+        apply[aws_region].assert_called_once()
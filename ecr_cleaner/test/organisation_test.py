@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import pytest
+from moto import mock_aws
+
+from ecr_cleaner import config
+from ecr_cleaner.cleaner import CleanupPlan
+from ecr_cleaner.cleaner.organisation import OrganisationCleaner
+from ecr_cleaner.helper import AssumedRoleSessions
+
+ACCOUNT_IDS = ["111111111111", "222222222222"]
+
+
+def test_assumed_role_sessions_are_cached(mocker):
+    with mock_aws():
+        sessions = AssumedRoleSessions()
+        create_session = mocker.spy(sessions, "_create_session")
+        role_arn = f"arn:aws:iam::{ACCOUNT_IDS[0]}:role/ecr-cleaner"
+
+        session = sessions.session(role_arn)
+
+        assert sessions.session(role_arn) is session
+        create_session.assert_called_once_with(role_arn)
+
+        credentials = session.get_credentials()
+        assert credentials.method == "sts-assume-role"
+        assert credentials.access_key != "testing"
+        identity = session.client("sts", region_name=config.AWS_REGION)
+        assert identity.get_caller_identity()["Account"] == ACCOUNT_IDS[0]
+
+
+def test_assumed_role_credentials_are_requested_once(mocker):
+    with mock_aws():
+        sessions = AssumedRoleSessions()
+        client = mocker.spy(sessions.base_session, "client")
+
+        session = sessions.session(f"arn:aws:iam::{ACCOUNT_IDS[1]}:role/ecr-cleaner")
+        client.assert_not_called()
+
+        for _ in range(2):
+            session.client("sts", region_name=config.AWS_REGION).get_caller_identity()
+
+        assert [call.args for call in client.call_args_list] == [("sts",)]
+
+
+@pytest.fixture(scope="function")
+def organisation_cleaner(mocker):
+    with mock_aws():
+        cleaner = OrganisationCleaner(
+            account_ids=ACCOUNT_IDS,
+            role_name="ecr-cleaner",
+            aws_regions=[config.AWS_REGION],
+            slack_token="fake-token",
+            workers=4,
+        )
+        for key, account_cleaner in cleaner.cleaners.items():
+            mocker.patch.object(
+                account_cleaner,
+                "build_plan",
+                return_value=CleanupPlan({"mock-ecr-repo-1": [f"sha256:{key}"]}),
+            )
+        yield cleaner
+
+
+def test_accounts_share_one_worker_pool(organisation_cleaner):
+    assert set(organisation_cleaner.cleaners) == {
+        f"{account_id}:{config.AWS_REGION}" for account_id in ACCOUNT_IDS
+    }
+    for cleaner in organisation_cleaner.cleaners.values():
+        assert cleaner.executor is organisation_cleaner.executor
+
+
+def test_run_reports_per_account(organisation_cleaner, mocker, monkeypatch):
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    delete_images = {
+        key: mocker.patch.object(
+            cleaner.ecr_manager,
+            "delete_images",
+            return_value={"deleted": 1, "failed": 0, "retried": 0},
+        )
+        for key, cleaner in organisation_cleaner.cleaners.items()
+    }
+
+    assert len(organisation_cleaner.plan) == len(ACCOUNT_IDS)
+
+    summary = organisation_cleaner.run()
+
+    for key, mock_delete_images in delete_images.items():
+        mock_delete_images.assert_called_once_with(
+            repository_name="mock-ecr-repo-1",
+            images_to_delete=frozenset([f"sha256:{key}"]),
+        )
+    assert set(summary["accounts"]) == set(delete_images)
+    assert set(summary["phases"]) >= {f"account:{key}" for key in delete_images}
+    assert organisation_cleaner.executor._shutdown
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from ecr_cleaner.cleaner import CleanupPlan
+
+DIGESTS = [f"sha256:{index:064x}" for index in range(4)]
+
+
+def test_merge_and_split():
+    plans = {
+        "eu-west-2": CleanupPlan({"team/app": DIGESTS[:2], "empty": []}),
+        "us-east-1": CleanupPlan({"team/app": DIGESTS[2:]}),
+    }
+
+    merged = CleanupPlan.merge(plans)
+
+    assert list(merged) == ["eu-west-2/team/app", "us-east-1/team/app"]
+    assert merged.total_delete == 4
+    assert merged.split() == {
+        "eu-west-2": CleanupPlan({"team/app": DIGESTS[:2]}),
+        "us-east-1": CleanupPlan({"team/app": DIGESTS[2:]}),
+    }
+
+
+def test_plan_is_read_only():
+    plan = CleanupPlan({"team/app": DIGESTS})
+
+    assert plan["team/app"] == frozenset(DIGESTS)
+    assert CleanupPlan.from_json(plan.to_json()) == plan
+
+    with pytest.raises(TypeError):
+        plan.repositories["other"] = frozenset()
+
+
+def test_sizes_follow_the_plan():
+    sizes = {digest: (index + 1) * 100 for index, digest in enumerate(DIGESTS)}
+    plans = {
+        "eu-west-2": CleanupPlan({"team/app": DIGESTS[:2]}, image_sizes=sizes),
+        "us-east-1": CleanupPlan({"team/app": DIGESTS[2:3]}, image_sizes=sizes),
+    }
+
+    merged = CleanupPlan.merge(plans)
+
+    assert dict(plans["eu-west-2"].image_sizes) == {DIGESTS[0]: 100, DIGESTS[1]: 200}
+    assert merged.total_bytes == 600
+    assert merged.repository_bytes("us-east-1/team/app") == 300
+    assert merged.split()["us-east-1"].total_bytes == 300
+    assert merged.as_dict()["eu-west-2/team/app"]["totalBytes"] == 300
+    assert CleanupPlan.from_json(merged.to_json()).total_bytes == 600
+
+
+def test_prioritised_plan():
+    sizes = {digest: (index + 1) * 100 for index, digest in enumerate(DIGESTS)}
+    plan = CleanupPlan({"small": DIGESTS[:1], "large": DIGESTS[1:]}, image_sizes=sizes)
+
+    assert list(plan.prioritised()) == ["large", "small"]
+    assert plan.prioritised() == plan
+
+    # the 300 bytes image does not fit once the 400 bytes one is picked, 200 does
+    within_bytes = plan.prioritised(max_bytes=600)
+    assert within_bytes == CleanupPlan({"large": [DIGESTS[3], DIGESTS[1]]})
+    assert within_bytes.total_bytes == 600
+
+    assert plan.prioritised(max_api_calls=1) == CleanupPlan({"large": DIGESTS[1:]})
+
+
+def test_prioritised_plan_counts_batches():
+    digests = [f"sha256:{index:064x}" for index in range(250)]
+    plan = CleanupPlan(
+        {"large": digests[:150], "small": digests[150:]},
+        image_sizes=dict.fromkeys(digests, 1),
+    )
+
+    prioritised = plan.prioritised(max_api_calls=3)
+
+    assert {name: len(digests) for name, digests in prioritised.items()} == {
+        "large": 150,
+        "small": 100,
+    }
+    assert plan.prioritised(max_api_calls=2).total_delete == 150
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import json
+
+from ecr_cleaner.cleaner.prefilter import (
+    SKIP_EXCLUDED,
+    SKIP_LIFECYCLE_POLICY,
+    SKIP_NOT_INCLUDED,
+    RepositoryFilter,
+)
+
+LIFECYCLE_POLICY = json.dumps(
+    {
+        "rules": [
+            {
+                "rulePriority": 1,
+                "selection": {
+                    "tagStatus": "any",
+                    "countType": "imageCountMoreThan",
+                    "countNumber": 10,
+                },
+                "action": {"type": "expire"},
+            }
+        ]
+    }
+)
+
+
+def test_name_patterns():
+    repository_filter = RepositoryFilter(
+        include=["team-a/*", "shared-*"], exclude=["team-a/cache-*"]
+    )
+
+    assert repository_filter.skip_reason("team-a/api", None) == (None, 0)
+    assert repository_filter.skip_reason("shared-base", None) == (None, 0)
+    assert repository_filter.skip_reason("team-b/api", None) == (SKIP_NOT_INCLUDED, 0)
+    assert repository_filter.skip_reason("team-a/cache-1", None) == (SKIP_EXCLUDED, 0)
+
+
+def test_empty_filter_is_disabled():
+    assert not RepositoryFilter()
+    assert RepositoryFilter(exclude=["tmp-*"])
+    assert RepositoryFilter(skip_small=True)
+
+
+def test_count_repository_images_stops_past_the_limit(ecr_manager, ecr_data):
+    assert ecr_manager.count_repository_images("mock-ecr-repo-3", up_to=100) == len(
+        ecr_data["mock-ecr-repo-3"]["images"]
+    )
+    assert ecr_manager.count_repository_images("mock-ecr-repo-3", up_to=2) == 3
+
+
+def test_has_lifecycle_policy(ecr_manager):
+    ecr_manager.ecr_client.put_lifecycle_policy(
+        repositoryName="mock-ecr-repo-1",
+        lifecyclePolicyText=LIFECYCLE_POLICY,
+    )
+
+    assert ecr_manager.has_lifecycle_policy("mock-ecr-repo-1")
+    assert not ecr_manager.has_lifecycle_policy("mock-ecr-repo-2")
+
+
+def test_excluded_repositories_are_not_described(ecr_cleaner, mocker):
+    full_plan = ecr_cleaner.build_plan()
+    spy = mocker.spy(ecr_cleaner.ecr_manager, "iter_repository_image_pages")
+
+    ecr_cleaner.repository_filter = RepositoryFilter(exclude=["mock-ecr-repo-1"])
+    plan = ecr_cleaner.build_plan()
+
+    assert "mock-ecr-repo-1" in full_plan
+    assert "mock-ecr-repo-1" not in plan
+    assert dict(plan.items()) == {
+        name: images for name, images in full_plan.items() if name != "mock-ecr-repo-1"
+    }
+    described = [call.kwargs["repository_name"] for call in spy.call_args_list]
+    assert "mock-ecr-repo-1" not in described
+
+    items = ecr_cleaner.metrics.summary()["items"]
+    assert items["repositories_skipped"] == 1
+    assert items["repositories_skipped_excluded"] == 1
+    assert items["describe_images_calls_saved"] == 1
+
+
+def test_small_repositories_are_not_described(ecr_cleaner, ecr_data, mocker):
+    spy = mocker.spy(ecr_cleaner.ecr_manager, "iter_repository_image_pages")
+
+    # every mock repository holds fewer images than that
+    ecr_cleaner.repository_filter = RepositoryFilter(keep_min_count=50, skip_small=True)
+    plan = ecr_cleaner.build_plan()
+
+    assert not plan
+    spy.assert_not_called()
+
+    items = ecr_cleaner.metrics.summary()["items"]
+    assert items["repositories_skipped_min_count"] == len(ecr_data)
+    assert items["prefilter_api_calls"] == len(ecr_data)
+
+
+def test_lifecycle_policy_repositories_are_not_described(ecr_cleaner, ecr_data):
+    ecr_cleaner.ecr_manager.ecr_client.put_lifecycle_policy(
+        repositoryName="mock-ecr-repo-2",
+        lifecyclePolicyText=LIFECYCLE_POLICY,
+    )
+
+    ecr_cleaner.repository_filter = RepositoryFilter(skip_lifecycle_policy=True)
+    plan = ecr_cleaner.build_plan()
+
+    assert "mock-ecr-repo-2" not in plan
+    items = ecr_cleaner.metrics.summary()["items"]
+    assert items[f"repositories_skipped_{SKIP_LIFECYCLE_POLICY.replace('-', '_')}"] == 1
+    assert items["prefilter_api_calls"] == len(ecr_data)
+
+
+def test_repository_is_described_when_the_filter_fails(ecr_cleaner, mocker):
+    full_plan = ecr_cleaner.build_plan()
+    mocker.patch.object(
+        ecr_cleaner.ecr_manager,
+        "count_repository_images",
+        side_effect=Exception("throttled"),
+    )
+
+    ecr_cleaner.repository_filter = RepositoryFilter(keep_min_count=50, skip_small=True)
+
+    assert ecr_cleaner.build_plan() == full_plan
+    assert "repositories_skipped" not in ecr_cleaner.metrics.summary()["items"]
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import csv
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from ecr_cleaner.cleaner.evaluation import RepositoryEvaluation
+from ecr_cleaner.cleaner.report import (
+    CsvReportSink,
+    JsonLinesReportSink,
+    ReportSink,
+    get_report_sink,
+    report_row,
+)
+from ecr_cleaner.cleaner.retention import (
+    DELETE,
+    KEEP_AGE,
+    KEEP_IN_USE_BY_DIGEST,
+    KEEP_IN_USE_BY_TAG,
+    RetentionPolicy,
+)
+from ecr_cleaner.manager import InUseImageIndex
+
+REPOSITORY_URI = "123456789012.dkr.ecr.eu-west-2.amazonaws.com/mock-ecr-repo-1"
+NOW = datetime.now(timezone.utc)
+
+
+def mock_image(index, days_since_pushed, image_tags=None):
+    return {
+        "imageDigest": f"sha256:{index:064x}",
+        "imageTags": image_tags if image_tags is not None else [f"v{index}"],
+        "imagePushedAt": NOW - timedelta(days=days_since_pushed),
+        "imageSizeInBytes": 1024 * index,
+    }
+
+
+def test_report_rows_carry_the_decision_reason():
+    images = [
+        mock_image(1, days_since_pushed=30),
+        mock_image(2, days_since_pushed=1),
+        mock_image(3, days_since_pushed=31, image_tags=["v3", "latest"]),
+        mock_image(4, days_since_pushed=32),
+        mock_image(5, days_since_pushed=33),
+    ]
+    in_use_index = InUseImageIndex(
+        [f"{REPOSITORY_URI}:latest", f"{REPOSITORY_URI}@{images[3]['imageDigest']}"]
+    )
+    policy = RetentionPolicy(
+        keep_min_count=0, keep_images_newer_than=NOW - timedelta(days=7)
+    )
+
+    rows = {
+        image["imageDigest"]: report_row(REPOSITORY_URI, image, decision, in_use_index)
+        for image, decision in policy.evaluate(REPOSITORY_URI, images, in_use_index)
+    }
+
+    assert [
+        (row["decision"], row["reason"], row["in_use_refs"])
+        for row in (rows[image["imageDigest"]] for image in images)
+    ] == [
+        ("delete", "", []),
+        ("keep", KEEP_AGE, []),
+        ("keep", KEEP_IN_USE_BY_TAG, [f"{REPOSITORY_URI}:latest"]),
+        (
+            "keep",
+            KEEP_IN_USE_BY_DIGEST,
+            [f"{REPOSITORY_URI}@{images[3]['imageDigest']}"],
+        ),
+        ("delete", "", []),
+    ]
+    assert rows[images[0]["imageDigest"]]["image_size_bytes"] == 1024
+
+
+def test_csv_sink(tmp_path):
+    file_name = str(tmp_path / "report.csv")
+    image = mock_image(1, days_since_pushed=30, image_tags=["v1", "stable"])
+
+    with get_report_sink(file_name) as report:
+        assert isinstance(report, CsvReportSink)
+        report.write(report_row(REPOSITORY_URI, image, DELETE, InUseImageIndex()))
+
+    with open(file_name, newline="") as file:
+        rows = list(csv.DictReader(file))
+
+    assert rows == [
+        {
+            "repository_uri": REPOSITORY_URI,
+            "image_digest": image["imageDigest"],
+            "image_tags": "v1 stable",
+            "image_pushed_at": image["imagePushedAt"].isoformat(),
+            "image_size_bytes": "1024",
+            "decision": "delete",
+            "reason": "",
+            "in_use_refs": "",
+        }
+    ]
+
+
+def test_gzipped_json_lines_sink(tmp_path):
+    file_name = str(tmp_path / "report.jsonl.gz")
+    images = [mock_image(index, days_since_pushed=1) for index in range(3)]
+
+    with get_report_sink(file_name) as report:
+        assert isinstance(report, JsonLinesReportSink)
+        for image in images:
+            report.write(report_row(REPOSITORY_URI, image, KEEP_AGE, InUseImageIndex()))
+
+    with gzip.open(file_name, mode="rt") as file:
+        rows = [json.loads(line) for line in file]
+
+    assert report.rows == 3
+    assert [row["image_digest"] for row in rows] == [
+        image["imageDigest"] for image in images
+    ]
+    assert {row["reason"] for row in rows} == {KEEP_AGE}
+
+
+def test_report_sink_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        ReportSink(str(tmp_path / "report.txt"))
+
+
+def test_unsupported_report_file(tmp_path):
+    with pytest.raises(ValueError):
+        get_report_sink(str(tmp_path / "report.xml"))
+
+
+def test_cleaner_reports_every_evaluated_image(ecr_cleaner, ecr_data, tmp_path):
+    file_name = str(tmp_path / "report.jsonl")
+
+    with get_report_sink(file_name) as report:
+        ecr_cleaner.report = report
+        plan = ecr_cleaner.build_plan()
+
+    with open(file_name) as file:
+        rows = [json.loads(line) for line in file]
+
+    assert len(rows) == sum(
+        repository["totalImages"] for repository in ecr_data.values()
+    )
+    assert {
+        (row["repository_uri"].rsplit("/", 1)[-1], row["image_digest"])
+        for row in rows
+        if row["decision"] == "delete"
+    } == {
+        (repository_name, image_digest)
+        for repository_name, image_digests in plan.items()
+        for image_digest in image_digests
+    }
+
+
+def test_repository_failing_part_way_has_no_rows(ecr_cleaner, tmp_path, mocker):
+    file_name = str(tmp_path / "report.jsonl")
+    iter_pages = ecr_cleaner.ecr_manager.iter_repository_image_pages
+
+    def failing_pages(repository_name):
+        pages = iter_pages(repository_name)
+        if repository_name == "mock-ecr-repo-1":
+            # one page of images, then describe_images fails
+            yield [image for page in pages for image in page]
+            raise Exception("ThrottlingException")
+        yield from pages
+
+    mocker.patch.object(
+        ecr_cleaner.ecr_manager, "iter_repository_image_pages", new=failing_pages
+    )
+
+    with get_report_sink(file_name) as report:
+        ecr_cleaner.report = report
+        plan = ecr_cleaner.build_plan()
+
+    with open(file_name) as file:
+        rows = [json.loads(line) for line in file]
+
+    assert "mock-ecr-repo-1" not in plan
+    assert rows
+    assert not [
+        row for row in rows if row["repository_uri"].endswith("/mock-ecr-repo-1")
+    ]
+
+
+def test_rows_wait_on_disk_until_the_repository_is_scanned(tmp_path):
+    file_name = str(tmp_path / "report.jsonl")
+    in_use_index = InUseImageIndex([f"{REPOSITORY_URI}:v2"])
+    images = [
+        dict(mock_image(index, days_since_pushed=30), manifest="x" * 1024)
+        for index in range(1, 101)
+    ]
+
+    with get_report_sink(file_name) as report:
+        cleaner = SimpleNamespace(
+            retention_policy=RetentionPolicy(
+                keep_min_count=0, keep_images_newer_than=NOW - timedelta(days=7)
+            ),
+            repository_state=None,
+            report=report,
+            image_sizes={},
+        )
+        evaluation = RepositoryEvaluation(
+            cleaner, {"name": "mock-ecr-repo-1", "uri": REPOSITORY_URI}, in_use_index
+        )
+        evaluation.add(images[:50])
+        evaluation.add(images[50:])
+
+        # nothing is reported before the repository was scanned, nor kept in memory
+        assert report.rows == 0
+        assert evaluation.report_spool.tell() > 0
+
+        image_digests = evaluation.finish()
+
+        assert report.rows == len(images)
+        assert evaluation.report_spool is None
+
+    with open(file_name) as file:
+        rows = [json.loads(line) for line in file]
+
+    assert len(image_digests) == len(images) - 1
+    assert rows == [
+        report_row(REPOSITORY_URI, image, decision, in_use_index)
+        for image, decision in RetentionPolicy(
+            keep_min_count=0, keep_images_newer_than=NOW - timedelta(days=7)
+        ).evaluate(REPOSITORY_URI, images, in_use_index)
+    ]
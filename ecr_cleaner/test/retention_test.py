@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta, timezone
+
+from ecr_cleaner.cleaner.retention import RetentionPolicy
+from ecr_cleaner.manager import InUseImageIndex
+
+REPOSITORY_URI = "123456789012.dkr.ecr.eu-west-2.amazonaws.com/mock-ecr-repo-1"
+NOW = datetime.now(timezone.utc)
+
+
+def mock_image(index, days_since_pushed):
+    return {
+        "imageDigest": f"sha256:{index:064x}",
+        "imageTags": [f"v{index}"],
+        "imagePushedAt": NOW - timedelta(days=days_since_pushed),
+    }
+
+
+def test_images_to_delete_keeps_new_and_in_use_images():
+    images = [
+        mock_image(1, days_since_pushed=30),
+        mock_image(2, days_since_pushed=1),
+        mock_image(3, days_since_pushed=31),
+        mock_image(4, days_since_pushed=32),
+    ]
+    policy = RetentionPolicy(
+        keep_min_count=1, keep_images_newer_than=NOW - timedelta(days=7)
+    )
+    in_use_index = InUseImageIndex([f"{REPOSITORY_URI}:v3"])
+
+    images_to_delete = set(
+        policy.images_to_delete(REPOSITORY_URI, images, in_use_index)
+    )
+
+    # image 2 is both the newest and new enough, so the count keeps nothing else
+    assert images_to_delete == {images[0]["imageDigest"], images[3]["imageDigest"]}
+
+
+def test_images_to_delete_streams_candidates():
+    consumed = []
+
+    def image_stream():
+        for index in range(1, 1001):
+            consumed.append(index)
+            yield mock_image(index, days_since_pushed=30 + index)
+
+    policy = RetentionPolicy(
+        keep_min_count=3, keep_images_newer_than=NOW - timedelta(days=7)
+    )
+    candidates = policy.images_to_delete(
+        REPOSITORY_URI, image_stream(), InUseImageIndex()
+    )
+
+    # the first candidate is handed over before the rest of the repository is read
+    assert next(candidates) == mock_image(4, days_since_pushed=34)["imageDigest"]
+    assert len(consumed) == 4
+    assert len(list(candidates)) == 996
+
+
+def test_images_to_delete_keeps_newest_images_in_any_order():
+    images = [mock_image(index, days_since_pushed=10 + index) for index in range(50)]
+    policy = RetentionPolicy(
+        keep_min_count=3, keep_images_newer_than=NOW - timedelta(days=7)
+    )
+    expected = {image["imageDigest"] for image in images[3:]}
+
+    for _ in range(5):
+        random.shuffle(images)
+        assert (
+            set(policy.images_to_delete(REPOSITORY_URI, images, InUseImageIndex()))
+            == expected
+        )
+
+
+def test_images_to_delete_counts_protected_images_as_newest():
+    images = [mock_image(index, days_since_pushed=index) for index in range(1, 6)]
+    policy = RetentionPolicy(
+        keep_min_count=2, keep_images_newer_than=NOW - timedelta(days=2, hours=12)
+    )
+
+    images_to_delete = set(
+        policy.images_to_delete(REPOSITORY_URI, reversed(images), InUseImageIndex())
+    )
+
+    # images 1 and 2 are both newest and new enough, the count does not keep anything else
+    assert images_to_delete == {image["imageDigest"] for image in images[2:]}
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from ecr_cleaner import config
+from ecr_cleaner.cleaner import ECRCleaner, sharding
+from ecr_cleaner.cleaner.factory import create_cleaner
+from ecr_cleaner.cleaner.sharding import ShardedCleaner
+from ecr_cleaner.helper import shard_of
+from ecr_cleaner.manager import IncompleteInventoryError
+
+SHARD_COUNT = 3
+
+
+def test_shard_of_is_stable():
+    assert shard_of("mock-ecr-repo-1", SHARD_COUNT) == shard_of(
+        "mock-ecr-repo-1", SHARD_COUNT
+    )
+    assert {shard_of(f"repo-{index}", SHARD_COUNT) for index in range(100)} == set(
+        range(SHARD_COUNT)
+    )
+
+
+def test_shards_partition_the_plan(ecr_cleaner, mocker):
+    full_plan = ecr_cleaner.build_plan()
+    in_use_images = ecr_cleaner.ecs_manager.get_running_task_images()
+    get_running_task_images = mocker.spy(
+        ecr_cleaner.ecs_manager, "get_running_task_images"
+    )
+
+    ecr_cleaner.in_use_images = in_use_images
+    ecr_cleaner.shard_count = SHARD_COUNT
+    shard_plans = []
+    for shard_index in range(SHARD_COUNT):
+        ecr_cleaner.shard_index = shard_index
+        shard_plans.append(ecr_cleaner.build_plan())
+
+    get_running_task_images.assert_not_called()
+    assert sum(len(plan) for plan in shard_plans) == len(full_plan)
+    for shard_index, plan in enumerate(shard_plans):
+        for repository_name, image_digests in plan.items():
+            assert shard_of(repository_name, SHARD_COUNT) == shard_index
+            assert full_plan[repository_name] == image_digests
+
+
+@pytest.fixture(scope="function")
+def sharded_cleaner(ecr_manager, ecs_manager, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "STATE_STORE", str(tmp_path))
+
+    def shard_cleaner(aws_region, shard_index, shard_count):
+        cleaner = ECRCleaner(
+            aws_region=aws_region,
+            slack_token="fake-token",
+            shard_index=shard_index,
+            shard_count=shard_count,
+        )
+        cleaner.ecr_manager = ecr_manager
+        cleaner.ecs_manager = ecs_manager
+        return cleaner
+
+    monkeypatch.setattr(sharding, "shard_cleaner", shard_cleaner)
+
+    cleaner = ShardedCleaner(
+        aws_region=config.AWS_REGION,
+        slack_token="fake-token",
+        shard_count=SHARD_COUNT,
+        processes=False,
+    )
+    cleaner.coordinator.ecr_manager = ecr_manager
+    cleaner.coordinator.ecs_manager = ecs_manager
+    yield cleaner
+
+
+def test_sharded_run_matches_a_single_run(
+    sharded_cleaner, ecr_cleaner, ecs_manager, mocker, monkeypatch
+):
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    single_plan = ecr_cleaner.build_plan()
+    get_cluster_images = mocker.spy(ecs_manager, "get_cluster_images")
+    delete_images = mocker.patch.object(
+        sharded_cleaner.coordinator.ecr_manager,
+        "delete_images",
+        side_effect=lambda repository_name, images_to_delete: {
+            "deleted": len(images_to_delete),
+            "failed": 0,
+            "retried": 0,
+        },
+    )
+
+    assert sharded_cleaner.plan == single_plan
+    get_cluster_images.assert_called_once()
+
+    summary = sharded_cleaner.run()
+
+    assert delete_images.call_count == len(sharded_cleaner.plan)
+    assert set(summary["shards"]["plan"]) == set(range(SHARD_COUNT))
+    assert summary["items"]["repositories_scanned"] == len(
+        list(sharded_cleaner.coordinator.ecr_manager.get_all_repositories())
+    )
+
+
+def test_incomplete_inventory_fails_the_prepare_step(
+    sharded_cleaner, ecs_manager, mocker
+):
+    mocker.patch.object(ecs_manager, "get_cluster_images", return_value=({}, False))
+    plan_shard = mocker.spy(sharding, "plan_shard")
+
+    with pytest.raises(IncompleteInventoryError):
+        sharded_cleaner.plan
+
+    plan_shard.assert_not_called()
+
+
+def test_delete_step_refuses_a_plan_of_an_earlier_run(sharded_cleaner, mocker):
+    sharded_cleaner.plan
+    delete_images = mocker.patch.object(
+        sharded_cleaner.coordinator.ecr_manager, "delete_images"
+    )
+
+    # the next run got as far as the prepare step
+    sharded_cleaner.reset()
+    sharded_cleaner.prepare()
+
+    with pytest.raises(ValueError, match="earlier run"):
+        sharding.run_step("delete", config.AWS_REGION, SHARD_COUNT, shard_index=0)
+    delete_images.assert_not_called()
+
+
+def test_sharded_run_of_a_saved_plan(sharded_cleaner, ecr_cleaner, mocker, monkeypatch):
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    plan = ecr_cleaner.build_plan()
+    delete_images = mocker.patch.object(
+        sharded_cleaner.coordinator.ecr_manager,
+        "delete_images",
+        side_effect=lambda repository_name, images_to_delete: {
+            "deleted": len(images_to_delete),
+            "failed": 0,
+            "retried": 0,
+        },
+    )
+
+    sharded_cleaner.run(plan=plan)
+
+    assert delete_images.call_count == len(plan)
+    with pytest.raises(ValueError, match="prepare step"):
+        sharded_cleaner.reports.merged_plan()
+
+
+def test_notify_step_cuts_the_shard_plans_to_the_budget(
+    sharded_cleaner, mocker, monkeypatch
+):
+    monkeypatch.setattr(config, "DELETE_ENABLED", True)
+    monkeypatch.setattr(config, "SLACK_ENABLED", False)
+    full_plan = sharded_cleaner.plan
+    assert len(full_plan) > 1
+    monkeypatch.setattr(config, "DELETE_MAX_API_CALLS", 1)
+    delete_images = mocker.patch.object(
+        sharded_cleaner.coordinator.ecr_manager,
+        "delete_images",
+        side_effect=lambda repository_name, images_to_delete: {
+            "deleted": len(images_to_delete),
+            "failed": 0,
+            "retried": 0,
+        },
+    )
+
+    summary = sharding.run_step("notify", config.AWS_REGION, SHARD_COUNT)
+    for shard_index in range(SHARD_COUNT):
+        sharding.run_step("delete", config.AWS_REGION, SHARD_COUNT, shard_index)
+
+    budget_plan = full_plan.prioritised(max_api_calls=1)
+    assert summary["items"]["images_to_delete"] == budget_plan.total_delete
+    assert delete_images.call_count == 1
+    assert delete_images.call_args.kwargs == {
+        "repository_name": next(iter(budget_plan.repositories)),
+        "images_to_delete": next(iter(budget_plan.repositories.values())),
+    }
+
+
+@pytest.mark.parametrize(
+    "lambda_task_root, executor", [(None, "Process"), ("/var/task", "Thread")]
+)
+def test_sharded_cleaner_uses_threads_in_lambda(
+    monkeypatch, lambda_task_root, executor
+):
+    monkeypatch.setattr(config, "SHARD_COUNT", SHARD_COUNT)
+    if lambda_task_root is None:
+        monkeypatch.delenv("LAMBDA_TASK_ROOT", raising=False)
+    else:
+        monkeypatch.setenv("LAMBDA_TASK_ROOT", lambda_task_root)
+
+    cleaner = create_cleaner()
+
+    assert isinstance(cleaner, ShardedCleaner)
+    assert cleaner.executor_class.__name__ == f"{executor}PoolExecutor"
@@ -3,6 +3,7 @@ import logging
 
 import pytest
 from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
 
 from ecr_cleaner import config
 
@@ -26,6 +27,7 @@ def test_send_message_success(slack_notifier, mocker):
 
 
 def test_send_message_split_success(slack_notifier, mocker):
+    slack_notifier.post_interval = 0
     mock_slack_client = mocker.patch.object(
         slack_notifier.slack_client, "chat_postMessage"
     )
@@ -49,6 +51,7 @@ def test_send_message_split_success(slack_notifier, mocker):
         ],
     )
 
+    # the rest is posted as a reply in the thread of the first message
     mock_slack_client.assert_any_call(
         channel=config.SLACK_CHANNEL,
         text="Report",
@@ -61,9 +64,96 @@ def test_send_message_split_success(slack_notifier, mocker):
                 },
             }
         ],
+        thread_ts="12345.67890",
     )
 
 
+def test_send_message_splits_at_line_boundaries(slack_notifier, mocker):
+    slack_notifier.post_interval = 0
+    mock_slack_client = mocker.patch.object(
+        slack_notifier.slack_client,
+        "chat_postMessage",
+        return_value={"ts": "12345.67890"},
+    )
+    lines = [f" - team/repository-{index:04d}: {index}\n" for index in range(500)]
+
+    slack_notifier.send_message("".join(lines))
+
+    parts = [
+        call.kwargs["blocks"][0]["text"]["text"]
+        for call in mock_slack_client.call_args_list
+    ]
+    assert "".join(parts) == "".join(lines)
+    assert all(len(part) <= 4000 and part.endswith("\n") for part in parts)
+
+
+def test_send_message_retries_after_rate_limit(slack_notifier, mocker):
+    slack_notifier.post_interval = 0
+    rate_limited = SlackResponse(
+        client=None,
+        http_verb="POST",
+        api_url="https://slack.com/api/chat.postMessage",
+        req_args={},
+        data={"ok": False, "error": "ratelimited"},
+        headers={"Retry-After": "2"},
+        status_code=429,
+    )
+    mock_slack_client = mocker.patch.object(
+        slack_notifier.slack_client,
+        "chat_postMessage",
+        side_effect=[
+            SlackApiError(message="Rate limited", response=rate_limited),
+            {"ts": "12345.67890"},
+        ],
+    )
+    mock_sleep = mocker.patch("ecr_cleaner.notifier.slack_notifier.time.sleep")
+
+    slack_notifier.send_message("Hello, Slack!")
+
+    assert mock_slack_client.call_count == 2
+    mock_sleep.assert_any_call(2.0)
+    assert slack_notifier.metrics.summary()["items"]["slack_retries"] == 1
+
+
+def test_send_large_message_as_file(slack_notifier, mocker):
+    slack_notifier.upload_threshold = 100
+    mock_post = mocker.patch.object(slack_notifier.slack_client, "chat_postMessage")
+    mock_upload = mocker.patch.object(slack_notifier.slack_client, "files_upload_v2")
+    message = "*Total*: 20 images\n" + " - team/repository: 1\n" * 20
+
+    slack_notifier.send_message(message)
+
+    mock_post.assert_not_called()
+    mock_upload.assert_called_once_with(
+        channel=config.SLACK_CHANNEL,
+        content=message,
+        filename="ecr-cleaner-report.txt",
+        title="Report",
+        initial_comment="*Total*: 20 images",
+    )
+
+
+def test_send_large_message_posts_when_upload_fails(slack_notifier, mocker):
+    slack_notifier.upload_threshold = 100
+    slack_notifier.post_interval = 0
+    mock_post = mocker.patch.object(
+        slack_notifier.slack_client,
+        "chat_postMessage",
+        return_value={"ts": "12345.67890"},
+    )
+    mocker.patch.object(
+        slack_notifier.slack_client,
+        "files_upload_v2",
+        side_effect=SlackApiError(
+            message="Missing scope", response={"error": "missing_scope"}
+        ),
+    )
+
+    slack_notifier.send_message("A" * 200)
+
+    mock_post.assert_called_once()
+
+
 def test_send_message_failure(slack_notifier, caplog, mocker):
 
     mock_slack_client = mocker.patch.object(
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import boto3
+import pytest
+from moto import mock_aws
+
+from ecr_cleaner import config
+from ecr_cleaner.store import LocalFileStore, S3Store, Store, get_store
+
+
+def test_local_file_store(tmp_path):
+    store = LocalFileStore(tmp_path / "state")
+
+    assert store.load("repository-state") is None
+
+    store.save("repository-state", {"version": 1})
+    assert store.load("repository-state") == {"version": 1}
+
+    store.delete("repository-state")
+    assert store.load("repository-state") is None
+
+
+def test_s3_store():
+    with mock_aws():
+        s3_client = boto3.client("s3", region_name=config.AWS_REGION)
+        s3_client.create_bucket(
+            Bucket="mock-state-bucket",
+            CreateBucketConfiguration={"LocationConstraint": config.AWS_REGION},
+        )
+        store = S3Store(
+            "mock-state-bucket", prefix="/ecr-cleaner/", s3_client=s3_client
+        )
+
+        assert store.load("repository-state") is None
+
+        store.save("repository-state", {"version": 1})
+        assert store.load("repository-state") == {"version": 1}
+        assert s3_client.get_object(
+            Bucket="mock-state-bucket", Key="ecr-cleaner/repository-state.json"
+        )
+
+
+def test_get_store(tmp_path):
+    assert get_store(None) is None
+    assert isinstance(get_store(str(tmp_path)), LocalFileStore)
+    assert get_store(f"file://{tmp_path}").directory == str(tmp_path)
+
+    with mock_aws():
+        store = get_store("s3://mock-state-bucket/ecr-cleaner")
+        assert (store.bucket, store.prefix) == ("mock-state-bucket", "ecr-cleaner")
+
+    with pytest.raises(ValueError):
+        get_store("ftp://somewhere")
+
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        Store()
@@ -1,10 +1,61 @@
 # -*- coding: utf-8 -*-
+import logging
+import time
 
-from ecr_cleaner import config
-from ecr_cleaner.cleaner import ECRCleaner
+_import_started_at = time.perf_counter()
+
+from ecr_cleaner import config  # noqa: E402
+from ecr_cleaner.cleaner.factory import create_cleaner  # noqa: E402
+
+IMPORT_SECONDS = time.perf_counter() - _import_started_at
+
+# kept between warm invocations, with its clients, sessions and task definition cache
+cleaner = None
 
 
 def run_ecr_cleaner(event, context):
-    cleaner = ECRCleaner(aws_region=config.AWS_REGION, slack_token=config.SLACK_TOKEN)
-    cleaner.run_cleanup()
+    global cleaner
+
+    if event and "shard_step" in event:
+        # one step of a run spread over many invocations, see sharding.run_step
+        from ecr_cleaner.cleaner.sharding import run_step
+
+        run_step(
+            step=event["shard_step"],
+            aws_region=event.get("aws_region", config.AWS_REGIONS[0]),
+            shard_count=event.get("shard_count", config.SHARD_COUNT),
+            shard_index=event.get("shard_index"),
+        )
+        return {
+            "statusCode": 200,
+            "body": f"Shard step {event['shard_step']} completed.",
+        }
+
+    started_at = time.perf_counter()
+    cold_start = cleaner is None
+    if cold_start:
+        cleaner = create_cleaner()
+    else:
+        cleaner.reset()
+    init_seconds = time.perf_counter() - started_at
+
+    if cold_start:
+        init_seconds += IMPORT_SECONDS
+        cleaner.metrics.record_phase("cold_start_init", init_seconds)
+    else:
+        cleaner.metrics.record_phase("warm_start_init", init_seconds)
+    logging.info(
+        f"{'Cold' if cold_start else 'Warm'} start, initialised in {init_seconds:.3f}s"
+    )
+
+    if context is not None:
+        # stops before Lambda times out, the next invocation resumes from the checkpoint
+        cleaner.set_time_budget(context.get_remaining_time_in_millis() / 1000)
+
+    cleaner.run()
+    if not cleaner.completed:
+        return {
+            "statusCode": 200,
+            "body": "ECR cleanup checkpointed, the next invocation resumes it.",
+        }
     return {"statusCode": 200, "body": "ECR cleanup completed."}
@@ -3,7 +3,10 @@
 import csv
 
 from ecr_cleaner import config
-from ecr_cleaner.cleaner import ECRCleaner
+from ecr_cleaner.cleaner import CleanupPlan
+from ecr_cleaner.cleaner.factory import create_cleaner
+from ecr_cleaner.cleaner.catalogue import CatalogueSink
+from ecr_cleaner.cleaner.report import ReportSinks, get_report_sink
 
 
 def write_csv(headers, file_name, data):
@@ -14,19 +17,41 @@ def write_csv(headers, file_name, data):
 
 
 def cleaner_up():
-    cleaner = ECRCleaner(aws_region=config.AWS_REGION, slack_token=config.SLACK_TOKEN)
-
-    images_to_delete = cleaner.images_to_delete
-
-    to_delete = []
-
-    for ec_repo, delete_data in images_to_delete.items():
-        for image in delete_data["delete"]:
-            to_delete.append([f"{ec_repo}:{image}"])
+    cleaner = create_cleaner()
+
+    if config.CLEANUP_PLAN_INPUT:
+        plan = CleanupPlan.load(config.CLEANUP_PLAN_INPUT)
+        if plan.aws_region and plan.aws_region != cleaner.aws_region:
+            raise ValueError(
+                f"Cleanup plan is for {plan.aws_region}, not {cleaner.aws_region}"
+            )
+    else:
+        # rows are written while the repositories are scanned
+        sinks = []
+        if config.REPORT_FILE:
+            sinks.append(get_report_sink(config.REPORT_FILE))
+        if config.CATALOGUE_FILE:
+            # the age cutoffs of the what-if command are relative to the run
+            sinks.append(CatalogueSink(config.CATALOGUE_FILE, created_at=cleaner.now))
+        report = ReportSinks(sinks) if sinks else None
+        cleaner.report = report
+        try:
+            plan = cleaner.plan
+        finally:
+            if report is not None:
+                report.close()
+                cleaner.report = None
+
+    if config.CLEANUP_PLAN_OUTPUT:
+        plan.save(config.CLEANUP_PLAN_OUTPUT)
+
+    to_delete = (
+        [f"{ec_repo}:{image}"] for ec_repo, images in plan.items() for image in images
+    )
 
     write_csv(["ImagesToDelete"], "to_delete.csv", to_delete)
 
-    cleaner.run()
+    cleaner.run(plan=plan)
     return {"statusCode": 200, "body": "ECR cleanup completed."}
 
 